@@ -25,8 +25,12 @@ def get_db_engine(consumer_name: str):
 
 def get_db_url(consumer_name: str):
     # Make an instantiation of the consumer and extract the url from the
-    # consumer-specific config
+    # consumer-specific config.  A sharded catalog is migrated one shard at a time,
+    # chosen with "alembic -x shard=<shard name> ..."
     consumer = db_name_mappings[consumer_name]()
+    shard = context.get_x_argument(as_dictionary=True).get("shard")
+    if consumer_name == "catalog" and shard is not None:
+        return consumer.get_url(shard)
     return consumer.get_url()
 
 
@@ -0,0 +1,90 @@
+"""add holding_id and path_hash to file
+
+Revision ID: 30fa0ece0174
+Revises: 82701862649a
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from nlds_processors.catalog.catalog_models import path_hash
+
+# revision identifiers, used by Alembic.
+revision = "30fa0ece0174"
+down_revision = "82701862649a"
+branch_labels = None
+depends_on = None
+
+# number of files to update in each batch when back-filling
+BATCH_SIZE = 10000
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    # add the columns as nullable, they have to be back-filled before the unique
+    # constraint can be created
+    with op.batch_alter_table("file") as bop:
+        bop.add_column(sa.Column("holding_id", sa.Integer(), nullable=True))
+        bop.add_column(sa.Column("path_hash", sa.BigInteger(), nullable=True))
+
+    session = Session(bind=op.get_bind())
+    # copy the holding_id from the transaction - this can be done in SQL
+    # (transaction is a keyword in SQLite, so has to be quoted)
+    session.execute(
+        sa.text(
+            'UPDATE file SET holding_id = (SELECT "transaction".holding_id FROM '
+            '"transaction" WHERE "transaction".id = file.transaction_id)'
+        )
+    )
+    # the hash has to be calculated in Python, do it in batches to bound the memory
+    last_id = 0
+    while True:
+        rows = session.execute(
+            sa.text(
+                "SELECT id, original_path FROM file WHERE id > :last_id "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if len(rows) == 0:
+            break
+        session.execute(
+            sa.text("UPDATE file SET path_hash = :path_hash WHERE id = :id"),
+            [{"id": r.id, "path_hash": path_hash(r.original_path)} for r in rows],
+        )
+        last_id = rows[-1].id
+    session.commit()
+
+    # NOTE: this will fail if the same path occurs twice in a holding - these
+    # duplicates will need removing first
+    with op.batch_alter_table("file") as bop:
+        bop.create_foreign_key("fk_file_holding_id", "holding", ["holding_id"], ["id"])
+        bop.create_unique_constraint(
+            "uq_file_holding_path_hash", ["holding_id", "path_hash"]
+        )
+
+
+def downgrade_catalog() -> None:
+    with op.batch_alter_table("file") as bop:
+        bop.drop_constraint("uq_file_holding_path_hash", type_="unique")
+        bop.drop_constraint("fk_file_holding_id", type_="foreignkey")
+        bop.drop_column("path_hash")
+        bop.drop_column("holding_id")
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
@@ -0,0 +1,82 @@
+"""add archive_backlog table
+
+Revision ID: 920e9267b321
+Revises: 30fa0ece0174
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "920e9267b321"
+down_revision = "30fa0ece0174"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    op.create_table(
+        "archive_backlog",
+        sa.Column("file_id", sa.Integer(), nullable=False),
+        sa.Column("holding_id", sa.Integer(), nullable=False),
+        sa.Column("group", sa.String(), nullable=False),
+        sa.Column("tenancy", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=True),
+        sa.Column("ingest_time", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["file_id"], ["file.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["holding_id"], ["holding.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("file_id"),
+    )
+    op.create_index("ix_archive_backlog_holding_id", "archive_backlog", ["holding_id"])
+    op.create_index(
+        "ix_archive_backlog_tenancy_ingest_time",
+        "archive_backlog",
+        ["tenancy", "ingest_time"],
+    )
+    op.create_index(
+        "ix_archive_backlog_tenancy_group", "archive_backlog", ["tenancy", "group"]
+    )
+    # back-fill with the files that are on object storage but not on tape - this is
+    # the same query that get_next_unarchived_holding used to run
+    # (transaction and group are keywords, so have to be quoted)
+    op.execute(
+        sa.text(
+            'INSERT INTO archive_backlog (file_id, holding_id, "group", tenancy, '
+            "size, ingest_time) "
+            'SELECT file.id, "transaction".holding_id, holding."group", '
+            'location.url_netloc, file.size, "transaction".ingest_time '
+            'FROM file JOIN "transaction" ON file.transaction_id = "transaction".id '
+            'JOIN holding ON "transaction".holding_id = holding.id '
+            "JOIN location ON location.file_id = file.id "
+            "AND location.storage_type = 'OBJECT_STORAGE' "
+            "WHERE file.path_type = 'FILE' AND NOT EXISTS (SELECT 1 FROM location "
+            "AS tape WHERE tape.file_id = file.id AND tape.storage_type = 'TAPE')"
+        )
+    )
+
+
+def downgrade_catalog() -> None:
+    op.drop_index("ix_archive_backlog_tenancy_group", table_name="archive_backlog")
+    op.drop_index(
+        "ix_archive_backlog_tenancy_ingest_time", table_name="archive_backlog"
+    )
+    op.drop_index("ix_archive_backlog_holding_id", table_name="archive_backlog")
+    op.drop_table("archive_backlog")
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
@@ -0,0 +1,90 @@
+"""add usage aggregates to holding and group_usage table
+
+Revision ID: 5d1c2b7e8a43
+Revises: 920e9267b321
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5d1c2b7e8a43"
+down_revision = "920e9267b321"
+branch_labels = None
+depends_on = None
+
+USAGE_COLUMNS = ("file_count", "total_size", "object_store_size", "tape_size")
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    with op.batch_alter_table("holding") as bop:
+        for c in USAGE_COLUMNS:
+            bop.add_column(
+                sa.Column(c, sa.BigInteger(), nullable=False, server_default="0")
+            )
+        bop.add_column(sa.Column("last_ingest_time", sa.DateTime(), nullable=True))
+    op.create_table(
+        "group_usage",
+        sa.Column("group", sa.String(), nullable=False),
+        *[
+            sa.Column(c, sa.BigInteger(), nullable=False, server_default="0")
+            for c in USAGE_COLUMNS
+        ],
+        sa.Column("last_ingest_time", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("group"),
+    )
+    # back-fill - this is the same calculation as Catalog.reconcile_usage
+    # (transaction and group are keywords, so have to be quoted)
+    storage_size = (
+        "(SELECT COALESCE(SUM(file.size), 0) FROM file JOIN location ON "
+        "location.file_id = file.id WHERE file.holding_id = holding.id AND "
+        "location.storage_type = '{}')"
+    )
+    op.execute(
+        sa.text(
+            "UPDATE holding SET "
+            "file_count = (SELECT COUNT(file.id) FROM file "
+            "WHERE file.holding_id = holding.id), "
+            "total_size = (SELECT COALESCE(SUM(file.size), 0) FROM file "
+            "WHERE file.holding_id = holding.id), "
+            f"object_store_size = {storage_size.format('OBJECT_STORAGE')}, "
+            f"tape_size = {storage_size.format('TAPE')}, "
+            'last_ingest_time = (SELECT MAX("transaction".ingest_time) FROM '
+            '"transaction" WHERE "transaction".holding_id = holding.id)'
+        )
+    )
+    op.execute(
+        sa.text(
+            'INSERT INTO group_usage ("group", file_count, total_size, '
+            "object_store_size, tape_size, last_ingest_time) "
+            'SELECT "group", SUM(file_count), SUM(total_size), '
+            "SUM(object_store_size), SUM(tape_size), MAX(last_ingest_time) "
+            'FROM holding GROUP BY "group"'
+        )
+    )
+
+
+def downgrade_catalog() -> None:
+    op.drop_table("group_usage")
+    with op.batch_alter_table("holding") as bop:
+        bop.drop_column("last_ingest_time")
+        for c in reversed(USAGE_COLUMNS):
+            bop.drop_column(c)
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
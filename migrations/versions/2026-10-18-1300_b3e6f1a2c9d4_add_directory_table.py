@@ -0,0 +1,163 @@
+"""add directory table, and directory_id and basename to file, replacing
+file.original_path, and only store location.path if it is not the original path
+
+Revision ID: b3e6f1a2c9d4
+Revises: 5d1c2b7e8a43
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from nlds_processors.catalog.catalog_models import (
+    split_path,
+    parent_directory,
+    directory_ancestors,
+)
+
+# revision identifiers, used by Alembic.
+revision = "b3e6f1a2c9d4"
+down_revision = "5d1c2b7e8a43"
+branch_labels = None
+depends_on = None
+
+# number of files (or locations) to update in each batch when back-filling
+BATCH_SIZE = 10000
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    op.create_table(
+        "directory",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("parent_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["parent_id"], ["directory.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "uq_directory_path",
+        "directory",
+        ["path"],
+        unique=True,
+        postgresql_ops={"path": "text_pattern_ops"},
+    )
+    op.create_index("ix_directory_parent_id", "directory", ["parent_id"])
+    with op.batch_alter_table("file") as bop:
+        bop.add_column(sa.Column("directory_id", sa.Integer(), nullable=True))
+        bop.add_column(sa.Column("basename", sa.String(), nullable=True))
+
+    # split the original paths in batches to bound the memory, the ids of the
+    # directories created are kept as the same directories occur in many batches
+    session = Session(bind=op.get_bind())
+    directory_ids = {}
+    last_id = 0
+    while True:
+        rows = session.execute(
+            sa.text(
+                "SELECT id, original_path FROM file WHERE id > :last_id "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if len(rows) == 0:
+            break
+        updates = []
+        for r in rows:
+            directory, basename = split_path(r.original_path)
+            # create the directory and any missing parents, root first
+            for d in directory_ancestors(directory):
+                if d in directory_ids:
+                    continue
+                parent = parent_directory(d)
+                directory_ids[d] = session.execute(
+                    sa.text(
+                        "INSERT INTO directory (path, parent_id) "
+                        "VALUES (:path, :parent_id) RETURNING id"
+                    ),
+                    {"path": d, "parent_id": directory_ids.get(parent)},
+                ).scalar_one()
+            updates.append(
+                {
+                    "id": r.id,
+                    "directory_id": directory_ids[directory],
+                    "basename": basename,
+                }
+            )
+        session.execute(
+            sa.text(
+                "UPDATE file SET directory_id = :directory_id, basename = :basename "
+                "WHERE id = :id"
+            ),
+            updates,
+        )
+        last_id = rows[-1].id
+    session.commit()
+
+    # the path of a location is nearly always the original path of its file, store
+    # NULL for these rather than the path again
+    with op.batch_alter_table("location") as bop:
+        bop.alter_column("path", existing_type=sa.String(), nullable=True)
+    max_id = session.execute(sa.text("SELECT MAX(id) FROM location")).scalar() or 0
+    for last_id in range(0, max_id, BATCH_SIZE):
+        session.execute(
+            sa.text(
+                "UPDATE location SET path = NULL "
+                "WHERE id > :last_id AND id <= :last_id + :limit AND path = "
+                "(SELECT original_path FROM file WHERE file.id = location.file_id)"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        )
+        session.commit()
+
+    # the original path is the directory path + the basename, so is not stored
+    with op.batch_alter_table("file") as bop:
+        bop.alter_column("directory_id", existing_type=sa.Integer(), nullable=False)
+        bop.alter_column("basename", existing_type=sa.String(), nullable=False)
+        bop.drop_column("original_path")
+        bop.create_foreign_key(
+            "fk_file_directory_id", "directory", ["directory_id"], ["id"]
+        )
+        bop.create_index("ix_file_directory_id", ["directory_id"])
+
+
+def downgrade_catalog() -> None:
+    with op.batch_alter_table("file") as bop:
+        bop.add_column(sa.Column("original_path", sa.String(), nullable=True))
+    op.execute(
+        "UPDATE file SET original_path = "
+        "(SELECT path FROM directory WHERE directory.id = file.directory_id) "
+        "|| basename"
+    )
+    op.execute(
+        "UPDATE location SET path = "
+        "(SELECT original_path FROM file WHERE file.id = location.file_id) "
+        "WHERE path IS NULL"
+    )
+    with op.batch_alter_table("location") as bop:
+        bop.alter_column("path", existing_type=sa.String(), nullable=False)
+    with op.batch_alter_table("file") as bop:
+        bop.drop_index("ix_file_directory_id")
+        bop.drop_constraint("fk_file_directory_id", type_="foreignkey")
+        bop.drop_column("basename")
+        bop.drop_column("directory_id")
+    op.drop_index("ix_directory_parent_id", table_name="directory")
+    op.drop_index("uq_directory_path", table_name="directory")
+    op.drop_table("directory")
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
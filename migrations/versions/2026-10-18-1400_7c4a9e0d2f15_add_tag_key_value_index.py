@@ -0,0 +1,41 @@
+"""add (key, value, holding_id) index to tag
+
+Revision ID: 7c4a9e0d2f15
+Revises: b3e6f1a2c9d4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c4a9e0d2f15"
+down_revision = "b3e6f1a2c9d4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    op.create_index(
+        "ix_tag_key_value_holding_id", "tag", ["key", "value", "holding_id"]
+    )
+
+
+def downgrade_catalog() -> None:
+    op.drop_index("ix_tag_key_value_holding_id", table_name="tag")
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
@@ -0,0 +1,63 @@
+"""allow duplicate checksums
+
+Revision ID: 4f8b2d6a1c37
+Revises: 7c4a9e0d2f15
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "4f8b2d6a1c37"
+down_revision = "7c4a9e0d2f15"
+branch_labels = None
+depends_on = None
+
+# the (checksum, algorithm) unique constraint was created without a name, this
+# gives it one when the table is reflected by SQLite's batch mode
+NAMING_CONVENTION = {"uq": "uq_%(table_name)s_%(column_0_name)s_%(column_1_name)s"}
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    # identical files have the same checksum, so the checksum is unique per file
+    # rather than per algorithm.  Find the name the database gave the old constraint
+    old_name = "uq_checksum_checksum_algorithm"
+    for uq in sa.inspect(op.get_bind()).get_unique_constraints("checksum"):
+        if uq["column_names"] == ["checksum", "algorithm"] and uq["name"]:
+            old_name = uq["name"]
+    with op.batch_alter_table("checksum", naming_convention=NAMING_CONVENTION) as bop:
+        bop.drop_constraint(old_name, type_="unique")
+        bop.create_unique_constraint(
+            "uq_checksum_file_algorithm", ["file_id", "algorithm"]
+        )
+    op.create_index(
+        "ix_checksum_algorithm_checksum", "checksum", ["algorithm", "checksum"]
+    )
+
+
+def downgrade_catalog() -> None:
+    op.drop_index("ix_checksum_algorithm_checksum", table_name="checksum")
+    # NOTE: this will fail if files with identical contents have been stored
+    with op.batch_alter_table("checksum") as bop:
+        bop.drop_constraint("uq_checksum_file_algorithm", type_="unique")
+        bop.create_unique_constraint(
+            "uq_checksum_checksum_algorithm", ["checksum", "algorithm"]
+        )
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
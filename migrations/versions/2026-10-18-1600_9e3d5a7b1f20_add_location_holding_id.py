@@ -0,0 +1,56 @@
+"""add holding_id to location, as the partition key of the file and location tables
+
+Revision ID: 9e3d5a7b1f20
+Revises: 4f8b2d6a1c37
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9e3d5a7b1f20"
+down_revision = "4f8b2d6a1c37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    # the holding id is copied from the file, so that the location table can be
+    # partitioned in the same way as the file table.  The partitioning itself is
+    # done with the partition_catalog command, as it rewrites both tables
+    op.add_column("location", sa.Column("holding_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE location SET holding_id = "
+        "(SELECT file.holding_id FROM file WHERE file.id = location.file_id)"
+    )
+    with op.batch_alter_table("location") as bop:
+        bop.alter_column("holding_id", existing_type=sa.Integer(), nullable=False)
+        bop.create_foreign_key(
+            "fk_location_holding_id_holding", "holding", ["holding_id"], ["id"]
+        )
+    op.create_index("ix_location_holding_id", "location", ["holding_id"])
+
+
+def downgrade_catalog() -> None:
+    op.drop_index("ix_location_holding_id", table_name="location")
+    with op.batch_alter_table("location") as bop:
+        bop.drop_constraint("fk_location_holding_id_holding", type_="foreignkey")
+        bop.drop_column("holding_id")
+
+
+def upgrade_monitor() -> None:
+    pass
+
+
+def downgrade_monitor() -> None:
+    pass
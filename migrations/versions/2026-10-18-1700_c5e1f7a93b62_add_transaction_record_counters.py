@@ -0,0 +1,61 @@
+"""add sub record counters to transaction_record
+
+Revision ID: c5e1f7a93b62
+Revises: 9e3d5a7b1f20
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c5e1f7a93b62"
+down_revision = "9e3d5a7b1f20"
+branch_labels = None
+depends_on = None
+
+COUNTERS = ("total_count", "finished_count", "failed_count")
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    for counter in COUNTERS:
+        op.add_column(
+            "transaction_record",
+            sa.Column(counter, sa.Integer(), nullable=False, server_default="0"),
+        )
+    # count the sub records of the existing transaction records, a sub record has
+    # finished if it is COMPLETE or FAILED
+    op.execute(
+        "UPDATE transaction_record SET "
+        "total_count = (SELECT COUNT(*) FROM sub_record "
+        "WHERE sub_record.transaction_record_id = transaction_record.id), "
+        "finished_count = (SELECT COUNT(*) FROM sub_record "
+        "WHERE sub_record.transaction_record_id = transaction_record.id "
+        "AND sub_record.state IN ('COMPLETE', 'FAILED')), "
+        "failed_count = (SELECT COUNT(*) FROM sub_record "
+        "WHERE sub_record.transaction_record_id = transaction_record.id "
+        "AND sub_record.state = 'FAILED')"
+    )
+
+
+def downgrade_monitor() -> None:
+    with op.batch_alter_table("transaction_record") as bop:
+        for counter in COUNTERS:
+            bop.drop_column(counter)
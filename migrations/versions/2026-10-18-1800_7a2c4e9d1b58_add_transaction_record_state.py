@@ -0,0 +1,102 @@
+"""add the overall state to transaction_record
+
+Revision ID: 7a2c4e9d1b58
+Revises: c5e1f7a93b62
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from nlds.rabbit.consumer import State
+from nlds_processors.monitor.monitor_models import TransactionRecord
+
+# revision identifiers, used by Alembic.
+revision = "7a2c4e9d1b58"
+down_revision = "c5e1f7a93b62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    # the state enum type already exists, for sub_record.state
+    state_type = sa.Enum(State, name="state", create_type=False)
+    op.add_column("transaction_record", sa.Column("state", state_type, nullable=True))
+    op.create_index(
+        "ix_transaction_record_user_group_state_creation_time",
+        "transaction_record",
+        ["user", "group", "state", "creation_time"],
+    )
+    op.create_index(
+        "ix_sub_record_transaction_record_id_state",
+        "sub_record",
+        ["transaction_record_id", "state"],
+    )
+    # back-fill the state of the existing transaction records, from the least
+    # advanced state of their sub records, see TransactionRecord.get_state - the
+    # state is left NULL while every sub record is SEARCHING
+    conn = op.get_bind()
+    min_states = {}
+    for trec_id, state_name in conn.execute(
+        sa.text(
+            "SELECT DISTINCT transaction_record_id, state FROM sub_record "
+            "WHERE state IS NOT NULL"
+        )
+    ):
+        state = State[state_name]
+        if trec_id not in min_states or state < min_states[trec_id]:
+            min_states[trec_id] = state
+    failed = dict(
+        conn.execute(
+            sa.text("SELECT id, failed_count FROM transaction_record")
+        ).fetchall()
+    )
+    warned = {
+        row[0]
+        for row in conn.execute(
+            sa.text("SELECT DISTINCT transaction_record_id FROM warning")
+        )
+    }
+    params = [
+        {
+            "id": trec_id,
+            "state": TransactionRecord.overall_state(
+                min_state, failed.get(trec_id, 0), trec_id in warned
+            ),
+        }
+        for trec_id, min_state in min_states.items()
+    ]
+    params = [p for p in params if p["state"] is not None]
+    if params:
+        conn.execute(
+            sa.text(
+                "UPDATE transaction_record SET state = :state WHERE id = :id"
+            ).bindparams(sa.bindparam("state", type_=state_type)),
+            params,
+        )
+
+
+def downgrade_monitor() -> None:
+    op.drop_index("ix_sub_record_transaction_record_id_state", "sub_record")
+    op.drop_index(
+        "ix_transaction_record_user_group_state_creation_time", "transaction_record"
+    )
+    with op.batch_alter_table("transaction_record") as bop:
+        bop.drop_column("state")
@@ -0,0 +1,43 @@
+"""add the compressed failed files blob to sub_record
+
+Revision ID: 3d6f8a2e5c41
+Revises: 7a2c4e9d1b58
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3d6f8a2e5c41"
+down_revision = "7a2c4e9d1b58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    op.add_column(
+        "sub_record", sa.Column("failed_files_blob", sa.LargeBinary(), nullable=True)
+    )
+
+
+def downgrade_monitor() -> None:
+    with op.batch_alter_table("sub_record") as bop:
+        bop.drop_column("failed_files_blob")
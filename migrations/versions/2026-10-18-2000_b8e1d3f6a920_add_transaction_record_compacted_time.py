@@ -0,0 +1,43 @@
+"""add compacted_time to transaction_record
+
+Revision ID: b8e1d3f6a920
+Revises: 3d6f8a2e5c41
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b8e1d3f6a920"
+down_revision = "3d6f8a2e5c41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    op.add_column(
+        "transaction_record", sa.Column("compacted_time", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade_monitor() -> None:
+    with op.batch_alter_table("transaction_record") as bop:
+        bop.drop_column("compacted_time")
@@ -0,0 +1,62 @@
+"""add the holding id and label to transaction_record, and the holding_label table
+
+Revision ID: e4a7c2b9d315
+Revises: b8e1d3f6a920
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e4a7c2b9d315"
+down_revision = "b8e1d3f6a920"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    # the existing records are left with a NULL label, so that the status queries
+    # still get their labels from the catalog
+    op.add_column(
+        "transaction_record", sa.Column("holding_id", sa.Integer(), nullable=True)
+    )
+    op.add_column("transaction_record", sa.Column("label", sa.String(), nullable=True))
+    op.create_index(
+        "ix_transaction_record_group_holding_id",
+        "transaction_record",
+        ["group", "holding_id"],
+    )
+    # the labels of the relabelled holdings
+    op.create_table(
+        "holding_label",
+        sa.Column("group", sa.String(), nullable=False),
+        sa.Column("holding_id", sa.Integer(), nullable=False),
+        sa.Column("label", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("group", "holding_id"),
+    )
+
+
+def downgrade_monitor() -> None:
+    op.drop_table("holding_label")
+    op.drop_index("ix_transaction_record_group_holding_id", "transaction_record")
+    with op.batch_alter_table("transaction_record") as bop:
+        bop.drop_column("label")
+        bop.drop_column("holding_id")
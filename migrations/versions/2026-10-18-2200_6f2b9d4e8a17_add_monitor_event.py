@@ -0,0 +1,59 @@
+"""add the monitor_event table, the event log of the monitoring updates
+
+Revision ID: 6f2b9d4e8a17
+Revises: e4a7c2b9d315
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from nlds.rabbit.consumer import State
+
+# revision identifiers, used by Alembic.
+revision = "6f2b9d4e8a17"
+down_revision = "e4a7c2b9d315"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_catalog() -> None:
+    pass
+
+
+def downgrade_catalog() -> None:
+    pass
+
+
+def upgrade_monitor() -> None:
+    # the state enum type already exists, for sub_record.state
+    state_type = sa.Enum(State, name="state", create_type=False)
+    op.create_table(
+        "monitor_event",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("user", sa.String(), nullable=False),
+        sa.Column("group", sa.String(), nullable=False),
+        sa.Column("sub_id", sa.String(), nullable=False),
+        sa.Column("state", state_type, nullable=False),
+        sa.Column("warnings", sa.String(), nullable=True),
+        sa.Column("holding_id", sa.Integer(), nullable=True),
+        sa.Column("label", sa.String(), nullable=True),
+        sa.Column("failed_files", sa.LargeBinary(), nullable=True),
+        sa.Column("creation_time", sa.DateTime(), nullable=True),
+        sa.Column("failure_reason", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade_monitor() -> None:
+    op.drop_table("monitor_event")
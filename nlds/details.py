@@ -155,6 +155,9 @@ class PathDetails(BaseModel):
 
     failure_reason: Optional[str] = None
     holding_id: Optional[int] = None
+    # checksum of the file contents, and the algorithm used to calculate it
+    checksum: Optional[str] = None
+    checksum_algorithm: Optional[str] = None
 
     @property
     def path(self) -> str:
@@ -174,6 +177,8 @@ class PathDetails(BaseModel):
                 "access_time": self.access_time,
                 "failure_reason": self.failure_reason,
                 "holding_id": self.holding_id,
+                "checksum": self.checksum,
+                "checksum_algorithm": self.checksum_algorithm,
             },
             **self.locations.to_json(),
         }
@@ -196,6 +201,9 @@ class PathDetails(BaseModel):
             access_time=json_contents["file_details"]["access_time"],
             failure_reason=json_contents["file_details"]["failure_reason"],
             holding_id=json_contents["file_details"]["holding_id"],
+            # checksums are optional, and not in messages from older versions
+            checksum=json_contents["file_details"].get("checksum"),
+            checksum_algorithm=json_contents["file_details"].get("checksum_algorithm"),
             locations=locations,
         )
 
@@ -231,6 +239,12 @@ class PathDetails(BaseModel):
             pl.aggregation_id = fl.aggregation_id
             pd.locations.add(pl)
 
+        # copy the most recently stored checksum
+        if file.checksums:
+            checksum = max(file.checksums, key=lambda c: c.id)
+            pd.checksum = checksum.checksum
+            pd.checksum_algorithm = checksum.algorithm
+
         return pd
 
     @classmethod
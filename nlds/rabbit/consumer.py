@@ -522,6 +522,13 @@ class RabbitMQConsumer(ABC, RMQP):
         """
         NotImplementedError
 
+    def end_callback(self) -> None:
+        """Called after each successful callback, before the message is
+        acknowledged.  Does nothing by default - consumers that hold resources
+        between messages (e.g. a database session) can override this to release
+        them."""
+        pass
+
     def _wrapped_callback(
         self,
         ch: Channel,
@@ -549,6 +556,7 @@ class RabbitMQConsumer(ABC, RMQP):
         except Exception as e:
             raise Exception("Unhandled exception " + str(e))
         else:
+            self.end_callback()
             # NRM - changed back to acknowledge the message after processing
             self.acknowledge_message(ch, method.delivery_tag, connection)
             self.log(
@@ -64,4 +64,7 @@ OBJECT_STORAGE = "OBJECT_STORAGE"
 TAPE = "TAPE"
 LIMIT = "limit"
 DESCENDING = "descending"
+CURSOR = "cursor"
+NEXT_CURSOR = "next_cursor"
+SUMMARY = "summary"
 COMPRESS = "compress"
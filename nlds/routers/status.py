@@ -67,6 +67,8 @@ async def get(
     regex: Optional[bool] = None,
     limit: Optional[int] = None,
     descending: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    summary: Optional[bool] = None,
     stat_options: Optional[StatBody] = None,
 ):
     # create the message dictionary
@@ -157,6 +159,10 @@ async def get(
         meta_dict[MSG.LIMIT] = limit
     if descending:
         meta_dict[MSG.DESCENDING] = descending
+    if cursor:
+        meta_dict[MSG.CURSOR] = cursor
+    if summary:
+        meta_dict[MSG.SUMMARY] = summary
     # this should appear last
     if len(meta_dict) > 0:
         msg_dict[MSG.META] = meta_dict
@@ -178,8 +184,14 @@ async def get(
                 f" message response ({e})"
             )
         transaction_response = None
-        # Only continue if the response actually had any transactions in it
-        if transaction_records is not None and len(transaction_records) > 0:
+        # Only continue if the response actually had any transactions in it, and
+        # the monitor did not have all of their labels (i.e. there are records
+        # from before the monitor stored them)
+        if (
+            transaction_records is not None
+            and len(transaction_records) > 0
+            and not all(MSG.LABEL in tr for tr in transaction_records)
+        ):
             routing_key = "catalog_q_user"
             transaction_response = await rpc_publisher.call(
                 msg_dict=response_dict, routing_key=routing_key
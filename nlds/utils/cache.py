@@ -0,0 +1,68 @@
+# encoding: utf-8
+"""
+cache.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A dictionary-like cache that holds at most maxsize items, discarding the least
+    recently used item when it is full.  A maxsize of 0 disables the cache."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        # counters of the lookups made with get, so the hit rate can be reported
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Get an item from the cache, marking it as the most recently used"""
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self._items[key]
+
+    def put(self, key, value) -> None:
+        """Add an item to the cache, discarding the least recently used item if the
+        cache is full"""
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        """Remove an item from the cache, if it is in it"""
+        self._items.pop(key, None)
+
+    def invalidate_values(self, predicate) -> None:
+        """Remove all the items whose value satisfies predicate(value)"""
+        for key in [k for k, v in self._items.items() if predicate(v)]:
+            del self._items[key]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of the lookups that were found in the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
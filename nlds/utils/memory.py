@@ -0,0 +1,30 @@
+# encoding: utf-8
+"""
+memory.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import os
+import resource
+
+
+def get_rss() -> int:
+    """Return the current resident set size (RSS) of this process in bytes.
+    This is read from /proc/self/statm on Linux.  On other platforms the peak RSS,
+    from getrusage, is returned instead - this cannot go down, but it will still
+    show whether the memory footprint is growing."""
+    try:
+        with open("/proc/self/statm") as fh:
+            rss_pages = int(fh.read().split()[1])
+        return rss_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux, and bytes on macOS
+        if os.uname().sysname == "Darwin":
+            return maxrss
+        return maxrss * 1024
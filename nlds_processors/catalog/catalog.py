@@ -9,9 +9,12 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
+from typing import NamedTuple
+
 # SQLalchemy imports
-from sqlalchemy import func, Enum
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, Enum, select, delete, insert, update, exists, and_, or_
+from sqlalchemy import event, intersect, values, column, bindparam, cast
+from sqlalchemy.orm import joinedload, selectinload, aliased
 from sqlalchemy.exc import (
     IntegrityError,
     OperationalError,
@@ -30,22 +33,179 @@ from nlds_processors.catalog.catalog_models import (
     Aggregation,
     Storage,
     Tag,
+    ArchiveBacklog,
+    GroupUsage,
+    Directory,
+    Checksum,
+    path_hash,
+    split_path,
+    parent_directory,
+    directory_ancestors,
 )
-from nlds_processors.db_mixin import DBMixin
+from nlds_processors.db_mixin import DBMixin, DBError
 from nlds_processors.catalog.catalog_error import CatalogError
 from nlds.details import PathType, PathDetails
+from nlds.utils.cache import LRUCache
+
+
+class HoldingIdentity(NamedTuple):
+    """The identity of a holding (and, optionally, one of its transactions) as kept
+    in the Catalog's identity cache."""
+
+    holding_id: int
+    label: str
+    user: str
+    group: str
+    transaction_pk: int = None
 
 
 class Catalog(DBMixin):
     """Catalog object containing methods to manipulate the Catalog Database"""
 
-    def __init__(self, db_engine: str, db_options: str):
-        """Store the catalog engine from the config strings passed in"""
+    # the policies for choosing the next holding to archive
+    ARCHIVE_POLICIES = ("random", "oldest", "largest", "round_robin")
+    # maximum number of ids in each IN list, when updating the archive backlog or
+    # the usage aggregates
+    IN_CHUNK_SIZE = 1000
+    # the usage aggregates stored for each Holding and in GroupUsage
+    USAGE_FIELDS = ("file_count", "total_size", "object_store_size", "tape_size")
+    # which usage aggregate each storage type contributes to
+    STORAGE_USAGE_FIELDS = {
+        Storage.OBJECT_STORAGE: "object_store_size",
+        Storage.TAPE: "tape_size",
+    }
+
+    def __init__(
+        self,
+        db_engine: str,
+        db_options: str,
+        db_read_options: str = None,
+        identity_cache_size: int = 0,
+    ):
+        """Store the catalog engine from the config strings passed in.
+        db_read_options are optional and, if supplied, create a separate engine (e.g.
+        on a read replica) for the read-only queries.
+        identity_cache_size is the number of holding / transaction identities that
+        are cached by cache_identity (0 disables the cache)."""
         self.db_engine = None
+        self.db_read_engine = None
         self.db_engine_str = db_engine
         self.db_options = db_options
+        self.db_read_options = db_read_options
         self.base = CatalogBase
         self.session = None
+        # ids of the Files whose Locations have changed, and so whose membership of
+        # the archive backlog has to be updated on the next commit
+        self.archive_backlog_dirty = set()
+        # changes to the usage aggregates, keyed on (holding_id, group), that will
+        # be applied on the next commit
+        self.usage_deltas = {}
+        # cache of HoldingIdentity, keyed on ("transaction", transaction_id) and
+        # ("label", user, group, label), and the keys that were added to it in the
+        # current database transaction
+        self.identity_cache = LRUCache(identity_cache_size)
+        self.identity_cache_pending = set()
+
+    def start_session(self):
+        """Create a SQL alchemy session"""
+        super().start_session()
+        # the pending usage changes are only valid for the database transaction they
+        # were made in, so discard them if it is rolled back
+        event.listen(self.session, "after_rollback", self._discard_usage_deltas)
+        # as are the identities of any holdings or transactions created in it
+        event.listen(self.session, "after_rollback", self._discard_pending_identities)
+
+    def _discard_usage_deltas(self, session):
+        self.usage_deltas.clear()
+
+    def _discard_pending_identities(self, session):
+        for key in self.identity_cache_pending:
+            self.identity_cache.invalidate(key)
+        self.identity_cache_pending.clear()
+
+    def cache_identity(self, holding: Holding, transaction: Transaction = None):
+        """Add the identity of a holding, and optionally one of its transactions, to
+        the identity cache.  The identity is only kept if the current database
+        transaction is committed."""
+        if transaction is not None:
+            identity = HoldingIdentity(
+                holding.id, holding.label, holding.user, holding.group, transaction.id
+            )
+            key = ("transaction", transaction.transaction_id)
+            self.identity_cache.put(key, identity)
+            self.identity_cache_pending.add(key)
+        key = ("label", holding.user, holding.group, holding.label)
+        self.identity_cache.put(
+            key, HoldingIdentity(holding.id, holding.label, holding.user, holding.group)
+        )
+        self.identity_cache_pending.add(key)
+
+    def invalidate_identity(self, holding_ids: list[int]) -> None:
+        """Remove the identities of the holdings, and their transactions, from the
+        identity cache, e.g. after the holdings are modified or deleted."""
+        holding_ids = set(holding_ids)
+        if holding_ids:
+            self.identity_cache.invalidate_values(
+                lambda identity: identity.holding_id in holding_ids
+            )
+
+    def get_cached_holding(
+        self,
+        user: str,
+        group: str,
+        label: str = None,
+        transaction_id: str = None,
+    ) -> tuple[Holding, Transaction]:
+        """Get a holding, and its transaction if transaction_id is given, using the
+        identity cache to load them by primary key rather than searching for them.
+        Returns (None, None) if the identity is not cached, or if the cached identity
+        no longer matches the database, in which case the caller should fall back to
+        get_holding."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if transaction_id is not None:
+            key = ("transaction", transaction_id)
+        else:
+            key = ("label", user, group, label)
+        identity = self.identity_cache.get(key)
+        if identity is None or not self._user_has_get_holding_permission(
+            user, group, identity
+        ):
+            return None, None
+        if transaction_id is not None:
+            result = (
+                self.session.query(Holding, Transaction)
+                .filter(
+                    Transaction.id == identity.transaction_pk,
+                    Holding.id == identity.holding_id,
+                    Transaction.holding_id == Holding.id,
+                )
+                .one_or_none()
+            )
+            holding, transaction = result if result else (None, None)
+        else:
+            holding = self.session.get(Holding, identity.holding_id)
+            transaction = None
+        # the holding may have been deleted or relabelled by another worker
+        if holding is None or (
+            holding.label,
+            holding.user,
+            holding.group,
+        ) != (identity.label, identity.user, identity.group):
+            self.identity_cache.invalidate(key)
+            return None, None
+        return holding, transaction
+
+    def _add_usage(self, holding_id: int, group: str, ingested=False, **deltas):
+        """Record a change to the usage aggregates of a holding (and its group), to
+        be applied on the next commit.  deltas are keyed on the USAGE_FIELDS."""
+        usage = self.usage_deltas.setdefault(
+            (holding_id, group), dict.fromkeys(self.USAGE_FIELDS, 0)
+        )
+        for k, v in deltas.items():
+            usage[k] += v or 0
+        if ingested:
+            usage["ingested"] = True
 
     @staticmethod
     def _user_has_get_holding_permission(
@@ -189,16 +349,16 @@ class Catalog(DBMixin):
             holding_q = holding_q.options(joinedload(Holding.tags))
             # filter the query on any tags
             if tag:
-                # get the holdings that have a key that matches one or more of
-                # the keys in the tag dictionary passed as a parameter
-                holding_q = holding_q.join(Tag).filter(Tag.key.in_(tag.keys()))
-                # check for zero
-                if holding_q.count() != 0:
-                    # we have now got a subset of holdings with a tag that has
-                    # a key that matches the keys in the input dictionary
-                    # now find the holdings where the key and value match
-                    for key, item in tag.items():
-                        holding_q = holding_q.filter(Tag.key == key, Tag.value == item)
+                # the holding has to have every key:value in the tag dictionary -
+                # intersect the holding ids for each key:value, each of which is a
+                # range scan of the (key, value, holding_id) index
+                tag_holding_ids = intersect(
+                    *[
+                        select(Tag.holding_id).where(Tag.key == key, Tag.value == item)
+                        for key, item in tag.items()
+                    ]
+                )
+                holding_q = holding_q.filter(Holding.id.in_(tag_holding_ids))
 
             # Get the holdings, up to the limit if set
             holding_q = holding_q.join(Transaction)
@@ -333,6 +493,7 @@ class Catalog(DBMixin):
                 )
             try:
                 holding.label = new_label
+                self.invalidate_identity([holding.id])
             except IntegrityError:
                 raise CatalogError(
                     f"Cannot change holding with label:{holding.label} and "
@@ -360,6 +521,55 @@ class Catalog(DBMixin):
                     self.delete_tag(holding, k)
         return holding
 
+    def get_transaction_holding_ids(self, transaction_ids: list[str]) -> dict:
+        """Get the ids of the holdings that many transactions belong to, in one query
+        (for each chunk of transaction ids).  Returns a dictionary of
+        {transaction_id: holding_id}, transactions that are not in the catalog are
+        missing from it.  A transaction never moves to another holding, so the
+        result can be cached."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        transaction_ids = list(transaction_ids)
+        holding_ids = {}
+        try:
+            for c in range(0, len(transaction_ids), self.IN_CHUNK_SIZE):
+                holding_ids.update(
+                    self.session.execute(
+                        select(
+                            Transaction.transaction_id, Transaction.holding_id
+                        ).where(
+                            Transaction.transaction_id.in_(
+                                transaction_ids[c : c + self.IN_CHUNK_SIZE]
+                            )
+                        )
+                    ).all()
+                )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(f"Couldn't get the holdings of transactions: {e}")
+        return holding_ids
+
+    def get_holding_labels(self, user: str, group: str, holding_ids: list[int]) -> dict:
+        """Get the labels of many holdings, by id, in one query (for each chunk of
+        holding ids).  Returns a dictionary of {holding_id: label}, holdings that are
+        not in the catalog, or that the user does not have permission to view, are
+        missing from it."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        holding_ids = list(holding_ids)
+        labels = {}
+        try:
+            for c in range(0, len(holding_ids), self.IN_CHUNK_SIZE):
+                label_q = select(Holding.id, Holding.label).where(
+                    Holding.id.in_(holding_ids[c : c + self.IN_CHUNK_SIZE])
+                )
+                # same permissions as _user_has_get_holding_permission
+                if user != "**all**" and group != "**all**":
+                    label_q = label_q.where(Holding.group == group)
+                labels.update(self.session.execute(label_q).all())
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(f"Couldn't get the labels of holdings: {e}")
+        return labels
+
     def get_transaction(
         self,
         id: int = None,
@@ -460,25 +670,6 @@ class Catalog(DBMixin):
 
         return permitted
 
-    def _filelist_exists_in_holding(
-        self,
-        holding_id: int,
-        filelist: list[PathDetails],
-    ) -> list:
-        """Determine whether any of the files in PathDetails already exist in any
-        of the Transactions in the Holding."""
-        transactions = self.session.query(Transaction.id, File).filter(
-            Transaction.holding_id == holding_id
-        )
-        filelist2 = [f.original_path for f in filelist]
-        # this is an explicit join, just for my understanding
-        files_q = transactions.join(File, File.transaction_id == Transaction.id).where(
-            File.original_path.in_(filelist2)
-        )
-        # files here are FileModels.  Convert to PathDetails, as the input was
-        files = [PathDetails.from_filemodel(f[1]) for f in files_q]
-        return files
-
     def get_file(
         self,
         holding_id: int,
@@ -498,7 +689,12 @@ class Catalog(DBMixin):
                     Transaction.holding_id == holding_id,
                 )
                 .join(File)
-                .filter(File.original_path == original_path)
+                .filter(
+                    File.holding_id == holding_id,
+                    File.path_hash == path_hash(original_path),
+                    # guard against hash collisions
+                    File.original_path == original_path,
+                )
             )
             # if we're going to update the file then use with_for_update
             if with_for_update:
@@ -540,7 +736,10 @@ class Catalog(DBMixin):
                     Transaction.transaction_id == transaction_id,
                 )
                 .join(File)
-                .filter(File.original_path.in_(filelist2))
+                .filter(
+                    File.path_hash.in_([path_hash(p) for p in filelist2]),
+                    File.original_path.in_(filelist2),
+                )
             )
             # if we're going to update the file then use with_for_update
             if with_for_update:
@@ -592,24 +791,45 @@ class Catalog(DBMixin):
         # (permissions have been checked by get_holdings called above)
         try:
             # build the file query bit by bit
+            # File.holding_id is filtered on directly, as well as through the join,
+            # so that PostgreSQL only scans the partitions of the file table that
+            # can contain the holdings
             file_q = self.session.query(File, Transaction, Holding).filter(
                 Holding.id.in_(holding_ids),
+                File.holding_id.in_(holding_ids),
                 File.transaction_id == Transaction.id,
                 Transaction.holding_id == Holding.id,
             )
-            # load in the Locations with the File to speed up the queries a lot
+            # load in the Locations with the File to speed up the queries a lot, and
+            # the Checksums in one more query
             file_q = file_q.options(joinedload(File.locations))
+            file_q = file_q.options(selectinload(File.checksums))
 
             if descending:
                 file_q = file_q.order_by(Transaction.ingest_time.desc())
             else:
                 file_q = file_q.order_by(Transaction.ingest_time)
 
-            if regex or search_path == ".*":
+            if search_path == ".*":
+                # every path matches
+                pass
+            elif regex:
                 # will throw an exception here for bad regex
-                file_q = file_q.filter(File.original_path.regexp_match(search_path))
+                file_q = file_q.filter(
+                    or_(*[File.original_path.regexp_match(p) for p in search_path])
+                )
+                # if every match has to be in a directory then only search the files
+                # in that directory's subtree, rather than matching every path
+                if len(search_path) == 1:
+                    directory = self._regex_directory(search_path[0])
+                    if directory is not None:
+                        file_q = file_q.filter(self._in_subtree(directory))
             else:
-                file_q = file_q.filter(File.original_path.in_(search_path))
+                # the path hash is indexed, the original path is not stored
+                file_q = file_q.filter(
+                    File.path_hash.in_([path_hash(p) for p in search_path]),
+                    File.original_path.in_(search_path),
+                )
 
             if file_q.count() == 0:
                 result = None
@@ -631,6 +851,98 @@ class Catalog(DBMixin):
 
         return result
 
+    def get_directory_ids(self, directories: list[str]) -> dict[str, int]:
+        """Get the ids of a list of directory paths, creating the Directory, and any
+        missing parent Directories, if they do not already exist.  Returns a
+        dictionary of {path: id}, which also contains the parent directories."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        # all the directories and their parents, ordered by depth so that a parent
+        # is always created before its children
+        depth = {}
+        for d in directories:
+            for i, a in enumerate(directory_ancestors(d)):
+                depth[a] = i
+        paths = sorted(depth, key=depth.get)
+        directory_ids = {}
+        try:
+            for c in range(0, len(paths), self.IN_CHUNK_SIZE):
+                chunk = paths[c : c + self.IN_CHUNK_SIZE]
+                directory_ids.update(
+                    self.session.execute(
+                        select(Directory.path, Directory.id).where(
+                            Directory.path.in_(chunk)
+                        )
+                    ).all()
+                )
+            missing = [p for p in paths if p not in directory_ids]
+            # create the missing directories, one level at a time
+            while len(missing) > 0:
+                level = [p for p in missing if depth[p] == depth[missing[0]]]
+                missing = missing[len(level) :]
+                rows = []
+                for p in level:
+                    parent = parent_directory(p)
+                    rows.append({"path": p, "parent_id": directory_ids.get(parent)})
+                directory_ids.update(
+                    self.bulk_insert_ignore_conflicts(
+                        Directory,
+                        rows,
+                        index_elements=["path"],
+                        returning=["path", "id"],
+                    )
+                )
+                # directories not returned were created by another transaction since
+                # the select above
+                created_elsewhere = [p for p in level if p not in directory_ids]
+                if len(created_elsewhere) > 0:
+                    directory_ids.update(
+                        self.session.execute(
+                            select(Directory.path, Directory.id).where(
+                                Directory.path.in_(created_elsewhere)
+                            )
+                        ).all()
+                    )
+        except (IntegrityError, OperationalError, DBError) as e:
+            raise CatalogError(
+                f"Directories could not be added to the catalog, reason: {e}"
+            )
+        return directory_ids
+
+    @staticmethod
+    def _regex_directory(pattern: str) -> str:
+        """Get the directory that every path matching a regex must be under, from
+        the literal prefix of a regex anchored at the start (e.g. "^/x/y/.*\\.nc$"
+        -> "/x/y/").  Returns None if the regex is not anchored, or could match in any
+        directory."""
+        if not pattern.startswith("^") or "|" in pattern:
+            return None
+        prefix = []
+        for c in pattern[1:]:
+            if c in ".^$*+?{}[]()\\":
+                # a quantifier makes the previous character optional
+                if c in "*+?{" and len(prefix) > 0:
+                    prefix.pop()
+                break
+            prefix.append(c)
+        directory, _ = split_path("".join(prefix))
+        if directory in ("", "/"):
+            return None
+        return directory
+
+    @staticmethod
+    def _in_subtree(directory: str):
+        """Get the filter for Files that are in a directory, or any of its
+        subdirectories.  This is a prefix search on the materialised path of the
+        Directory, which uses the index on the path."""
+        prefix = directory.rstrip("/") + "/"
+        subtree = select(Directory.id).where(
+            Directory.path.startswith(prefix, autoescape=True),
+            # LIKE is case-insensitive in some databases (e.g. SQLite)
+            func.substr(Directory.path, 1, len(prefix)) == prefix,
+        )
+        return File.directory_id.in_(subtree)
+
     def create_file(
         self,
         transaction: Transaction,
@@ -641,14 +953,23 @@ class Catalog(DBMixin):
         link_path: str = None,
         size: str = None,
         file_permissions: str = None,
+        directory_ids: dict[str, int] = None,
     ) -> None:
-        """Create a file that belongs to a transaction and will contain locations"""
+        """Create a file that belongs to a transaction and will contain locations.
+        When creating many files, get the ids of all of their directories with one
+        call to get_directory_ids, and pass them in directory_ids."""
         if self.session is None:
             raise RuntimeError("self.session is None")
+        directory, basename = split_path(original_path)
+        if directory_ids is None or directory not in directory_ids:
+            directory_ids = self.get_directory_ids([directory])
         try:
             file = File(
                 transaction_id=transaction.id,
-                original_path=original_path,
+                holding_id=transaction.holding_id,
+                path_hash=path_hash(original_path),
+                directory_id=directory_ids[directory],
+                basename=basename,
                 path_type=path_type,
                 link_path=link_path,
                 size=int(size),
@@ -663,6 +984,72 @@ class Catalog(DBMixin):
             )
         return file
 
+    def create_files(
+        self,
+        transaction: Transaction,
+        filelist: list[PathDetails],
+    ) -> dict[int, int]:
+        """Create many files that belong to a transaction in a single bulk insert,
+        without creating the intermediate File objects.  Files whose original path
+        already exists in the transaction's holding are skipped by the database, via
+        the unique (holding_id, path_hash) constraint.  Returns a dictionary of
+        {path_hash: id} for the files that were created - any file in filelist whose
+        path_hash is not in the dictionary already existed."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        split_paths = [split_path(pd.original_path) for pd in filelist]
+        directory_ids = self.get_directory_ids(set(d for d, _ in split_paths))
+        rows = [
+            {
+                "transaction_id": transaction.id,
+                "holding_id": transaction.holding_id,
+                "path_hash": path_hash(pd.original_path),
+                "directory_id": directory_ids[directory],
+                "basename": basename,
+                "path_type": pd.path_type,
+                "link_path": pd.link_path,
+                "size": int(pd.size),
+                "user": pd.user,
+                "group": pd.group,
+                "file_permissions": pd.permissions,
+            }
+            for pd, (directory, basename) in zip(filelist, split_paths)
+        ]
+        try:
+            created = self.bulk_insert_ignore_conflicts(
+                File,
+                rows,
+                index_elements=["holding_id", "path_hash"],
+                returning=["path_hash", "id"],
+            )
+        except DBError as e:
+            raise CatalogError(
+                f"Files in transaction {transaction.transaction_id} could not be added "
+                f"to the database, reason: {e.message}"
+            )
+        created = {r.path_hash: r.id for r in created}
+        # store the checksums of the created files, if the indexer calculated them
+        checksums = [
+            {
+                "file_id": created[row["path_hash"]],
+                "checksum": pd.checksum,
+                "algorithm": pd.checksum_algorithm,
+            }
+            for pd, row in zip(filelist, rows)
+            if pd.checksum and row["path_hash"] in created
+        ]
+        if checksums:
+            self.session.execute(insert(Checksum), checksums)
+        holding = self.session.get(Holding, transaction.holding_id)
+        self._add_usage(
+            holding.id,
+            holding.group,
+            ingested=True,
+            file_count=len(created),
+            total_size=sum(r["size"] for r in rows if r["path_hash"] in created),
+        )
+        return created
+
     def delete_files(
         self,
         user: str,
@@ -672,14 +1059,17 @@ class Catalog(DBMixin):
         transaction_id: str = None,
         path: str = None,
         tag: dict = None,
-    ) -> list:
-        """Delete a given path from the catalog. If a holding is specified only
-        the matching file from that holding will be deleted, otherwise all
-        matching files will. Utilises get_files().
-
+        filelist: list[PathDetails] = None,
+    ) -> list[str]:
+        """Delete a given path, or list of paths, from the catalog. If a holding is
+        specified only the matching files from that holding will be deleted, otherwise
+        all matching files will. Utilises get_files() and then remove_files().
+        Returns the original paths of the files that were deleted.
         """
         if self.session is None:
             raise RuntimeError("self.session is None")
+        if filelist is None and path is not None:
+            filelist = [PathDetails(original_path=path)]
 
         files = self.get_files(
             user,
@@ -687,25 +1077,201 @@ class Catalog(DBMixin):
             holding_label=holding_label,
             holding_id=holding_id,
             transaction_id=transaction_id,
-            original_path=path,
+            filelist=filelist,
             tag=tag,
         )
-        # checkpoint = self.session.begin_nested()
+        if files is None:
+            raise CatalogError(
+                f"File with original_path:{path} could not be found in the catalog"
+            )
+        # only the ids and paths are needed, not the ORM objects
+        files = files.with_entities(File.id, File.original_path).all()
+        self.remove_files([f.id for f in files])
+        return [f.original_path for f in files]
+
+    def remove_files(self, file_ids: list[int]) -> None:
+        """Delete Files, and their Locations and Checksums, by id, with one DELETE
+        ... WHERE id IN per table (for each chunk of ids).  Any Transactions and
+        Holdings left without Files are deleted too, and the usage aggregates are
+        updated."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        file_ids = list(file_ids)
+        transaction_ids = set()
+        holding_ids = set()
         try:
-            for file_record in files:
-                f = file_record["File"]
-                transaction = file_record["Transaction"]
-                holding = file_record["Holding"]
-                self.session.delete(f)
-                if len(transaction.files) == 0:
-                    self.session.delete(transaction)
-                if len(holding.transactions) == 0:
-                    self.session.delete(holding)
-        except (IntegrityError, KeyError, OperationalError):
-            err_msg = (
-                f"File with original_path:{path} could not be deleted from the catalog"
+            for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                # remove the files and their locations from the usage aggregates
+                usage = self.session.execute(
+                    select(
+                        File.holding_id,
+                        Holding.group,
+                        func.count(File.id),
+                        func.sum(File.size),
+                    )
+                    .join(Holding, File.holding_id == Holding.id)
+                    .where(File.id.in_(chunk))
+                    .group_by(File.holding_id, Holding.group)
+                ).all()
+                for h_id, h_group, count, size in usage:
+                    self._add_usage(
+                        h_id, h_group, file_count=-count, total_size=-(size or 0)
+                    )
+                for storage_type in self.STORAGE_USAGE_FIELDS:
+                    self._add_location_usage(storage_type, chunk, sign=-1)
+                transaction_ids.update(
+                    self.session.execute(
+                        select(File.transaction_id).where(File.id.in_(chunk)).distinct()
+                    ).scalars()
+                )
+                for model in (Location, Checksum, ArchiveBacklog):
+                    self.session.execute(
+                        delete(model)
+                        .where(model.file_id.in_(chunk))
+                        .execution_options(synchronize_session=False)
+                    )
+                self.session.execute(
+                    delete(File)
+                    .where(File.id.in_(chunk))
+                    .execution_options(synchronize_session=False)
+                )
+
+            # delete the emptied transactions, and then the emptied holdings
+            transaction_ids = list(transaction_ids)
+            for c in range(0, len(transaction_ids), self.IN_CHUNK_SIZE):
+                chunk = transaction_ids[c : c + self.IN_CHUNK_SIZE]
+                holding_ids.update(
+                    self.session.execute(
+                        delete(Transaction)
+                        .where(
+                            Transaction.id.in_(chunk),
+                            ~exists().where(File.transaction_id == Transaction.id),
+                        )
+                        .returning(Transaction.holding_id)
+                        .execution_options(synchronize_session=False)
+                    ).scalars()
+                )
+            holding_ids = list(holding_ids)
+            # the holdings with deleted transactions may be deleted themselves
+            self.invalidate_identity(holding_ids)
+            for c in range(0, len(holding_ids), self.IN_CHUNK_SIZE):
+                chunk = (
+                    self.session.execute(
+                        select(Holding.id).where(
+                            Holding.id.in_(holding_ids[c : c + self.IN_CHUNK_SIZE]),
+                            ~exists().where(Transaction.holding_id == Holding.id),
+                        )
+                    )
+                    .scalars()
+                    .all()
+                )
+                for model in (Tag, ArchiveBacklog):
+                    self.session.execute(
+                        delete(model)
+                        .where(model.holding_id.in_(chunk))
+                        .execution_options(synchronize_session=False)
+                    )
+                self.session.execute(
+                    delete(Holding)
+                    .where(Holding.id.in_(chunk))
+                    .execution_options(synchronize_session=False)
+                )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(
+                f"{len(file_ids)} files could not be deleted from the catalog, "
+                f"reason: {e}"
             )
-            raise CatalogError(err_msg)
+
+    def create_checksums(self, checksums: list[dict]) -> None:
+        """Store the checksums of many files in one statement.  Each checksum is a
+        dictionary of {file_id, checksum, algorithm}, and replaces any checksum the
+        file already has for the algorithm."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if not checksums:
+            return
+        stmt = self.upsert_insert(Checksum).values(checksums)
+        try:
+            self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["file_id", "algorithm"],
+                    set_={"checksum": stmt.excluded.checksum},
+                )
+            )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(f"Checksums could not be stored, reason: {e}")
+
+    def find_duplicate_objects(
+        self, group: str, tenancy: str, filelist: list[PathDetails]
+    ) -> dict:
+        """Find objects, already uploaded to the tenancy by the group, that have the
+        same size and checksum as the files in filelist, using the (algorithm,
+        checksum) index on Checksum.  Files in filelist without a checksum are
+        ignored.  Returns a dictionary of {original_path: (url_scheme, url_netloc,
+        root, path)} for the files that have a duplicate."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        by_checksum = {}
+        for pd in filelist:
+            if pd.checksum:
+                by_checksum.setdefault(pd.checksum_algorithm, set()).add(pd.checksum)
+        objects = {}
+        for algorithm, checksums in by_checksum.items():
+            checksums = list(checksums)
+            for c in range(0, len(checksums), self.IN_CHUNK_SIZE):
+                rows = self.session.execute(
+                    select(
+                        Checksum.checksum,
+                        File.size,
+                        Location.url_scheme,
+                        Location.url_netloc,
+                        Location.root,
+                        Location.path,
+                    )
+                    .join(File, Checksum.file_id == File.id)
+                    .join(Holding, File.holding_id == Holding.id)
+                    .join(Location, Location.file_id == File.id)
+                    .where(
+                        Checksum.algorithm == algorithm,
+                        Checksum.checksum.in_(checksums[c : c + self.IN_CHUNK_SIZE]),
+                        Holding.group == group,
+                        Location.storage_type == Storage.OBJECT_STORAGE,
+                        Location.url_netloc == tenancy,
+                        # empty locations are files that have not been uploaded yet
+                        Location.root != "",
+                    )
+                ).all()
+                for r in rows:
+                    objects.setdefault((algorithm, r.checksum, r.size), tuple(r[2:]))
+        duplicates = {}
+        for pd in filelist:
+            obj = objects.get((pd.checksum_algorithm, pd.checksum, pd.size))
+            if pd.checksum and obj is not None:
+                duplicates[pd.original_path] = obj
+        return duplicates
+
+    def get_file_ids(self, holding_id: int, original_paths: list[str]) -> dict:
+        """Get the ids of the Files in a holding, given their original paths, using
+        the unique (holding_id, path_hash) index.  Returns a dictionary of
+        {original_path: id}, paths that are not in the holding are missing from it."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        hashes = [path_hash(p) for p in original_paths]
+        paths = set(original_paths)
+        file_ids = {}
+        for c in range(0, len(hashes), self.IN_CHUNK_SIZE):
+            rows = self.session.execute(
+                select(File.original_path, File.id).where(
+                    File.holding_id == holding_id,
+                    File.path_hash.in_(hashes[c : c + self.IN_CHUNK_SIZE]),
+                )
+            ).all()
+            # guard against hash collisions
+            file_ids.update(
+                (r.original_path, r.id) for r in rows if r.original_path in paths
+            )
+        return file_ids
 
     def get_location(
         self,
@@ -756,11 +1322,13 @@ class Catalog(DBMixin):
                 url_scheme=url_scheme,
                 url_netloc=url_netloc,
                 root=root,
-                path=path,
+                stored_path=Location.path_to_store(file_, path),
                 access_time=access_time,
                 file_id=file_.id,
                 aggregation_id=aggregation_id,
+                holding_id=file_.holding_id,
             )
+            self.archive_backlog_dirty.add(file_.id)
         except (IntegrityError, KeyError):
             raise CatalogError(
                 f"Location with root {root}, path {file_.original_path} and "
@@ -778,22 +1346,219 @@ class Catalog(DBMixin):
         path: str,
         access_time: float,
         aggregation_id: Aggregation = None,
+        storage_type: Enum = None,
     ):
         # Modify the location to update it
         # otherwise update if exists and not empty
         # rec
+        file_ = self.session.get(File, location.file_id)
+        if storage_type is not None and storage_type != location.storage_type:
+            # move the size of the file to the usage aggregate of the new storage
+            # type
+            holding = self.session.get(Holding, location.holding_id)
+            size = file_.size or 0
+            self._add_usage(
+                holding.id,
+                holding.group,
+                **{
+                    self.STORAGE_USAGE_FIELDS[location.storage_type]: -size,
+                    self.STORAGE_USAGE_FIELDS[storage_type]: size,
+                },
+            )
+            location.storage_type = storage_type
         location.url_scheme = url_scheme
         location.url_netloc = url_netloc
         location.root = root
-        location.path = path
+        location.stored_path = Location.path_to_store(file_, path)
         location.access_time = access_time
         location.aggregation_id = aggregation_id
+        self.archive_backlog_dirty.add(location.file_id)
+
+    def create_locations(self, locations: list[Location]) -> None:
+        """Bulk insert the locations made by create_location, and add the size of
+        their files to the usage aggregates for the storage type."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        try:
+            self.bulk_insert_objects(locations)
+        except DBError as e:
+            raise CatalogError(
+                f"{len(locations)} locations could not be added to the catalog, "
+                f"reason: {e.message}"
+            )
+        by_storage = {}
+        for l in locations:
+            by_storage.setdefault(l.storage_type, []).append(l.file_id)
+        for storage_type, file_ids in by_storage.items():
+            for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                self._add_location_usage(storage_type, chunk)
+
+    def _add_location_usage(self, storage_type: Enum, file_ids: list[int], sign=1):
+        """Add (or subtract, with sign=-1) the sizes of the files with a Location of
+        storage_type to the usage aggregates, with one query summing the sizes per
+        holding.  This has to be called after the Locations are created, or before
+        they are deleted."""
+        field = self.STORAGE_USAGE_FIELDS[storage_type]
+        sizes = self.session.execute(
+            select(File.holding_id, Holding.group, func.sum(File.size))
+            .join(Holding, File.holding_id == Holding.id)
+            .join(Location, Location.file_id == File.id)
+            .where(File.id.in_(file_ids), Location.storage_type == storage_type)
+            .group_by(File.holding_id, Holding.group)
+        ).all()
+        for holding_id, group, size in sizes:
+            self._add_usage(holding_id, group, **{field: sign * (size or 0)})
+
+    @staticmethod
+    def _stored_path_values(new_values: dict) -> dict:
+        """Store a new "path" of a Location as NULL if it is the original path of
+        its file, as Location.path_to_store does for a single Location."""
+        if "path" in new_values:
+            original_path = (
+                select(Directory.path + File.basename)
+                .where(
+                    File.id == Location.__table__.c.file_id,
+                    Directory.id == File.directory_id,
+                )
+                .scalar_subquery()
+            )
+            new_values["path"] = func.nullif(new_values["path"], original_path)
+        return new_values
+
+    def update_locations(self, storage_type: Enum, locations: list[dict]) -> None:
+        """Update many Locations of storage_type with one UPDATE ... FROM (VALUES ...)
+        statement (for each chunk of Locations), rather than modifying and flushing
+        each ORM object.  Each dictionary in locations contains the "file_id" of the
+        Location and the new values for its columns, e.g. "url_netloc" or
+        "aggregation_id".  All of the dictionaries must have the same keys.  If they
+        contain a new "storage_type", the sizes of the moved files are moved between
+        the usage aggregates of the storage types.
+        SQLite does not support naming the columns of a VALUES list, so on SQLite a
+        single UPDATE statement is executed with all of the locations instead."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if len(locations) == 0:
+            return
+        table = Location.__table__
+        keys = list(locations[0].keys())
+        set_keys = [k for k in keys if k != "file_id"]
+        # the files whose Location moves to another storage type, by storage type
+        moved = {}
+        if "storage_type" in set_keys:
+            for l in locations:
+                if l["storage_type"] != storage_type:
+                    moved.setdefault(l["storage_type"], []).append(l["file_id"])
+            for file_ids in moved.values():
+                for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                    chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                    self._add_location_usage(storage_type, chunk, sign=-1)
+        try:
+            if self.session.get_bind().dialect.name == "postgresql":
+                for c in range(0, len(locations), self.IN_CHUNK_SIZE):
+                    chunk = locations[c : c + self.IN_CHUNK_SIZE]
+                    new_values = values(
+                        *[column(k, table.c[k].type) for k in keys],
+                        name="new_location",
+                    ).data([tuple(l[k] for k in keys) for l in chunk])
+                    self.session.execute(
+                        update(table).where(
+                            table.c.file_id == new_values.c.file_id,
+                            table.c.storage_type == storage_type,
+                        )
+                        # the cast is needed for a column that is all NULLs, which
+                        # is untyped in the VALUES list
+                        .values(
+                            self._stored_path_values(
+                                {
+                                    k: cast(new_values.c[k], table.c[k].type)
+                                    for k in set_keys
+                                }
+                            )
+                        )
+                    )
+            else:
+                # executemany, the bind parameter names cannot be the column names
+                self.session.execute(
+                    update(table)
+                    .where(
+                        table.c.file_id == bindparam("b_file_id"),
+                        table.c.storage_type == storage_type,
+                    )
+                    .values(
+                        self._stored_path_values(
+                            {k: bindparam(f"b_{k}") for k in set_keys}
+                        )
+                    ),
+                    [{f"b_{k}": v for k, v in l.items()} for l in locations],
+                )
+        except (IntegrityError, OperationalError, DataError) as e:
+            raise CatalogError(
+                f"{len(locations)} locations could not be updated in the catalog, "
+                f"reason: {e}"
+            )
+        for new_storage_type, file_ids in moved.items():
+            for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                self._add_location_usage(new_storage_type, chunk)
+        # the tenancy in the archive backlog comes from the Location
+        self.archive_backlog_dirty.update(l["file_id"] for l in locations)
+
+    def delete_locations(
+        self, storage_type: Enum, file_ids: list[int], empty_only: bool = False
+    ) -> list[int]:
+        """Delete the Locations of storage_type for many files with one DELETE ...
+        WHERE file_id IN (for each chunk of ids).  If empty_only is True then only
+        Locations with empty details (i.e. the markers created before a transfer)
+        are deleted.  Returns the ids of the files whose Location was deleted."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        file_ids = list(file_ids)
+        deleted = []
+        try:
+            for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                where = [
+                    Location.file_id.in_(chunk),
+                    Location.storage_type == storage_type,
+                ]
+                if empty_only:
+                    where += [
+                        Location.url_scheme == "",
+                        Location.url_netloc == "",
+                        Location.root == "",
+                    ]
+                    chunk = (
+                        self.session.execute(select(Location.file_id).where(*where))
+                        .scalars()
+                        .all()
+                    )
+                self._add_location_usage(storage_type, chunk, sign=-1)
+                deleted.extend(
+                    self.session.execute(
+                        delete(Location)
+                        .where(*where)
+                        .returning(Location.file_id)
+                        .execution_options(synchronize_session=False)
+                    ).scalars()
+                )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(
+                f"{storage_type.name} locations could not be deleted from the "
+                f"catalog, reason: {e}"
+            )
+        self.archive_backlog_dirty.update(deleted)
+        return deleted
 
     def delete_location(self, file: File, storage_type: Enum) -> None:
         """Delete the location for a given file and storage_type"""
         location = self.get_location(file, storage_type=storage_type)
         try:
             self.session.delete(location)
+            self.archive_backlog_dirty.add(file.id)
+            holding = self.session.get(Holding, file.holding_id)
+            field = self.STORAGE_USAGE_FIELDS[storage_type]
+            self._add_usage(holding.id, holding.group, **{field: -(file.size or 0)})
         except (IntegrityError, KeyError, OperationalError):
             err_msg = (
                 f"Location with file.id {file.id} and storage_type "
@@ -921,7 +1686,209 @@ class Catalog(DBMixin):
             )
             raise CatalogError(err_msg)
 
-    def get_next_unarchived_holding(self, tenancy: str) -> Holding:
+    def commit(self):
+        """Update the archive backlog for any Files whose Locations have changed, and
+        the usage aggregates, then commit any pending transactions."""
+        self.update_archive_backlog()
+        self.update_usage()
+        super().commit()
+        self.identity_cache_pending.clear()
+
+    def update_usage(self) -> None:
+        """Apply the pending changes to the usage aggregates of the Holdings and
+        GroupUsage, in the current database transaction."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if len(self.usage_deltas) == 0:
+            return
+        group_deltas = {}
+        try:
+            for (holding_id, group), usage in self.usage_deltas.items():
+                values = {
+                    k: getattr(Holding, k) + usage[k]
+                    for k in self.USAGE_FIELDS
+                    if usage[k] != 0
+                }
+                if usage.get("ingested", False):
+                    values["last_ingest_time"] = func.now()
+                if len(values) == 0:
+                    continue
+                self.session.execute(
+                    update(Holding)
+                    .where(Holding.id == holding_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                # sum the changes for each group
+                g_usage = group_deltas.setdefault(group, dict.fromkeys(values, 0))
+                for k in self.USAGE_FIELDS:
+                    if k in values:
+                        g_usage[k] = g_usage.get(k, 0) + usage[k]
+                if "last_ingest_time" in values:
+                    g_usage["last_ingest_time"] = func.now()
+
+            # upsert the GroupUsage rows
+            for group, usage in group_deltas.items():
+                stmt = self.upsert_insert(GroupUsage).values(group=group, **usage)
+                set_ = {
+                    k: getattr(GroupUsage, k) + stmt.excluded[k]
+                    for k in self.USAGE_FIELDS
+                    if k in usage
+                }
+                if "last_ingest_time" in usage:
+                    set_["last_ingest_time"] = stmt.excluded.last_ingest_time
+                self.session.execute(
+                    stmt.on_conflict_do_update(index_elements=["group"], set_=set_)
+                )
+        except (IntegrityError, OperationalError, DBError) as e:
+            raise CatalogError(f"Couldn't update the usage aggregates, reason: {e}")
+        self.usage_deltas.clear()
+
+    def reconcile_usage(self) -> None:
+        """Recalculate the usage aggregates of every Holding from the File and
+        Location tables, and rebuild the GroupUsage from the Holdings.  This corrects
+        any drift in the aggregates, and populates them for an existing catalog."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+
+        def storage_size(storage_type):
+            return (
+                select(func.coalesce(func.sum(File.size), 0))
+                .join(Location, Location.file_id == File.id)
+                .where(
+                    File.holding_id == Holding.id,
+                    Location.storage_type == storage_type,
+                )
+                .scalar_subquery()
+            )
+
+        try:
+            self.session.execute(
+                update(Holding)
+                .values(
+                    file_count=select(func.count(File.id))
+                    .where(File.holding_id == Holding.id)
+                    .scalar_subquery(),
+                    total_size=select(func.coalesce(func.sum(File.size), 0))
+                    .where(File.holding_id == Holding.id)
+                    .scalar_subquery(),
+                    object_store_size=storage_size(Storage.OBJECT_STORAGE),
+                    tape_size=storage_size(Storage.TAPE),
+                    last_ingest_time=select(func.max(Transaction.ingest_time))
+                    .where(Transaction.holding_id == Holding.id)
+                    .scalar_subquery(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            self.session.execute(
+                delete(GroupUsage).execution_options(synchronize_session=False)
+            )
+            self.session.execute(
+                insert(GroupUsage).from_select(
+                    ["group", *self.USAGE_FIELDS, "last_ingest_time"],
+                    select(
+                        Holding.group,
+                        *[func.sum(getattr(Holding, k)) for k in self.USAGE_FIELDS],
+                        func.max(Holding.last_ingest_time),
+                    ).group_by(Holding.group),
+                )
+            )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(f"Couldn't reconcile the usage aggregates, reason: {e}")
+        # any pending changes are included in the recalculation
+        self.usage_deltas.clear()
+
+    def get_group_usage(self, group: str) -> GroupUsage:
+        """Get the usage aggregates for a group, or None if the group has no
+        holdings."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        return self.session.get(GroupUsage, group)
+
+    def update_archive_backlog(self) -> None:
+        """Recalculate whether each File whose Locations have changed (since the last
+        update) belongs in the archive backlog.  A File is in the backlog if it is a
+        FILE that has an Object Storage location, but not a Tape location.  There are
+        four cases:
+        1. Files without either a Object Storage or Tape location are mid transfer
+           to the Object Store
+        2. Files with an Object Storage, but no Tape location are on the Object
+           Storage but require backing up to tape - these are the backlog
+        3. Files with an Object Storage and Tape location are on the Object
+           Storage and have already been backed up to Tape
+        4. Files with a Tape location, but no Object Storage location have been
+           removed from Object Storage due to space constraints, and will need to
+           be fetched from Tape on a user GET
+        """
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if len(self.archive_backlog_dirty) == 0:
+            return
+        # make sure any pending Location changes are visible to the queries below
+        self.session.flush()
+        file_ids = list(self.archive_backlog_dirty)
+        tape = aliased(Location)
+        columns = ["file_id", "holding_id", "group", "tenancy", "size", "ingest_time"]
+        try:
+            # chunk the ids to keep the IN lists to a reasonable size
+            for c in range(0, len(file_ids), self.IN_CHUNK_SIZE):
+                chunk = file_ids[c : c + self.IN_CHUNK_SIZE]
+                self.session.execute(
+                    delete(ArchiveBacklog)
+                    .where(ArchiveBacklog.file_id.in_(chunk))
+                    .execution_options(synchronize_session=False)
+                )
+                backlog_q = (
+                    select(
+                        File.id,
+                        Transaction.holding_id,
+                        Holding.group,
+                        Location.url_netloc,
+                        File.size,
+                        Transaction.ingest_time,
+                    )
+                    .join(Transaction, File.transaction_id == Transaction.id)
+                    .join(Holding, Transaction.holding_id == Holding.id)
+                    .join(
+                        Location,
+                        and_(
+                            Location.file_id == File.id,
+                            Location.storage_type == Storage.OBJECT_STORAGE,
+                        ),
+                    )
+                    .where(
+                        File.id.in_(chunk),
+                        File.path_type == PathType.FILE,
+                        ~exists().where(
+                            tape.file_id == File.id,
+                            tape.storage_type == Storage.TAPE,
+                        ),
+                    )
+                )
+                self.session.execute(
+                    insert(ArchiveBacklog).from_select(columns, backlog_q)
+                )
+        except (IntegrityError, OperationalError) as e:
+            raise CatalogError(f"Couldn't update the archive backlog, reason: {e}")
+        self.archive_backlog_dirty.clear()
+
+    def _get_last_archived_group(self) -> str:
+        """Get the group of the holding that was most recently selected for archiving,
+        i.e. the owner of the newest Tape location."""
+        return (
+            self.session.query(Holding.group)
+            .join(Transaction, Transaction.holding_id == Holding.id)
+            .join(File, File.transaction_id == Transaction.id)
+            .join(Location, Location.file_id == File.id)
+            .filter(Location.storage_type == Storage.TAPE)
+            .order_by(Location.id.desc())
+            .limit(1)
+            .scalar()
+        )
+
+    def get_next_unarchived_holding(
+        self, tenancy: str, policy: str = "random"
+    ) -> Holding:
         """The principal function for getting the next unarchived holding to
         archive aggregate.
         A tenancy is passed in so that the only holdings attempted to be backed up are
@@ -929,65 +1896,74 @@ class Catalog(DBMixin):
         Otherwise, when the archive_put process tries to stream the files from the
         object store to the tape, the keys don't match the tenancy and an access denied
         error is produced.
+        The holding is chosen from the archive backlog, according to the policy:
+            random      : any holding, so that if one archive fails, it won't prevent
+                          the others from archiving
+            oldest      : the holding with the oldest unarchived transaction
+            largest     : the holding with the most unarchived bytes
+            round_robin : the oldest holding in the next group (in alphabetical order)
+                          after the group that was archived last
         """
         if self.session is None:
             raise RuntimeError("self.session is None")
+        if policy not in self.ARCHIVE_POLICIES:
+            raise CatalogError(
+                f"Unknown archive policy {policy}, must be one of "
+                f"{self.ARCHIVE_POLICIES}"
+            )
         try:
-            # To get unarchived Holdings we need to find Transactions in a holding that
-            # contains files that do not have a Tape location
-            # however, they do have to have a Object Storage location, as this shows
-            # that the file was successfully transferred to Object Storage.
-            # There are four cases:
-            # 1. Files without either a Object Storage or Tape location are mid transfer
-            #    to the Object Store
-            # 2. Files with an Object Storage, but no Tape location are on the Object
-            #    Storage but require backing up to tape
-            # 3. Files with an Object Storage and Tape location are on the Object
-            #    Storage and have already been backed up to Tape
-            # 4. Files with a Tape location, but no Object Storage location have been
-            #    removed from Object Storage due to space constraints, and will need to
-            #    be fetched from Tape on a user GET
-            next_holding = (
-                self.session.query(Holding)
-                .filter(
-                    Transaction.holding_id == Holding.id,
-                    File.transaction_id == Transaction.id,
-                    File.path_type == PathType.FILE,
-                    ~File.locations.any(Location.storage_type == Storage.TAPE),
-                    File.locations.any(Location.storage_type == Storage.OBJECT_STORAGE),
-                    # tenancy is stored in url_netloc part of Location
-                    File.locations.any(Location.url_netloc == tenancy),
-                )
-                # Order randomly so that if one archive fails, it won't prevent the
-                # others from archiving
-                .order_by(func.random())
-                .first()
+            backlog_q = self.session.query(ArchiveBacklog.holding_id).filter(
+                ArchiveBacklog.tenancy == tenancy
             )
-
+            if policy == "random":
+                backlog_q = backlog_q.order_by(func.random())
+            elif policy == "oldest":
+                backlog_q = backlog_q.order_by(ArchiveBacklog.ingest_time)
+            elif policy == "largest":
+                backlog_q = backlog_q.group_by(ArchiveBacklog.holding_id).order_by(
+                    func.sum(ArchiveBacklog.size).desc()
+                )
+            elif policy == "round_robin":
+                # next group after the last archived group, wrapping around
+                group_q = self.session.query(func.min(ArchiveBacklog.group)).filter(
+                    ArchiveBacklog.tenancy == tenancy
+                )
+                last_group = self._get_last_archived_group()
+                next_group = None
+                if last_group is not None:
+                    next_group = group_q.filter(
+                        ArchiveBacklog.group > last_group
+                    ).scalar()
+                if next_group is None:
+                    next_group = group_q.scalar()
+                backlog_q = backlog_q.filter(
+                    ArchiveBacklog.group == next_group
+                ).order_by(ArchiveBacklog.ingest_time)
+            holding_id = backlog_q.limit(1).scalar()
         except (NoResultFound, KeyError):
             raise CatalogError(f"Couldn't get unarchived holdings")
-        return next_holding
+        if holding_id is None:
+            return None
+        return self.session.get(Holding, holding_id)
 
     def get_unarchived_files(
         self, holding: Holding, with_for_update: bool = False
     ) -> list[File]:
         """The principal function for getting unarchived files to aggregate and
-        send to archive put."""
+        send to archive put.  These are the files of the holding that are in the
+        archive backlog."""
         if self.session is None:
             raise RuntimeError("self.session is None")
         try:
-            # Get all files for the given holding. Again we have to ensure that the
-            # transfer to object storage has completed and the files are not
-            # mid-transfer
+            # filtering on File.holding_id restricts the scan to one partition of
+            # the file table, when it is partitioned
             unarchived_files_q = self.session.query(File).filter(
-                Transaction.holding_id == holding.id,
-                File.transaction_id == Transaction.id,
-                File.path_type == PathType.FILE,
-                ~File.locations.any(Location.storage_type == Storage.TAPE),
-                File.locations.any(Location.storage_type == Storage.OBJECT_STORAGE),
+                ArchiveBacklog.holding_id == holding.id,
+                File.holding_id == holding.id,
+                File.id == ArchiveBacklog.file_id,
             )
             if with_for_update:
-                unarchived_files_q = unarchived_files_q.with_for_update()
+                unarchived_files_q = unarchived_files_q.with_for_update(of=File)
         except (NoResultFound, KeyError):
             raise CatalogError(
                 f"Couldn't find unarchived files for holding with id:{holding.id}"
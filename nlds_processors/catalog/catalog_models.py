@@ -13,6 +13,7 @@ __contact__ = "neil.massey@stfc.ac.uk"
 """Declare the SQLAlchemy ORM models for the NLDS Catalog database"""
 
 import enum
+import hashlib
 from urllib.parse import urlunsplit
 
 from sqlalchemy import (
@@ -24,9 +25,11 @@ from sqlalchemy import (
     BigInteger,
     UniqueConstraint,
     Boolean,
+    Index,
 )
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, func, select
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declarative_base, relationship
 
 
@@ -38,6 +41,57 @@ import nlds.rabbit.message_keys as MSG
 CatalogBase = declarative_base()
 
 
+def path_hash(original_path: str) -> int:
+    """64-bit (signed, to fit in a BigInteger) hash of a file's original path.  This
+    is stored with the File so that the uniqueness of a path in a holding can be
+    enforced with a compact index, rather than an index on the (long) path."""
+    digest = hashlib.blake2b(original_path.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def split_path(original_path: str) -> tuple[str, str]:
+    """Split a file's original path into the path of its directory and its basename.
+    The directory is stored once in the Directory table and shared by all the Files
+    in it.  The directory keeps its trailing "/", so that the original path is
+    always the directory + the basename.  e.g. "/a/b/c.nc" -> ("/a/b/", "c.nc")"""
+    i = original_path.rfind("/") + 1
+    return original_path[:i], original_path[i:]
+
+
+def parent_directory(directory: str) -> str:
+    """Get the parent of a directory (with its trailing "/"), or None for the root
+    directory.  e.g. "/a/b/" -> "/a/", "/" -> None"""
+    if directory in ("", "/"):
+        return None
+    return directory[: directory.rfind("/", 0, len(directory) - 1) + 1]
+
+
+def directory_ancestors(directory: str) -> list[str]:
+    """Get the list of a directory and all of its parent directories, starting at the
+    root.  e.g. "/a/b/" -> ["/", "/a/", "/a/b/"]"""
+    ancestors = [directory]
+    parent = parent_directory(directory)
+    while parent is not None:
+        ancestors.append(parent)
+        parent = parent_directory(parent)
+    return ancestors[::-1]
+
+
+def usage_to_dict(usage) -> dict:
+    """Convert the usage aggregates of a Holding or GroupUsage to a dictionary"""
+    if usage.last_ingest_time is None:
+        last_ingest_time = None
+    else:
+        last_ingest_time = usage.last_ingest_time.isoformat()
+    return {
+        "file_count": usage.file_count,
+        "total_size": usage.total_size,
+        "object_store_size": usage.object_store_size,
+        "tape_size": usage.tape_size,
+        "last_ingest_time": last_ingest_time,
+    }
+
+
 class Holding(CatalogBase):
     """Class containing the details of a Holding - i.e. a batch"""
 
@@ -54,6 +108,15 @@ class Holding(CatalogBase):
     tags = relationship("Tag", backref="holding", cascade="delete, delete-orphan")
     # relationship for transactions (One to many)
     transactions = relationship("Transaction", cascade="delete, delete-orphan")
+    # usage aggregates - these are maintained by the Catalog, and can be
+    # recalculated from the File and Location tables with reconcile_usage
+    file_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_size = Column(BigInteger, nullable=False, default=0, server_default="0")
+    object_store_size = Column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    tape_size = Column(BigInteger, nullable=False, default=0, server_default="0")
+    last_ingest_time = Column(DateTime)
     # label must be unique per user
     __table_args__ = (UniqueConstraint("label", "user"),)
 
@@ -71,6 +134,10 @@ class Holding(CatalogBase):
             t_ids.append(t.transaction_id)
         return t_ids
 
+    # return the usage aggregates as a dictionary
+    def get_usage(self):
+        return usage_to_dict(self)
+
     # get the prefix
     def get_prefix(self):
         """Gets a unique prefix from the holding that will be used as the directory on
@@ -108,7 +175,11 @@ class Tag(CatalogBase):
     # holding id as ForeignKey "Parent"
     holding_id = Column(Integer, ForeignKey("holding.id"), index=True, nullable=False)
 
-    __table_args__ = (UniqueConstraint("key", "holding_id"),)
+    __table_args__ = (
+        UniqueConstraint("key", "holding_id"),
+        # for searching for the holdings with a key:value tag
+        Index("ix_tag_key_value_holding_id", "key", "value", "holding_id"),
+    )
 
 
 class File(CatalogBase):
@@ -121,8 +192,17 @@ class File(CatalogBase):
     transaction_id = Column(
         Integer, ForeignKey("transaction.id"), index=True, nullable=False
     )
-    # original path on POSIX disk - this should be unique per holding
-    original_path = Column(String)
+    # the original path on POSIX disk, split into its directory (normalised into the
+    # Directory table) and its basename - the original path is not stored, it is
+    # the directory path + the basename, see original_path below
+    directory_id = Column(
+        Integer, ForeignKey("directory.id"), index=True, nullable=False
+    )
+    basename = Column(String, nullable=False)
+    # holding id (denormalised from the transaction) and hash of the original path,
+    # the unique constraint on these enforces the uniqueness of the path per holding
+    holding_id = Column(Integer, ForeignKey("holding.id"))
+    path_hash = Column(BigInteger)
     # PathType, same as the nlds.details.PathType enum
     path_type = Column(Enum(PathType))
     # path to the link
@@ -136,16 +216,46 @@ class File(CatalogBase):
     # unix style file permissions
     file_permissions = Column(Integer)
 
-    # relationship for location (one to many)
-    locations = relationship("Location", cascade="delete, delete-orphan")
+    # relationship for location (one to many), joined on the holding id as well so
+    # that only the matching partitions of the location table are scanned
+    locations = relationship(
+        "Location",
+        primaryjoin="and_(File.id == foreign(Location.file_id), "
+        "File.holding_id == foreign(Location.holding_id))",
+        cascade="delete, delete-orphan",
+    )
     # relationship for checksum (one to one)
     checksums = relationship("Checksum", cascade="delete, delete-orphan")
+    # the directory (many to one), loaded in one query for all of the Files loaded
+    # together - the directories are shared, so they are usually already loaded
+    directory = relationship("Directory", lazy="selectin", viewonly=True)
+
+    __table_args__ = (
+        UniqueConstraint("holding_id", "path_hash", name="uq_file_holding_path_hash"),
+    )
+
+    @hybrid_property
+    def original_path(self) -> str:
+        """The original path on POSIX disk - this is unique per holding"""
+        return self.directory.path + self.basename
+
+    @original_path.inplace.expression
+    @classmethod
+    def _original_path_expression(cls):
+        return (
+            select(Directory.path)
+            .where(Directory.id == cls.directory_id)
+            .correlate_except(Directory)
+            .scalar_subquery()
+            + cls.basename
+        )
 
     @classmethod
-    def from_pathdetails(cls, pd: PathDetails):
+    def from_pathdetails(cls, pd: PathDetails, directory_id: int):
         return cls(
             transaction_id=0,
-            original_path=pd.original_path,
+            directory_id=directory_id,
+            basename=split_path(pd.original_path)[1],
             path_type=pd.path_type,
             link_path=pd.link_path,
             size=pd.size,
@@ -181,6 +291,33 @@ class Storage(enum.Enum):
         return [MSG.OBJECT_STORAGE, MSG.TAPE][self.value - 1]
 
 
+class Directory(CatalogBase):
+    """Class containing a directory that Files were in on POSIX disk.  Directories
+    are shared by all holdings, and the path of each is stored once, rather than in
+    the path of every File and Location.  The path is a materialised path, with a
+    trailing "/", so all of the directories under a directory can be found with an
+    (indexed) prefix search on the path."""
+
+    __tablename__ = "directory"
+    # primary key / integer id
+    id = Column(Integer, primary_key=True)
+    # absolute path of the directory, with a trailing "/"
+    path = Column(String, nullable=False)
+    # parent directory, None for the root directory
+    parent_id = Column(Integer, ForeignKey("directory.id"), index=True, nullable=True)
+
+    # the path is unique, the text_pattern_ops operator class lets PostgreSQL use the
+    # index for the LIKE 'prefix%' searches as well as for equality
+    __table_args__ = (
+        Index(
+            "uq_directory_path",
+            "path",
+            unique=True,
+            postgresql_ops={"path": "text_pattern_ops"},
+        ),
+    )
+
+
 class Location(CatalogBase):
     """Class containing the location on NLDS of a single File"""
 
@@ -195,8 +332,10 @@ class Location(CatalogBase):
     url_netloc = Column(String, nullable=False)
     # root of the file on the storage (bucket on object storage)
     root = Column(String, nullable=False)
-    # path of the file on the storage
-    path = Column(String, nullable=False)
+    # path of the file on the storage, this is None if it is the original path of
+    # the file (which it nearly always is), so that the path is not stored twice,
+    # see path below
+    stored_path = Column("path", String, nullable=True)
     # last time the file was accessed
     access_time = Column(DateTime)
     # file id as ForeignKey "Parent"
@@ -204,11 +343,44 @@ class Location(CatalogBase):
     aggregation_id = Column(
         Integer, ForeignKey("aggregation.id"), index=True, nullable=True
     )
+    # holding id (denormalised from the file), this is the partition key when the
+    # file and location tables are partitioned on PostgreSQL, see
+    # partition_catalog.py
+    holding_id = Column(Integer, ForeignKey("holding.id"), index=True, nullable=False)
+
+    # the file (many to one), this is in the identity map when the Location is
+    # loaded through File.locations
+    file = relationship("File", viewonly=True)
 
     # storage_type must be unique per file_id, i.e. each file can only have one
     # each location
     __table_args__ = (UniqueConstraint("storage_type", "file_id"),)
 
+    @hybrid_property
+    def path(self) -> str:
+        """The path of the file on the storage"""
+        if self.stored_path is not None:
+            return self.stored_path
+        return self.file.original_path
+
+    @path.inplace.expression
+    @classmethod
+    def _path_expression(cls):
+        return func.coalesce(
+            cls.stored_path,
+            select(Directory.path + File.basename)
+            .where(File.id == cls.file_id, Directory.id == File.directory_id)
+            .correlate_except(File, Directory)
+            .scalar_subquery(),
+        )
+
+    @staticmethod
+    def path_to_store(file_: File, path: str) -> str:
+        """The value of stored_path for a Location of file_ at path"""
+        if path == file_.original_path:
+            return None
+        return path
+
     @property
     def url(self) -> str:
         """Get the 1st object storage location and return the url
@@ -230,7 +402,9 @@ class Location(CatalogBase):
 
 
 class Checksum(CatalogBase):
-    """Class containing checksum and algorithm used to calculate checksum"""
+    """Class containing checksum and algorithm used to calculate checksum.  Files
+    with identical contents have the same checksum, so the (algorithm, checksum)
+    index is used to find an existing copy of a file when deduplicating uploads."""
 
     __tablename__ = "checksum"
     # primary key / integer id
@@ -241,8 +415,11 @@ class Checksum(CatalogBase):
     algorithm = Column(String, nullable=False)
     # file id as ForeignKey "Parent" (one to many)
     file_id = Column(Integer, ForeignKey("file.id"), index=True, nullable=False)
-    # checksum must be unique per algorithm
-    __table_args__ = (UniqueConstraint("checksum", "algorithm"),)
+    # each file has one checksum per algorithm
+    __table_args__ = (
+        UniqueConstraint("file_id", "algorithm", name="uq_checksum_file_algorithm"),
+        Index("ix_checksum_algorithm_checksum", "algorithm", "checksum"),
+    )
 
 
 class Aggregation(CatalogBase):
@@ -263,3 +440,54 @@ class Aggregation(CatalogBase):
 
     # relationship for location (one to many)
     locations = relationship("Location", cascade="delete, delete-orphan")
+
+
+class ArchiveBacklog(CatalogBase):
+    """Class containing a File that is on the Object Storage, but does not have a
+    Tape location yet, i.e. it is waiting to be archived.  This is maintained by the
+    Catalog whenever a Location is created, modified or deleted, so that the next
+    holding to archive can be found without searching the whole catalog."""
+
+    __tablename__ = "archive_backlog"
+    # file id is the primary key, a file can only be in the backlog once
+    file_id = Column(
+        Integer, ForeignKey("file.id", ondelete="CASCADE"), primary_key=True
+    )
+    # the holding, group and tenancy (url_netloc of the object storage location)
+    # are copied here so that selecting the next holding does not need any joins
+    holding_id = Column(
+        Integer,
+        ForeignKey("holding.id", ondelete="CASCADE"),
+        index=True,
+        nullable=False,
+    )
+    group = Column(String, nullable=False)
+    tenancy = Column(String, nullable=False)
+    # size of the file and the ingest time of its transaction, for the oldest-first
+    # and largest-first archive policies
+    size = Column(BigInteger)
+    ingest_time = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_archive_backlog_tenancy_ingest_time", "tenancy", "ingest_time"),
+        Index("ix_archive_backlog_tenancy_group", "tenancy", "group"),
+    )
+
+
+class GroupUsage(CatalogBase):
+    """Class containing the usage aggregates for all of the Holdings in a group.
+    This is maintained by the Catalog alongside the aggregates in each Holding."""
+
+    __tablename__ = "group_usage"
+    # group is the primary key
+    group = Column(String, primary_key=True)
+    file_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_size = Column(BigInteger, nullable=False, default=0, server_default="0")
+    object_store_size = Column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    tape_size = Column(BigInteger, nullable=False, default=0, server_default="0")
+    last_ingest_time = Column(DateTime)
+
+    def get_usage(self):
+        return usage_to_dict(self)
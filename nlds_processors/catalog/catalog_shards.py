@@ -0,0 +1,174 @@
+# encoding: utf-8
+"""
+catalog_shards.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_error import CatalogError
+from nlds_processors.catalog.catalog_models import Holding
+
+
+class CatalogShards:
+    """A set of Catalogs, each on its own database (a shard), and the routing table
+    that maps each group to the shard that its holdings are stored in.  Groups that
+    are not in the routing table are stored in the default shard.  Queries of all
+    the groups ("**all**", by the admin user) are sent to every shard, and their
+    results merged.  Holding ids are only unique within a shard."""
+
+    ALL = "**all**"
+
+    def __init__(
+        self,
+        catalogs: dict[str, Catalog],
+        routing: dict[str, str] = None,
+        default_shard: str = None,
+    ):
+        if not catalogs:
+            raise CatalogError("No catalog shards configured")
+        self.catalogs = catalogs
+        self.routing = routing or {}
+        if default_shard is None:
+            default_shard = next(iter(catalogs))
+        self.default_shard = default_shard
+        for shard in (default_shard, *self.routing.values()):
+            if shard not in catalogs:
+                raise CatalogError(
+                    f"Unknown catalog shard {shard}, must be one of "
+                    f"{list(catalogs.keys())}"
+                )
+
+    def __len__(self) -> int:
+        return len(self.catalogs)
+
+    def shard_name(self, group: str) -> str:
+        """The name of the shard that the holdings of group are stored in"""
+        return self.routing.get(group, self.default_shard)
+
+    def catalog(self, group: str) -> Catalog:
+        """The Catalog that the holdings of group are stored in"""
+        return self.catalogs[self.shard_name(group)]
+
+    def route(self, group: str) -> dict[str, Catalog]:
+        """The Catalogs that a query of group has to be sent to, keyed by shard
+        name: every shard for "**all**" groups, otherwise just the group's shard"""
+        if group == self.ALL:
+            return self.catalogs
+        shard = self.shard_name(group)
+        return {shard: self.catalogs[shard]}
+
+    def connect(self, create_db_fl: bool = True) -> dict[str, str]:
+        """Connect to every shard, returning the connection string of each"""
+        return {
+            shard: catalog.connect(create_db_fl=create_db_fl)
+            for shard, catalog in self.catalogs.items()
+        }
+
+    def start_session(self) -> None:
+        for catalog in self.catalogs.values():
+            catalog.start_session()
+
+    def end_session(self) -> None:
+        for catalog in self.catalogs.values():
+            catalog.end_session()
+
+    def rollback(self) -> None:
+        for catalog in self.catalogs.values():
+            if catalog.session is not None:
+                catalog.session.rollback()
+
+    @contextmanager
+    def read_session(self, group: str):
+        """Use the read session of each of the Catalogs that a query of group is
+        sent to, see DBMixin.read_session"""
+        with ExitStack() as stack:
+            for catalog in self.route(group).values():
+                stack.enter_context(catalog.read_session())
+            yield
+
+    @staticmethod
+    def _holding_ingest_time(holding: Holding) -> datetime:
+        return min(
+            (t.ingest_time for t in holding.transactions if t.ingest_time),
+            default=datetime.min,
+        )
+
+    def get_holdings(
+        self,
+        user: str,
+        group: str,
+        limit: int = None,
+        descending: bool = False,
+        **kwargs,
+    ) -> list[Holding]:
+        """Get the matching holdings from the shards that group is routed to, see
+        Catalog.get_holdings.  A CatalogError is only raised if no shard has any
+        matching holdings."""
+        catalogs = self.route(group)
+        if len(catalogs) == 1:
+            (catalog,) = catalogs.values()
+            return catalog.get_holdings(
+                user, group, limit=limit, descending=descending, **kwargs
+            )
+        holdings = []
+        error = None
+        for catalog in catalogs.values():
+            try:
+                holdings.extend(
+                    catalog.get_holdings(
+                        user, group, limit=limit, descending=descending, **kwargs
+                    )
+                )
+            except CatalogError as e:
+                error = e
+        if not holdings and error is not None:
+            raise error
+        holdings.sort(key=self._holding_ingest_time, reverse=descending)
+        return holdings[:limit] if limit else holdings
+
+    def get_files(
+        self,
+        user: str,
+        group: str,
+        limit: int = None,
+        descending: bool = False,
+        **kwargs,
+    ):
+        """Get the matching (File, Transaction, Holding) rows from the shards that
+        group is routed to, see Catalog.get_files.  The rows from more than one shard
+        are merged into a list, ordered by the ingest time of the transaction."""
+        catalogs = self.route(group)
+        if len(catalogs) == 1:
+            (catalog,) = catalogs.values()
+            return catalog.get_files(
+                user, group, limit=limit, descending=descending, **kwargs
+            )
+        rows = []
+        error = None
+        for catalog in catalogs.values():
+            try:
+                result = catalog.get_files(
+                    user, group, limit=limit, descending=descending, **kwargs
+                )
+            except CatalogError as e:
+                error = e
+                continue
+            if result is not None:
+                rows.extend(result)
+        if not rows:
+            if error is not None:
+                raise error
+            return None
+        rows.sort(
+            key=lambda r: r.Transaction.ingest_time or datetime.min,
+            reverse=descending,
+        )
+        return rows[:limit] if limit else rows
@@ -23,6 +23,56 @@ Requires these settings in the /etc/nlds/server_config file:
         "logging":{
             "enable": true
         }
+
+Optionally, the read-only RPC methods (list, find and stat) can be directed to a
+different database (e.g. a streaming replica) by adding a "db_read_options"
+dictionary.  Any keys missing from "db_read_options" are taken from "db_options".
+Connection pool sizes can be set in either dictionary with "pool_size",
+"max_overflow", "pool_timeout" and "pool_recycle":
+
+        "db_read_options": {
+            "db_name" : "replica-host/nlds_catalog",
+            "pool_size" : 10
+        },
+
+Setting "read_only_fl" to true makes the worker a dedicated RPC worker, for the
+catalog_q_user queue, that will not process any PUT / GET / ARCHIVE messages.
+
+The database session is cleared of ORM objects after every message and is closed
+and restarted every "session_recycle_count" messages (default 1000, 0 to never
+restart it).
+
+"archive_policy" selects how the next holding to archive is chosen from the archive
+backlog: "random" (the default), "oldest", "largest" or "round_robin" (per group).
+
+"transaction_cache_size" is the number of transaction_id -> holding_id mappings that
+are cached for the stat RPC (default 10000, 0 to disable the cache).
+
+"identity_cache_size" is the number of holding / transaction identities (keyed on
+transaction_id and on label) that are cached, so that the PUT sub-batches of a
+transaction can load their holding and transaction by primary key (default 10000, 0
+to disable the cache).  The hit rates of both caches are logged when the database
+session is recycled.
+
+The catalog can be sharded across several databases, by group, with a "shards"
+dictionary of shard name to database settings ("db_engine", "db_options" and,
+optionally, "db_read_options", with the same meanings as above).  The top-level
+database settings are then not used.  "shard_routing" is the routing table, a
+dictionary of group to shard name, and the holdings of groups that are not in the
+routing table are stored in the "default_shard" (default the first shard).  List,
+find and stat queries of all groups, by the admin user, are sent to every shard and
+the results merged.  Each shard has to be upgraded with
+"alembic -x shard=<shard name> upgrade head".
+
+        "shards": {
+            "shard_a": {
+                "db_engine": "postgresql",
+                "db_options": {"db_name": "db-host-a/nlds_catalog", ...}
+            },
+            "shard_b": {...}
+        },
+        "shard_routing": {"group_1": "shard_b"},
+        "default_shard": "shard_a",
 """
 
 from typing import Dict, Tuple
@@ -42,8 +92,11 @@ from nlds.errors import CallbackError
 
 from nlds_processors.catalog.catalog import Catalog
 from nlds_processors.catalog.catalog_error import CatalogError
-from nlds_processors.catalog.catalog_models import Storage, File
-from nlds.details import PathDetails, PathType
+from nlds_processors.catalog.catalog_shards import CatalogShards
+from nlds_processors.catalog.catalog_models import Storage, File, path_hash
+from nlds.details import PathDetails, PathType, PathLocation
+from nlds.utils.memory import get_rss
+from nlds.utils.cache import LRUCache
 from nlds_processors.db_mixin import DBError
 
 import nlds.rabbit.routing_keys as RK
@@ -144,8 +197,17 @@ class CatalogConsumer(RMQC):
     _DB_OPTIONS_USER = "db_user"
     _DB_OPTIONS_PASSWD = "db_passwd"
     _DB_ECHO = "echo"
+    _DB_READ_OPTIONS = "db_read_options"
     _DEFAULT_TENANCY = "default_tenancy"
     _DEFAULT_TAPE_URL = "default_tape_url"
+    _READ_ONLY = "read_only_fl"
+    _SESSION_RECYCLE = "session_recycle_count"
+    _ARCHIVE_POLICY = "archive_policy"
+    _TRANSACTION_CACHE_SIZE = "transaction_cache_size"
+    _IDENTITY_CACHE_SIZE = "identity_cache_size"
+    _SHARDS = "shards"
+    _SHARD_ROUTING = "shard_routing"
+    _DEFAULT_SHARD = "default_shard"
 
     DEFAULT_CONSUMER_CONFIG = {
         _DB_ENGINE: "sqlite",
@@ -155,23 +217,58 @@ class CatalogConsumer(RMQC):
             _DB_OPTIONS_PASSWD: "",
             _DB_ECHO: True,
         },
+        _DB_READ_OPTIONS: None,
         _DEFAULT_TENANCY: None,
         _DEFAULT_TAPE_URL: None,
+        _READ_ONLY: False,
+        _SESSION_RECYCLE: 1000,
+        _ARCHIVE_POLICY: "random",
+        _TRANSACTION_CACHE_SIZE: 10000,
+        _IDENTITY_CACHE_SIZE: 10000,
+        _SHARDS: None,
+        _SHARD_ROUTING: {},
+        _DEFAULT_SHARD: None,
     }
 
+    # the api-actions that only read from the database and can be directed to the
+    # read engine
+    READ_API_ACTIONS = (RK.LIST, RK.FIND, RK.STAT)
+    # the api-actions that a read-only worker will process - meta is an RPC so is
+    # serviced by the catalog_q_user queue, but it uses the write engine
+    READ_ONLY_WORKER_API_ACTIONS = READ_API_ACTIONS + (RK.META,)
+
     def __init__(self, queue=DEFAULT_QUEUE_NAME):
         super().__init__(queue=queue)
 
         self.default_tape_url = self.load_config_value(self._DEFAULT_TAPE_URL)
         self.default_tenancy = self.load_config_value(self._DEFAULT_TENANCY)
+        self.read_only = self.load_config_value(self._READ_ONLY)
+        self.session_recycle_count = self.load_config_value(self._SESSION_RECYCLE)
+        self.archive_policy = self.load_config_value(self._ARCHIVE_POLICY)
+        # cache of transaction_id -> holding_id, for _catalog_stat
+        self.transaction_cache = LRUCache(
+            self.load_config_value(self._TRANSACTION_CACHE_SIZE)
+        )
 
+        # the catalog of the shard that the current message is routed to
         self.catalog = None
+        self._shards = None
+        # index of the shard that the last holding was archived from, so that the
+        # shards take turns
+        self.archive_shard = -1
         self.tapelist = []
 
     @property
     def database(self):
         return self.catalog
 
+    @property
+    def shards(self) -> CatalogShards:
+        # an unsharded catalog has one shard
+        if self._shards is None:
+            return CatalogShards({None: self.catalog})
+        return self._shards
+
     def reset(self):
         super().reset()
 
@@ -407,6 +504,18 @@ class CatalogConsumer(RMQC):
             query_group = group
         return query_user, query_group
 
+    def _get_query_group(self, body: Dict) -> str:
+        """The group that a list or find query is routed to the shard(s) of, without
+        validating the message (this is done when it is processed)"""
+        details = body[MSG.DETAILS]
+        _, query_group = self._get_query_user_group(
+            details.get(MSG.USER),
+            details.get(MSG.GROUP),
+            details.get(MSG.USER_QUERY),
+            details.get(MSG.GROUP_QUERY),
+        )
+        return query_group
+
     def _get_search_label(self, holding_label, holding_id):
         """Determine the search label, this is a regex and depends on whether the
         holding_label and/or holding_id has been supplied"""
@@ -481,6 +590,16 @@ class CatalogConsumer(RMQC):
             self.catalog.commit()
         return warnings
 
+    def _fail_completelist(self, reason: str):
+        """A bulk insert has failed, so roll back the whole message and move the
+        completed files to the failed list."""
+        self.log(reason, RK.LOG_ERROR)
+        self.catalog.session.rollback()
+        for pd in self.completelist:
+            pd.failure_reason = reason
+        self.failedlist.extend(self.completelist)
+        self.completelist.clear()
+
     def _get_holding_with_retry(
         self,
         user: str,
@@ -512,6 +631,14 @@ class CatalogConsumer(RMQC):
             raise e
         return holding
 
+    @staticmethod
+    def _set_holding_details(body: Dict, holding) -> None:
+        """Add the id and label of the holding that a transaction is stored in to the
+        details of the message, so that the monitor can record them and answer
+        status queries without asking the catalog"""
+        body[MSG.DETAILS][MSG.HOLDING_ID] = holding.id
+        body[MSG.DETAILS][MSG.LABEL] = holding.label
+
     def _catalog_setup(self, body: Dict, rk_origin: str) -> None:
         """
         Create a holding in the catalog, if necessary.
@@ -569,14 +696,16 @@ class CatalogConsumer(RMQC):
         if label is not None:
             # case 1: user has supplied label - if a holding with the label doesn't
             #         exist then create it
-            try:
-                holding = self._get_holding_with_retry(
-                    user, group, label=label, with_for_update=True
-                )
-                create_holding = False
-            except CatalogError:
-                create_label = label
-                create_holding = True
+            holding, _ = self.catalog.get_cached_holding(user, group, label=label)
+            create_holding = False
+            if holding is None:
+                try:
+                    holding = self._get_holding_with_retry(
+                        user, group, label=label, with_for_update=True
+                    )
+                except CatalogError:
+                    create_label = label
+                    create_holding = True
         elif holding_id is not None:
             # case 2: user has supplied holding id - if a holding with the holding id
             #         doesn't exist then do not create it - it is an error
@@ -633,8 +762,11 @@ class CatalogConsumer(RMQC):
                 ),
                 RK.LOG_INFO,
             )
-            # commit the transaction and the holding
+            # commit the transaction and the holding, and cache their identity for
+            # the _catalog_put sub-batches
+            self.catalog.cache_identity(holding, transaction)
             self.catalog.commit()
+            self._set_holding_details(body, holding)
         # send the failed or complete messages
         if len(self.failedlist) > 0:
             # failed
@@ -671,38 +803,51 @@ class CatalogConsumer(RMQC):
         # get the (regex) search label
         search_label = self._get_search_label(label, holding_id)
 
-        # get the holding - it should have been created in the _catalog_setup
-        try:
-            holding = self._get_holding_with_retry(
-                user,
-                group,
-                label=search_label,
-                holding_id=holding_id,
-                transaction_id=transaction_id,
-                with_for_update=True,
+        # the holding and transaction are usually in the identity cache, as they
+        # were created in _catalog_setup or by an earlier sub-batch of the transaction
+        if holding_id is None:
+            holding, transaction = self.catalog.get_cached_holding(
+                user, group, transaction_id=transaction_id
             )
-        except CatalogError as e:
-            # could not find holding so mark all files as failed and return
-            holding = None
-            for f in filelist:
-                pd = PathDetails.from_dict(f)
-                pd.failure_reason = e.message
-                self.failedlist.append(pd)
+        else:
+            holding, transaction = None, None
 
-        if holding:
+        if holding is None:
+            # get the holding - it should have been created in the _catalog_setup
             try:
-                # get or create the transaction
-                transaction = self._get_or_create_transaction(transaction_id, holding)
+                holding = self._get_holding_with_retry(
+                    user,
+                    group,
+                    label=search_label,
+                    holding_id=holding_id,
+                    transaction_id=transaction_id,
+                    with_for_update=True,
+                )
             except CatalogError as e:
-                transaction = None
+                # could not find holding so mark all files as failed and return
+                holding = None
                 for f in filelist:
                     pd = PathDetails.from_dict(f)
                     pd.failure_reason = e.message
                     self.failedlist.append(pd)
 
-        # keep a list of files that we are going to bulk commit
-        files_to_commit = []
+            if holding:
+                try:
+                    # get or create the transaction
+                    transaction = self._get_or_create_transaction(
+                        transaction_id, holding
+                    )
+                except CatalogError as e:
+                    transaction = None
+                    for f in filelist:
+                        pd = PathDetails.from_dict(f)
+                        pd.failure_reason = e.message
+                        self.failedlist.append(pd)
+                else:
+                    self.catalog.cache_identity(holding, transaction)
+
         if holding and transaction:
+            self._set_holding_details(body, holding)
             # convert the JSON file descriptions in the filelist into a list of
             # PathDetails
             path_details_list = []
@@ -713,50 +858,34 @@ class CatalogConsumer(RMQC):
                 pd.holding_id = holding.id
                 path_details_list.append(pd)
 
-            # check whether any member of this path_details_list already occurs in the
-            # holding
-            files_exist = self.catalog._filelist_exists_in_holding(
-                holding.id, path_details_list
-            )
-            # fail the files that exist
-            for e in files_exist:
-                # this little bit of code gets the original PathDetails from the
-                # filelist for a file that failed
-                # files_exist is not guaranteed to be in the same order as
-                # path_details_list
-                # and may not contain all of the same entries as path_details_list
-                pd = path_details_list[path_details_list.index(e)]
-                # add the failure reason
-                msg = "File already exists in holding."
-                pd.failure_reason = msg
-                self.failedlist.append(pd)
-                self.log(msg, RK.LOG_ERROR)
-
-            # find the files in the path_details_list that didn't already occur in the
-            # holding - i.e. they are not in the files_exist list
-            files_to_add = list(set(path_details_list) - set(files_exist))
-            # use a bulk insert method for creating the files
-            for f in files_to_add:
-                file_ = self.catalog.create_file(
-                    transaction=transaction,
-                    user=f.user,
-                    group=f.group,
-                    original_path=f.original_path,
-                    path_type=f.path_type,
-                    link_path=f.link_path,
-                    size=f.size,
-                    file_permissions=f.permissions,
+            # remove any duplicates in the filelist itself
+            path_details_list = list(dict.fromkeys(path_details_list))
+            # insert the files, in one round-trip, letting the database detect the
+            # files that already exist in the holding via the unique
+            # (holding_id, path_hash) constraint - these are not returned
+            try:
+                created = self.catalog.create_files(
+                    transaction=transaction, filelist=path_details_list
                 )
-                files_to_commit.append(file_)
-            # self.catalog.create_files(transaction=transaction, filelist=files_to_add)
-            self.completelist.extend(files_to_add)
-
-            # Add any user tags to the holding
-            tag_warnings = self._create_tags(tags, holding, label)
-
-        # commit to DB
-        if len(files_to_commit) > 0:
-            self.catalog.bulk_commit(files_to_commit)
+            except CatalogError as e:
+                for pd in path_details_list:
+                    pd.failure_reason = e.message
+                self.failedlist.extend(path_details_list)
+                self.log(e.message, RK.LOG_ERROR)
+                self.catalog.session.rollback()
+            else:
+                for pd in path_details_list:
+                    if path_hash(pd.original_path) in created:
+                        self.completelist.append(pd)
+                    else:
+                        # fail the files that exist
+                        msg = "File already exists in holding."
+                        pd.failure_reason = msg
+                        self.failedlist.append(pd)
+                        self.log(msg, RK.LOG_ERROR)
+                self._deduplicate(group, tenancy)
+                # Add any user tags to the holding
+                tag_warnings = self._create_tags(tags, holding, label)
 
         self.catalog.commit()
 
@@ -796,6 +925,36 @@ class CatalogConsumer(RMQC):
                 warning=tag_warnings,
             )
 
+    def _deduplicate(self, group: str, tenancy: str) -> None:
+        """Point the files in the completelist that have the same contents as an
+        object the group has already uploaded to the tenancy at that object, so that
+        transfer_put does not upload them again.  The files are found by the
+        checksums calculated by the indexer, when deduplication is turned on.  The
+        NLDS never deletes objects from the Object Storage, so an object that is
+        shared by several Locations does not need to be reference counted."""
+        duplicates = self.catalog.find_duplicate_objects(
+            group, tenancy, self.completelist
+        )
+        if not duplicates:
+            return
+        for pd in self.completelist:
+            if pd.original_path in duplicates:
+                url_scheme, url_netloc, root, path = duplicates[pd.original_path]
+                pd.locations.add(
+                    PathLocation(
+                        storage_type=MSG.OBJECT_STORAGE,
+                        url_scheme=url_scheme,
+                        url_netloc=url_netloc,
+                        root=root,
+                        path=path,
+                    )
+                )
+        self.log(
+            f"{len(duplicates)} files are duplicates of objects already on "
+            f"{tenancy}, they will not be uploaded again",
+            RK.LOG_INFO,
+        )
+
     def _catalog_update(self, body: Dict, rk_origin: str, create: bool) -> None:
         """Upon completion of a TRANSFER_PUT, the list of completed files is returned
         back to the NLDS worker, but with location on Object Storage of the files
@@ -822,6 +981,8 @@ class CatalogConsumer(RMQC):
 
         # build a list of PathDetails from the input filelist
         path_details_list = [PathDetails.from_dict(f) for f in filelist]
+        # to look up the PathDetails of each File returned from the database
+        path_details_dict = {pd.original_path: pd for pd in path_details_list}
 
         # get all the files in the filelist as File objects from the database
         files = self.catalog.get_files_from_filelist(
@@ -832,10 +993,13 @@ class CatalogConsumer(RMQC):
 
         # loop over the filelist
         create_location_list = []
-        modify_location_list = []
+        # locations to modify, per storage type
+        modify_locations = {}
+        # checksums calculated by transfer_put, to store in one statement
+        checksums = []
         for f in files:
             # if path is a link then continue - no updating needed
-            pd = path_details_list[path_details_list.index(f)]
+            pd = path_details_dict[f.original_path]
             if f.path_type == PathType.LINK:
                 self.completelist.append(pd)
                 continue
@@ -886,19 +1050,20 @@ class CatalogConsumer(RMQC):
                                 f"{pl.storage_type} for file {pd.original_path} will be"
                                 f" overwritten, the Storage Location should be empty."
                             )
-                    # otherwise update if exists and not empty
-                    self.catalog.modify_location(
-                        location=location,
-                        url_scheme=pl.url_scheme,
-                        url_netloc=pl.url_netloc,
-                        root=pl.root,
-                        path=pl.path,
-                        access_time=access_time,
+                    # otherwise update if exists and not empty - add to the list to
+                    # update in one statement later
+                    modify_locations.setdefault(st, []).append(
+                        {
+                            "file_id": f.id,
+                            "url_scheme": pl.url_scheme,
+                            "url_netloc": pl.url_netloc,
+                            "root": pl.root,
+                            "path": pl.path,
+                            "access_time": access_time,
+                            "aggregation_id": None,
+                        }
                     )
-                    # defer update
-                    modify_location_list.append(location)
-                    self.catalog.defer(location)
-                    # mark as completed - assuming the bulk commit works correctly
+                    # mark as completed - assuming the bulk update works correctly
                     self.completelist.append(pd)
                 elif create:
                     # add to the list to bulk create later
@@ -924,12 +1089,24 @@ class CatalogConsumer(RMQC):
                 pd.failure_reason = e.message
                 self.failedlist.append(pd)
                 self.log(e.message, RK.LOG_ERROR)
+            else:
+                if pd.checksum:
+                    checksums.append(
+                        {
+                            "file_id": f.id,
+                            "checksum": pd.checksum,
+                            "algorithm": pd.checksum_algorithm,
+                        }
+                    )
 
-        # bulk upload the created locations
-        if len(create_location_list) != 0:
-            self.catalog.bulk_commit(create_location_list)
-        if len(modify_location_list) != 0:
-            self.catalog.bulk_commit(modify_location_list)
+        # bulk insert the created locations and bulk update the modified locations
+        try:
+            self.catalog.create_locations(create_location_list)
+            for st, locations in modify_locations.items():
+                self.catalog.update_locations(st, locations)
+            self.catalog.create_checksums(checksums)
+        except CatalogError as e:
+            self._fail_completelist(e.message)
         # any other commits
         self.catalog.commit()
 
@@ -973,7 +1150,8 @@ class CatalogConsumer(RMQC):
         # 2. Some files were found, but not others - fail the files that were not
         #    found but allow those found to continue
 
-        if result is None or result.count() == 0:
+        # the merged results of a query of more than one shard are a list
+        if result is None or (not isinstance(result, list) and result.count() == 0):
             err_msg = f"No matching files found"
             if holding_label:
                 err_msg += f" in holding with holding_label: {holding_label}"
@@ -1268,8 +1446,21 @@ class CatalogConsumer(RMQC):
             return
 
         # Get the next holding in the catalog, by id, which has any unarchived
-        # Files, i.e. any files which don't have a tape location
-        next_holding = self.catalog.get_next_unarchived_holding(tenancy)
+        # Files, i.e. any files which don't have a tape location.  The shards are
+        # searched in turn, starting with the one after the shard archived last
+        catalogs = list(self.shards.catalogs.values())
+        for _ in catalogs:
+            self.archive_shard = (self.archive_shard + 1) % len(catalogs)
+            self.catalog = catalogs[self.archive_shard]
+            try:
+                next_holding = self.catalog.get_next_unarchived_holding(
+                    tenancy, policy=self.archive_policy
+                )
+            except CatalogError as e:
+                self.log(e.message, RK.LOG_ERROR)
+                return
+            if next_holding:
+                break
 
         # If no holdings left to archive then end the callback
         if not next_holding:
@@ -1318,10 +1509,13 @@ class CatalogConsumer(RMQC):
                 self.failedlist.append(pd)
                 continue
 
-        # bulk commit the created_locations
-        if len(created_locations) > 0:
-            # bulk commit
-            self.catalog.bulk_commit(created_locations)
+        # bulk insert the created_locations
+        try:
+            self.catalog.create_locations(created_locations)
+        except CatalogError as e:
+            self.log(e.message, RK.LOG_ERROR)
+            self.catalog.session.rollback()
+            return
 
         # fallback commit
         self.catalog.commit()
@@ -1402,25 +1596,28 @@ class CatalogConsumer(RMQC):
 
         # build a list of PathDetails from the input filelist
         path_details_list = [PathDetails.from_dict(f) for f in filelist]
+        # to look up the PathDetails of each File returned from the database
+        path_details_dict = {pd.original_path: pd for pd in path_details_list}
 
         # get all the files in the filelist as File objects from the database
         # holding_id is not None, as confirmed by above check
         # need all the transactions for a holding, as files belong to a Transaction
         holding = self.catalog.get_holding(user, group, holding_id=holding_id)
+        # locations to modify, per storage type
+        modify_locations = {}
         for transaction in holding.transactions:
             files = self.catalog.get_files_from_filelist(
                 transaction_id=transaction.transaction_id,
                 filelist=path_details_list,
                 with_for_update=True,
             )
-            modify_location_list = []
             # we now have a list of all the files in a transaction that is part of a
             # holding
             for f in files:
                 try:
                     # this gets the original path_details from the list as the DB return
                     # might be out of order
-                    pd = path_details_list[path_details_list.index(f)]
+                    pd = path_details_dict[f.original_path]
                     pl = pd.get_tape()
                     # recreate the path location if it was deleted
                     if pl is None:
@@ -1432,12 +1629,12 @@ class CatalogConsumer(RMQC):
                     # input storage type
                     st = Storage.from_str(pl.storage_type)
 
-                    if len(f.locations) != 0:
-                        # modify location - get it first via loop on locations
-                        for l in f.locations:
-                            if l.storage_type == st:
-                                location = l
-                                break
+                    # check the location to update exists
+                    if not any(l.storage_type == st for l in f.locations):
+                        raise CatalogError(
+                            f"{pl.storage_type} for file {pd.original_path} can not "
+                            "be found."
+                        )
 
                     # set access time to now if no access time set in PathLocation
                     if pl.access_time is None:
@@ -1445,17 +1642,17 @@ class CatalogConsumer(RMQC):
                     else:
                         access_time = datetime.fromtimestamp(pl.access_time)
 
-                    self.catalog.modify_location(
-                        location,
-                        url_scheme=pl.url_scheme,
-                        url_netloc=pl.url_netloc,
-                        root=pl.root,
-                        path=pl.path,
-                        access_time=access_time,
-                        aggregation_id=aggregation.id,
+                    modify_locations.setdefault(st, []).append(
+                        {
+                            "file_id": f.id,
+                            "url_scheme": pl.url_scheme,
+                            "url_netloc": pl.url_netloc,
+                            "root": pl.root,
+                            "path": pl.path,
+                            "access_time": access_time,
+                            "aggregation_id": aggregation.id,
+                        }
                     )
-                    modify_location_list.append(location)
-                    self.catalog.defer(location)
                     self.completelist.append(pd)
 
                 except CatalogError as e:
@@ -1465,10 +1662,13 @@ class CatalogConsumer(RMQC):
                     self.log(e.message, RK.LOG_ERROR)
                     continue
 
-            # commit when all files complete - do a bulk commit of the transactions
-            # modifications followed by a safety commit later
-            if len(modify_location_list) > 0:
-                self.catalog.bulk_commit(modify_location_list)
+        # update the locations in one statement per storage type, followed by a
+        # safety commit
+        try:
+            for st, locations in modify_locations.items():
+                self.catalog.update_locations(st, locations)
+        except CatalogError as e:
+            self._fail_completelist(e.message)
 
         self.catalog.commit()
 
@@ -1539,36 +1739,41 @@ class CatalogConsumer(RMQC):
                 f.failure_reason = e.message
                 self.failedlist.append(f)
         else:
-            for f in filelist:
-                try:
-                    file = self.catalog.get_file(
-                        holding_id=holding_id,
-                        original_path=f.original_path,
-                        with_for_update=True,
-                    )
-                    loc = self.catalog.get_location(
-                        file, storage_type, with_for_update=True
+            try:
+                # get the file ids and delete the empty locations in one statement
+                file_ids = self.catalog.get_file_ids(
+                    holding.id, [f.original_path for f in filelist]
+                )
+                deleted = set(
+                    self.catalog.delete_locations(
+                        storage_type, file_ids.values(), empty_only=True
                     )
-                    # delete location if all details are empty
-                    if loc is not None and loc.storage_type == storage_type:
-                        if (
-                            loc.url_scheme == ""
-                            and loc.url_netloc == ""
-                            and loc.root == ""
-                        ):
-                            self.catalog.delete_location(file, storage_type)
-                            self.completelist.append(f)
-                        else:
-                            f.failure_reason = (
-                                f"{str(storage_type.name)} location not empty details"
-                            )
-                            self.failedlist.append(f)
-
-                except (CatalogError, IndexError) as e:
+                )
+            except CatalogError as e:
+                self.catalog.session.rollback()
+                for f in filelist:
                     f.failure_reason = e.message
                     self.failedlist.append(f)
-            # commit
-            self.catalog.commit()
+            else:
+                for f in filelist:
+                    file_id = file_ids.get(f.original_path)
+                    if file_id is None:
+                        f.failure_reason = (
+                            f"File with original_path:{f.original_path} not found in "
+                            f"holding with holding_id:{holding.id}"
+                        )
+                        self.failedlist.append(f)
+                    elif file_id in deleted:
+                        self.completelist.append(f)
+                    else:
+                        # delete location only if all details are empty
+                        f.failure_reason = (
+                            f"{str(storage_type.name)} location not found or not "
+                            "empty details"
+                        )
+                        self.failedlist.append(f)
+                # commit
+                self.catalog.commit()
 
         if len(self.completelist) > 0:
             self.log(f"Sending completed PathList from CATALOG_REMOVE ", RK.LOG_INFO)
@@ -1614,24 +1819,36 @@ class CatalogConsumer(RMQC):
             )
             # TODO: what happens in this event?
 
-        for f in filelist:
-            file_details = PathDetails.from_dict(f)
-            try:
-                # outsource deleting to the catalog itself
+        path_details_list = [PathDetails.from_dict(f) for f in filelist]
+        try:
+            # outsource deleting to the catalog itself - this deletes all of the files
+            # with a few set-based statements
+            deleted = set(
                 self.catalog.delete_files(
                     user,
                     group,
                     holding_label=holding_label,
                     holding_id=holding_id,
                     transaction_id=transaction_id,
-                    path=file_details.original_path,
+                    filelist=path_details_list,
                     tag=holding_tag,
                 )
-            except CatalogError as e:
+            )
+        except CatalogError as e:
+            self.catalog.session.rollback()
+            self.log(e.message, RK.LOG_ERROR)
+            for file_details in path_details_list:
                 file_details.failure_reason = e.message
                 self.failedlist.append(file_details)
-                self.log(e.message, RK.LOG_ERROR)
-                continue
+        else:
+            for file_details in path_details_list:
+                if file_details.original_path not in deleted:
+                    file_details.failure_reason = (
+                        f"File with original_path:{file_details.original_path} "
+                        "could not be found in the catalog"
+                    )
+                    self.failedlist.append(file_details)
+                    self.log(file_details.failure_reason, RK.LOG_ERROR)
         self.catalog.commit()
 
         # log the successful and non-successful catalog dels
@@ -1683,7 +1900,7 @@ class CatalogConsumer(RMQC):
         # holding_label and holding_id is None means that more than one
         # holding wil be returned
         try:
-            holdings = self.catalog.get_holdings(
+            holdings = self.shards.get_holdings(
                 query_user,
                 query_group,
                 groupall=groupall,
@@ -1717,6 +1934,7 @@ class CatalogConsumer(RMQC):
                     "tags": h.get_tags(),
                     "transactions": h.get_transaction_ids(),
                     "date": date_str,
+                    "usage": h.get_usage(),
                 }
                 ret_list.append(ret_dict)
             # add the return list to successfully completed holding listings
@@ -1749,20 +1967,37 @@ class CatalogConsumer(RMQC):
         # Get transactions from catalog using transaction_ids from monitoring
         ret_dict = {}
         try:
-            # Get the transaction and holding for each transaction_record
+            # Get the (shard, holding) of each transaction_record - from the cache,
+            # or with one query per shard for all the transactions not in the cache.
+            # The cache only saves the queries: it may be disabled, or smaller than
+            # the list, so the results are kept in holding_ids.
+            transaction_ids = [tr["transaction_id"] for tr in transaction_records]
+            holding_ids = {}
+            for t_id in transaction_ids:
+                cached = self.transaction_cache.get(t_id)
+                if cached is not None:
+                    holding_ids[t_id] = cached
+            shards = self.shards.route(group)
+            for shard, catalog in shards.items():
+                uncached = [t for t in transaction_ids if t not in holding_ids]
+                for t_id, h_id in catalog.get_transaction_holding_ids(uncached).items():
+                    holding_ids[t_id] = (shard, h_id)
+                    self.transaction_cache.put(t_id, (shard, h_id))
+            # the labels can be changed, so always get them from the catalog
+            labels = {}
+            for shard, catalog in shards.items():
+                shard_labels = catalog.get_holding_labels(
+                    user,
+                    group,
+                    set(h[1] for h in holding_ids.values() if h and h[0] == shard),
+                )
+                labels.update({(shard, h): l for h, l in shard_labels.items()})
             for tr in transaction_records:
                 transaction_id = tr["transaction_id"]
                 # A transaction_id might not have an associated holding in
                 # the catalog if the transaction FAILED or has not COMPLETED
                 # yet.  We allow for this and return an empty string instead.
-                try:
-                    h = self.catalog.get_holding(
-                        user, group, groupall=groupall, transaction_id=transaction_id
-                    )
-                    label = h.label
-                except CatalogError:
-                    # just return a blank label
-                    label = ""
+                label = labels.get(holding_ids.get(transaction_id), "")
                 ret_dict[transaction_id] = label
 
                 # Add label to the transaction_record dict
@@ -1815,7 +2050,7 @@ class CatalogConsumer(RMQC):
 
         ret_dict = {}
         try:
-            query_result = self.catalog.get_files(
+            query_result = self.shards.get_files(
                 query_user,
                 query_group,
                 groupall=groupall,
@@ -1958,6 +2193,8 @@ class CatalogConsumer(RMQC):
                     "new_meta": new_meta,
                 }
                 ret_list.append(ret_dict)
+                if new_label is not None:
+                    self._send_relabel(body, holding)
             self.catalog.commit()
 
         except CatalogError as e:
@@ -1979,40 +2216,125 @@ class CatalogConsumer(RMQC):
             correlation_id=properties.correlation_id,
         )
 
+    def _send_relabel(self, body: Dict, holding) -> None:
+        """Tell the monitor that a holding has been relabelled, so that it can update
+        the label it stores for the holding's transactions"""
+        msg_dict = {
+            MSG.DETAILS: {
+                MSG.USER: body[MSG.DETAILS][MSG.USER],
+                MSG.GROUP: holding.group,
+                MSG.API_ACTION: RK.META,
+                MSG.HOLDING_ID: holding.id,
+                MSG.LABEL: holding.label,
+            },
+            MSG.DATA: {},
+            MSG.TYPE: MSG.TYPE_STANDARD,
+        }
+        self.publish_message(
+            f"{RK.ROOT}.{RK.MONITOR_PUT}.{RK.START}", msg_dict=msg_dict
+        )
+
+    def _get_shard_config(self) -> dict[str, dict]:
+        """The database settings of each shard, keyed by shard name.  An unsharded
+        catalog has one shard, named None, with the top-level database settings."""
+        top_level = {
+            self._DB_ENGINE: self.load_config_value(self._DB_ENGINE),
+            self._DB_OPTIONS: self.load_config_value(self._DB_OPTIONS),
+            self._DB_READ_OPTIONS: self.load_config_value(self._DB_READ_OPTIONS),
+        }
+        shards = self.load_config_value(self._SHARDS)
+        if not shards:
+            return {None: top_level}
+        # the shards use the top-level db_engine if they do not set their own
+        return {
+            shard: {
+                self._DB_ENGINE: config.get(
+                    self._DB_ENGINE, top_level[self._DB_ENGINE]
+                ),
+                self._DB_OPTIONS: config[self._DB_OPTIONS],
+                self._DB_READ_OPTIONS: config.get(self._DB_READ_OPTIONS),
+            }
+            for shard, config in shards.items()
+        }
+
     def attach_database(self, create_db_fl: bool = True):
-        """Attach the Catalog to the consumer"""
+        """Attach the Catalog, or the Catalog of each shard, to the consumer"""
         # Load config options or fall back to default values.
-        db_engine = self.load_config_value(self._DB_ENGINE)
-        db_options = self.load_config_value(self._DB_OPTIONS)
-        self.catalog = Catalog(db_engine, db_options)
+        identity_cache_size = self.load_config_value(self._IDENTITY_CACHE_SIZE)
+        catalogs = {
+            shard: Catalog(
+                config[self._DB_ENGINE],
+                config[self._DB_OPTIONS],
+                config[self._DB_READ_OPTIONS],
+                identity_cache_size,
+            )
+            for shard, config in self._get_shard_config().items()
+        }
+        self._shards = CatalogShards(
+            catalogs,
+            self.load_config_value(self._SHARD_ROUTING),
+            self.load_config_value(self._DEFAULT_SHARD),
+        )
+        self.catalog = catalogs[self._shards.default_shard]
 
-        try:
-            db_connect = self.catalog.connect(create_db_fl=create_db_fl)
-            if create_db_fl:
-                self.log(f"db_connect string is {db_connect}", RK.LOG_DEBUG)
-        except DBError as e:
-            self.log(e.message, RK.LOG_CRITICAL)
+        # a read-only worker should leave the creation of the database to the
+        # read-write workers
+        if self.read_only:
+            create_db_fl = False
+
+        for shard, catalog in catalogs.items():
+            try:
+                db_connect = catalog.connect(create_db_fl=create_db_fl)
+                if create_db_fl:
+                    self.log(f"db_connect string is {db_connect}", RK.LOG_DEBUG)
+            except DBError as e:
+                self.log(e.message, RK.LOG_CRITICAL)
 
         # start a session - use it globally to minimise DB connections
-        self.catalog.start_session()
+        self._shards.start_session()
 
     def detach_database(self):
-        self.catalog.session.rollback()
+        self.shards.rollback()
         # end the session
-        self.catalog.end_session()
+        self.shards.end_session()
+
+    def end_callback(self):
+        """Finish the unit-of-work for the message by clearing the session, so that
+        the ORM objects loaded while processing it do not accumulate."""
+        if self.catalog is None:
+            return
+        for shard, catalog in self.shards.catalogs.items():
+            if catalog.recycle_session(self.session_recycle_count):
+                shard_str = "" if shard is None else f" of shard {shard}"
+                self.log(
+                    f"Recycled database session{shard_str} after "
+                    f"{catalog.message_count} messages, RSS is "
+                    f"{get_rss() // 1024**2}MB, identity cache hit rate is "
+                    f"{catalog.identity_cache.hit_rate:.1%}, transaction cache hit "
+                    f"rate is {self.transaction_cache.hit_rate:.1%}",
+                    RK.LOG_INFO,
+                )
 
     def get_engine(self):
         # Method for making the db_engine available to alembic
         return self.database.db_engine
 
-    def get_url(self):
-        """Method for making the sqlalchemy url available to alembic"""
+    def get_url(self, shard: str = None):
+        """Method for making the sqlalchemy url available to alembic.  The url is
+        that of the shard, if the catalog is sharded, or of the default shard if it
+        is not given."""
         # Create a minimum version of the catalog to put together a url
-        if self.catalog is None:
-            db_engine = self.load_config_value(self._DB_ENGINE)
-            db_options = self.load_config_value(self._DB_OPTIONS)
-            self.catalog = Catalog(db_engine, db_options)
-        return self.catalog.get_db_string()
+        shards = self._get_shard_config()
+        if shard is None:
+            shard = self.load_config_value(self._DEFAULT_SHARD)
+        if shard is None:
+            shard = next(iter(shards))
+        if shard not in shards:
+            raise CatalogError(f"Unknown catalog shard {shard}")
+        catalog = Catalog(
+            shards[shard][self._DB_ENGINE], shards[shard][self._DB_OPTIONS]
+        )
+        return catalog.get_db_string()
 
     def callback(
         self,
@@ -2044,6 +2366,9 @@ class CatalogConsumer(RMQC):
         if self._is_system_status_check(body_json=body, properties=properties):
             return
 
+        # use the catalog of the shard that the group's holdings are stored in
+        self.catalog = self.shards.catalog(body[MSG.DETAILS].get(MSG.GROUP))
+
         # Only print the message contents when we're not statting, the message
         # can get very long.
         if not api_method == RK.STAT:
@@ -2060,6 +2385,15 @@ class CatalogConsumer(RMQC):
         )
         body = self.append_route_info(body)
 
+        # a read-only worker only services the RPC methods
+        if self.read_only and api_method not in self.READ_ONLY_WORKER_API_ACTIONS:
+            self.log(
+                f"Read-only catalog worker cannot process api_action {api_method}, "
+                "exiting callback",
+                RK.LOG_ERROR,
+            )
+            return
+
         # check whether this is a GET or a PUT
         if api_method in (RK.GETLIST, RK.GET):
             # split the routing key
@@ -2124,17 +2458,22 @@ class CatalogConsumer(RMQC):
                 self._catalog_remove(body, rk_parts[0], Storage.TAPE)
 
         # RPC methods follow - don't need to split any routing key for an RPC method
+        # the read-only methods use the read engine, so that a heavy query does not
+        # hold a connection on, or block, the write database
         elif api_method == RK.LIST:
-            self._catalog_list(body, properties)
+            with self.shards.read_session(self._get_query_group(body)):
+                self._catalog_list(body, properties)
 
         elif api_method == RK.FIND:
-            self._catalog_find(body, properties)
+            with self.shards.read_session(self._get_query_group(body)):
+                self._catalog_find(body, properties)
 
         elif api_method == RK.META:
             self._catalog_meta(body, properties)
 
         elif api_method == RK.STAT:
-            self._catalog_stat(body, properties)
+            with self.shards.read_session(body[MSG.DETAILS].get(MSG.GROUP)):
+                self._catalog_stat(body, properties)
 
 
 def main():
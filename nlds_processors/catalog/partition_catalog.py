@@ -0,0 +1,299 @@
+# encoding: utf-8
+"""
+partition_catalog.py
+Partition the file and location tables of a PostgreSQL catalog database by range of
+holding id, and create the partitions for future holdings.  Holding ids increase
+monotonically, so each partition holds the files (and their locations) of a block of
+consecutive holdings, i.e. of the holdings created in a period of time.  Vacuuming,
+index rebuilds and the queries for a single holding then only touch one partition,
+rather than the whole table.
+
+Run with --convert once, during a maintenance window, to convert the existing
+(unpartitioned) tables.  This copies every row, so it takes some time on a large
+catalog.  After that, run it periodically, e.g. as a cronjob, to keep --ahead
+partitions ahead of the newest holding.  Files of holdings beyond the last partition
+are stored in a default partition, and a partition cannot be created for their range
+of holding ids until they are removed, so the cronjob should run often enough that
+this does not happen.
+
+The catalog works unpartitioned on every database engine, partitioning is only
+supported on PostgreSQL.
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import re
+
+import click
+from sqlalchemy import Connection, inspect, text
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_error import CatalogError
+from nlds_processors.catalog.catalog_worker import CatalogConsumer
+from nlds_processors.db_mixin import DBError
+
+# the partitioned tables, in the order they are converted.  Both are partitioned
+# on their holding_id column
+PARTITIONED_TABLES = ("file", "location")
+PARTITION_KEY = "holding_id"
+# foreign keys to the file table, which have to include the partition key, these
+# are (re)created after the tables are converted.  The checksum table has no holding
+# id, so its foreign key to the file table is dropped
+FILE_FOREIGN_KEYS = {
+    "fk_location_file": ("location", ""),
+    "fk_archive_backlog_file": ("archive_backlog", " ON DELETE CASCADE"),
+}
+# number of holdings in each partition
+DEFAULT_INTERVAL = 100000
+# number of empty partitions to create beyond the newest holding
+DEFAULT_AHEAD = 2
+
+
+def partition_name(table: str, lower: int) -> str:
+    return f"{table}_p{lower}"
+
+
+def partition_ranges(
+    lower: int, max_holding_id: int, interval: int, ahead: int
+) -> list[tuple[int, int]]:
+    """The (lower, upper) holding id ranges of the partitions to create, starting at
+    lower (the upper bound of the last existing partition), so that there are at
+    least ahead partitions beyond the one containing max_holding_id"""
+    if interval <= 0:
+        raise CatalogError(f"Partition interval must be positive, not {interval}")
+    ranges = []
+    while lower <= max_holding_id + ahead * interval:
+        ranges.append((lower, lower + interval))
+        lower += interval
+    return ranges
+
+
+def create_partition_sql(table: str, lower: int, upper: int) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, lower)} "
+        f"PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})"
+    )
+
+
+def _check_postgresql(conn: Connection) -> None:
+    if conn.dialect.name != "postgresql":
+        raise CatalogError(
+            f"Partitioning is only supported on PostgreSQL, not {conn.dialect.name}"
+        )
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    _check_postgresql(conn)
+    relkind = conn.execute(
+        text(
+            "SELECT relkind FROM pg_class "
+            "WHERE relname = :table AND pg_table_is_visible(oid)"
+        ),
+        {"table": table},
+    ).scalar()
+    return relkind == "p"
+
+
+def partition_upper_bound(conn: Connection, table: str) -> int:
+    """The upper bound of the last range partition of the table, or 0 if the table
+    has no range partitions"""
+    _check_postgresql(conn)
+    bounds = conn.execute(
+        text(
+            "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+        ),
+        {"table": table},
+    ).scalars()
+    upper = 0
+    for bound in bounds:
+        # e.g. FOR VALUES FROM (0) TO (100000), or DEFAULT
+        match = re.search(r"TO \('?(\d+)'?\)", bound)
+        if match:
+            upper = max(upper, int(match.group(1)))
+    return upper
+
+
+def _max_holding_id(conn: Connection) -> int:
+    return conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM holding")).scalar()
+
+
+def create_partitions(
+    conn: Connection,
+    table: str,
+    interval: int = DEFAULT_INTERVAL,
+    ahead: int = DEFAULT_AHEAD,
+) -> list[str]:
+    """Create the partitions of the (partitioned) table needed for there to be
+    ahead empty partitions beyond the newest holding.  Returns the names of the
+    partitions created."""
+    if not is_partitioned(conn, table):
+        raise CatalogError(
+            f"Table {table} is not partitioned, run partition_catalog with --convert"
+        )
+    ranges = partition_ranges(
+        partition_upper_bound(conn, table), _max_holding_id(conn), interval, ahead
+    )
+    for lower, upper in ranges:
+        conn.execute(text(create_partition_sql(table, lower, upper)))
+    return [partition_name(table, lower) for lower, _ in ranges]
+
+
+def convert_table(
+    conn: Connection,
+    table: str,
+    interval: int = DEFAULT_INTERVAL,
+    ahead: int = DEFAULT_AHEAD,
+) -> None:
+    """Convert an unpartitioned table into one partitioned by range of holding id,
+    with the same columns, indexes and constraints.  Unique indexes and constraints
+    have the partition key added to them, as PostgreSQL requires.  Foreign keys to
+    the table are dropped, the ones to the file table are recreated by
+    add_file_foreign_keys."""
+    _check_postgresql(conn)
+    if is_partitioned(conn, table):
+        raise CatalogError(f"Table {table} is already partitioned")
+    inspector = inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns(table)]
+    if PARTITION_KEY not in columns:
+        raise CatalogError(
+            f"Table {table} does not have a {PARTITION_KEY} column, upgrade the "
+            "database with alembic before partitioning it"
+        )
+    indexes = [
+        i for i in inspector.get_indexes(table) if "duplicates_constraint" not in i
+    ]
+    uniques = inspector.get_unique_constraints(table)
+    foreign_keys = [
+        fk for fk in inspector.get_foreign_keys(table) if fk["referred_table"] != "file"
+    ]
+    sequence = conn.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}
+    ).scalar()
+    old_table = f"{table}_unpartitioned"
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {old_table}"))
+    conn.execute(
+        text(
+            f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {PARTITION_KEY} SET NOT NULL"))
+    if sequence is not None:
+        # otherwise the sequence would be dropped with the old table
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    max_holding_id = _max_holding_id(conn)
+    for lower, upper in partition_ranges(0, max_holding_id, interval, ahead):
+        conn.execute(text(create_partition_sql(table, lower, upper)))
+    conn.execute(text(f"INSERT INTO {table} SELECT * FROM {old_table}"))
+    conn.execute(text(f"DROP TABLE {old_table} CASCADE"))
+
+    # the indexes and constraints are created after the rows are copied, as this is
+    # quicker than updating them for every row
+    conn.execute(
+        text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey "
+            f"PRIMARY KEY (id, {PARTITION_KEY})"
+        )
+    )
+    for uq in uniques:
+        cols = uq["column_names"]
+        if PARTITION_KEY not in cols:
+            cols = cols + [PARTITION_KEY]
+        conn.execute(
+            text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {uq['name']} "
+                f"UNIQUE ({', '.join(cols)})"
+            )
+        )
+    for ix in indexes:
+        cols = ix["column_names"]
+        unique = ""
+        if ix["unique"]:
+            unique = "UNIQUE "
+            if PARTITION_KEY not in cols:
+                cols = cols + [PARTITION_KEY]
+        conn.execute(
+            text(f"CREATE {unique}INDEX {ix['name']} ON {table} ({', '.join(cols)})")
+        )
+    for fk in foreign_keys:
+        conn.execute(
+            text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {fk['name']} FOREIGN KEY "
+                f"({', '.join(fk['constrained_columns'])}) REFERENCES "
+                f"{fk['referred_table']} ({', '.join(fk['referred_columns'])})"
+            )
+        )
+    conn.execute(text(f"ANALYZE {table}"))
+
+
+def add_file_foreign_keys(conn: Connection) -> None:
+    """Add the foreign keys to the partitioned file table, on (id, holding_id)"""
+    _check_postgresql(conn)
+    for name, (table, on_delete) in FILE_FOREIGN_KEYS.items():
+        conn.execute(
+            text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY "
+                f"(file_id, {PARTITION_KEY}) REFERENCES file (id, {PARTITION_KEY})"
+                f"{on_delete}"
+            )
+        )
+
+
+@click.command()
+@click.option(
+    "--convert",
+    is_flag=True,
+    help="Convert the unpartitioned file and location tables to partitioned tables.",
+)
+@click.option(
+    "--interval",
+    default=DEFAULT_INTERVAL,
+    show_default=True,
+    help="Number of holdings in each partition.",
+)
+@click.option(
+    "--ahead",
+    default=DEFAULT_AHEAD,
+    show_default=True,
+    help="Number of partitions to create beyond the newest holding.",
+)
+def partition_catalog(convert: bool, interval: int, ahead: int):
+    # use the catalog_q config from the server config file
+    consumer = CatalogConsumer()
+    db_engine = consumer.load_config_value(consumer._DB_ENGINE)
+    db_options = consumer.load_config_value(consumer._DB_OPTIONS)
+    catalog = Catalog(db_engine, db_options)
+    created = []
+    try:
+        catalog.connect(create_db_fl=False)
+        catalog.start_session()
+        conn = catalog.session.connection()
+        if convert:
+            for table in PARTITIONED_TABLES:
+                convert_table(conn, table, interval, ahead)
+            add_file_foreign_keys(conn)
+        for table in PARTITIONED_TABLES:
+            created.extend(create_partitions(conn, table, interval, ahead))
+        catalog.commit()
+    except (DBError, CatalogError) as e:
+        if catalog.session is not None:
+            catalog.session.rollback()
+        raise click.ClickException(e.message)
+    finally:
+        catalog.end_session()
+    if convert:
+        click.echo(f"Partitioned tables: {', '.join(PARTITIONED_TABLES)}.")
+    click.echo(f"Created partitions: {', '.join(created) or 'none'}.")
+
+
+if __name__ == "__main__":
+    partition_catalog()
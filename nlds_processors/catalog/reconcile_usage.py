@@ -0,0 +1,47 @@
+# encoding: utf-8
+"""
+reconcile_usage.py
+Recalculate the usage aggregates (file count, total size, object store size and tape
+size) of every holding and group in the catalog from the file and location tables.
+The aggregates are maintained incrementally by the catalog worker, this corrects any
+drift and populates them for an existing catalog.  It should be run periodically,
+e.g. as a cronjob.
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import click
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_error import CatalogError
+from nlds_processors.catalog.catalog_worker import CatalogConsumer
+from nlds_processors.db_mixin import DBError
+
+
+@click.command()
+def reconcile_catalog_usage():
+    # use the catalog_q config from the server config file
+    consumer = CatalogConsumer()
+    db_engine = consumer.load_config_value(consumer._DB_ENGINE)
+    db_options = consumer.load_config_value(consumer._DB_OPTIONS)
+    catalog = Catalog(db_engine, db_options)
+    try:
+        catalog.connect(create_db_fl=False)
+        catalog.start_session()
+        catalog.reconcile_usage()
+        catalog.commit()
+    except (DBError, CatalogError) as e:
+        if catalog.session is not None:
+            catalog.session.rollback()
+        raise click.ClickException(e.message)
+    finally:
+        catalog.end_session()
+    click.echo("Usage aggregates reconciled.")
+
+
+if __name__ == "__main__":
+    reconcile_catalog_usage()
@@ -9,8 +9,11 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
-from sqlalchemy.exc import ArgumentError, IntegrityError
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy.exc import ArgumentError, IntegrityError, DataError
+from sqlalchemy import create_engine, insert, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy_utils import database_exists, create_database
 from sqlalchemy.orm import Session
 from nlds.errors import MessageError
@@ -23,21 +26,56 @@ class DBError(MessageError):
 class DBMixin:
     """Mixin refactored from monitor and catalog classes"""
 
-    def get_db_string(self):
+    # connection pool options that can be set in the db_options, these are only
+    # passed to engines that use a QueuePool (i.e. not SQLite)
+    POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle")
+
+    def get_db_string(self, db_options: dict = None):
+        # use the (write) db_options if no others are supplied
+        if db_options is None:
+            db_options = self.db_options
         # create the connection string with the engine
         db_connect = self.db_engine_str + "://"
         # add user if defined
-        if len(self.db_options["db_user"]) > 0:
-            db_connect += self.db_options["db_user"]
+        if len(db_options["db_user"]) > 0:
+            db_connect += db_options["db_user"]
             # add password if defined
-            if len(self.db_options["db_passwd"]) > 0:
-                db_connect += ":" + self.db_options["db_passwd"]
+            if len(db_options["db_passwd"]) > 0:
+                db_connect += ":" + db_options["db_passwd"]
             # add @ symbol
             db_connect += "@"
         # add the database name
-        db_connect += self.db_options["db_name"]
+        db_connect += db_options["db_name"]
         return db_connect
 
+    def get_db_read_options(self) -> dict:
+        """Get the options for the read engine.  These are the db_read_options, with
+        any missing keys taken from the (write) db_options.  Returns None if no
+        db_read_options have been set, in which case reads use the write engine."""
+        db_read_options = getattr(self, "db_read_options", None)
+        if not db_read_options:
+            return None
+        return self.db_options | db_read_options
+
+    def _get_pool_kwargs(self, db_options: dict) -> dict:
+        # SQLite uses a SingletonThreadPool / NullPool which do not accept the
+        # sizing arguments
+        if self.db_engine_str.startswith("sqlite"):
+            return {}
+        return {k: db_options[k] for k in self.POOL_OPTIONS if k in db_options}
+
+    def _create_engine(self, db_connect: str, db_options: dict):
+        try:
+            engine = create_engine(
+                db_connect,
+                echo=db_options["echo"],
+                future=True,
+                **self._get_pool_kwargs(db_options),
+            )
+        except (ArgumentError, TypeError) as e:
+            raise DBError("Could not create database engine")
+        return engine
+
     def connect(self, create_db_fl: bool = True):
         # connect to the database using the information in the config
         # get the database connection string
@@ -46,14 +84,21 @@ class DBMixin:
 
         # indicate database not connected yet
         self.db_engine = None
+        self.db_read_engine = None
+        # number of messages processed, see recycle_session
+        self.message_count = 0
 
         # connect to the database
-        try:
-            self.db_engine = create_engine(
-                db_connect, echo=self.db_options["echo"], future=True
-            )
-        except ArgumentError as e:
-            raise DBError("Could not create database engine")
+        self.db_engine = self._create_engine(db_connect, self.db_options)
+
+        # connect to the read database (e.g. a replica), if one is configured,
+        # otherwise reads share the write engine
+        db_read_options = self.get_db_read_options()
+        if db_read_options is None:
+            self.db_read_engine = self.db_engine
+        else:
+            db_read_connect = self.get_db_string(db_read_options)
+            self.db_read_engine = self._create_engine(db_read_connect, db_read_options)
 
         # create the db if not already created and flag permits
         if create_db_fl:
@@ -73,9 +118,55 @@ class DBMixin:
             # The only way there can be is if there was some error and it wasn't
             # properly finished. We can (probably) just roll it back.
             self.session.rollback()
+            # close it as well, to release its connection and its identity map
+            self.session.close()
             self.session = None
         self.session = Session(bind=self.db_engine, future=True)
 
+    def recycle_session(self, recycle_count: int = 0) -> bool:
+        """Finish the unit-of-work for one message.  Anything left uncommitted is
+        rolled back and all the ORM objects are expunged from the session, so that
+        the results of large queries (e.g. get_files) are not kept alive in the
+        identity map between messages.  Every recycle_count messages the session is
+        closed and a new one started.  A recycle_count of 0 never closes the session.
+        Returns True if the session was recycled."""
+        if self.session is None:
+            return False
+        self.session.rollback()
+        self.session.expunge_all()
+        self.message_count += 1
+        if recycle_count > 0 and self.message_count % recycle_count == 0:
+            self.start_session()
+            return True
+        return False
+
+    @property
+    def identity_map_size(self) -> int:
+        """Number of ORM objects currently held by the session"""
+        if self.session is None:
+            return 0
+        return len(self.session.identity_map)
+
+    @contextmanager
+    def read_session(self):
+        """Temporarily swap self.session for a session bound to the read engine, so
+        that read-only queries do not hold connections (or locks) on the write
+        database.  If no separate read engine is configured then the current session
+        is used unchanged."""
+        read_engine = getattr(self, "db_read_engine", None)
+        if read_engine is None or read_engine is self.db_engine:
+            yield self.session
+            return
+        write_session = self.session
+        self.session = Session(bind=read_engine, future=True)
+        try:
+            yield self.session
+        finally:
+            # nothing should have been written, so rollback to release the connection
+            self.session.rollback()
+            self.session.close()
+            self.session = write_session
+
     def end_session(self):
         """Close the SQL alchemy session"""
         if self.session is not None:
@@ -96,13 +187,140 @@ class DBMixin:
         """Commit a load of transactions at once"""
         try:
             self.session.bulk_save_objects(db_objects)
-        except (IntegrityError, KeyError):
-            # generate a decent error message
-            original_paths = []
-            for d in db_objects:
-                original_paths.append(l["path_details"].original_path)
-            raise CatalogError(
-                f"Files in filelist with original paths: {original_paths} could not be "
-                "added to the database"
+        except (IntegrityError, KeyError) as e:
+            raise DBError(
+                f"{len(db_objects)} objects could not be added to the database, "
+                f"reason: {e}"
             )
         return
+
+    def _can_copy(self, table, columns) -> bool:
+        """COPY FROM STDIN can be used on PostgreSQL with the psycopg (3) driver, as
+        long as none of the columns left out of the rows has a client-side default,
+        as these are not applied by COPY."""
+        dialect = self.session.get_bind().dialect
+        if dialect.name != "postgresql" or dialect.driver != "psycopg":
+            return False
+        for c in table.columns:
+            if c.key not in columns and c.default is not None:
+                return False
+        return True
+
+    def _copy_insert(self, table, rows: list[dict]) -> None:
+        """Stream the rows into the table with COPY FROM STDIN, on the same
+        connection (and so in the same transaction) as the session."""
+        dialect = self.session.get_bind().dialect
+        preparer = dialect.identifier_preparer
+        columns = [table.c[k] for k in rows[0].keys()]
+        # convert the values (e.g. Enums) in the same way as an INSERT would
+        processors = [c.type.bind_processor(dialect) for c in columns]
+        column_names = ", ".join(preparer.quote(c.name) for c in columns)
+        copy_sql = f"COPY {preparer.format_table(table)} ({column_names}) FROM STDIN"
+        dbapi_connection = self.session.connection().connection.dbapi_connection
+        try:
+            with dbapi_connection.cursor() as cursor:
+                with cursor.copy(copy_sql) as copy:
+                    for row in rows:
+                        copy.write_row(
+                            [
+                                p(row[c.key]) if p else row[c.key]
+                                for c, p in zip(columns, processors)
+                            ]
+                        )
+        except dialect.loaded_dbapi.Error as e:
+            # the psycopg errors (e.g. UniqueViolation) are raised directly, rather
+            # than wrapped in the SQLAlchemy IntegrityError / DataError
+            raise DBError(
+                f"{len(rows)} rows could not be copied into {table.name}, reason: {e}"
+            )
+
+    def bulk_insert(self, table, rows: list[dict], returning: bool = False) -> list:
+        """Insert a list of rows (dictionaries keyed on column name) into a table,
+        in the session's transaction.  This uses the SQLAlchemy Core executemany,
+        rather than the ORM unit-of-work, so no ORM objects are created.
+        If returning is True then the generated ids are returned, in the same order
+        as the rows.  Otherwise, on PostgreSQL, the rows are streamed in with COPY,
+        which is faster still."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if len(rows) == 0:
+            return []
+        # accept ORM models as well as Tables
+        table = getattr(table, "__table__", table)
+        try:
+            if returning:
+                stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+                return self.session.execute(stmt, rows).scalars().all()
+            if self._can_copy(table, rows[0].keys()):
+                self._copy_insert(table, rows)
+            else:
+                self.session.execute(insert(table), rows)
+        except (IntegrityError, DataError) as e:
+            raise DBError(
+                f"{len(rows)} rows could not be inserted into {table.name}, "
+                f"reason: {e}"
+            )
+        return []
+
+    def upsert_insert(self, table):
+        """Get the dialect specific INSERT for a table, which supports
+        ON CONFLICT DO NOTHING / DO UPDATE.  This is supported on PostgreSQL and
+        SQLite."""
+        dialect_name = self.session.get_bind().dialect.name
+        if dialect_name == "postgresql":
+            return postgresql.insert(table)
+        elif dialect_name == "sqlite":
+            return sqlite.insert(table)
+        else:
+            raise DBError(f"INSERT ... ON CONFLICT is not supported on {dialect_name}")
+
+    def bulk_insert_ignore_conflicts(
+        self, table, rows: list[dict], index_elements: list[str], returning: list[str]
+    ) -> list:
+        """Insert a list of rows (dictionaries keyed on column name) into a table,
+        skipping any row that conflicts with an existing row on the unique
+        index_elements, i.e. INSERT ... ON CONFLICT DO NOTHING.  The returning columns
+        of the rows that were actually inserted are returned, so anything not returned
+        already existed.  The rows that were skipped are not returned, so the result is
+        not in the same order as rows.  This is supported on PostgreSQL and SQLite."""
+        if self.session is None:
+            raise RuntimeError("self.session is None")
+        if len(rows) == 0:
+            return []
+        table = getattr(table, "__table__", table)
+        stmt = (
+            self.upsert_insert(table)
+            .on_conflict_do_nothing(index_elements=index_elements)
+            .returning(*[table.c[r] for r in returning])
+        )
+        try:
+            return self.session.execute(stmt, rows).all()
+        except (IntegrityError, DataError) as e:
+            raise DBError(
+                f"{len(rows)} rows could not be inserted into {table.name}, "
+                f"reason: {e}"
+            )
+
+    def bulk_insert_objects(self, db_objects: list[any], returning: bool = False):
+        """Bulk insert a list of new (transient) ORM objects, all of the same model,
+        via bulk_insert.  If returning is True then the generated ids are assigned to
+        the objects."""
+        if len(db_objects) == 0:
+            return
+        mapper = inspect(db_objects[0]).mapper
+        table = mapper.local_table
+        # leave out the columns that are None for every object and are either the
+        # primary key or have a default, so that the database / default fills them
+        # (read the instance __dict__ directly, it is much quicker than getattr)
+        attrs = []
+        for attr in mapper.column_attrs:
+            column = attr.columns[0]
+            if (column.primary_key or column.default is not None) and all(
+                o.__dict__.get(attr.key) is None for o in db_objects
+            ):
+                continue
+            attrs.append((attr.key, column.key))
+        rows = [{ck: o.__dict__.get(ak) for ak, ck in attrs} for o in db_objects]
+        ids = self.bulk_insert(table, rows, returning=returning)
+        for o, id_ in zip(db_objects, ids):
+            o.id = id_
@@ -19,6 +19,7 @@ from nlds.rabbit.consumer import State
 from nlds.details import PathDetails, PathType
 import nlds.rabbit.routing_keys as RK
 from nlds.errors import MessageError
+from nlds_processors.utils.checksum import file_checksum, FINGERPRINT_ALGORITHM
 
 
 class IndexError(MessageError):
@@ -37,6 +38,7 @@ class IndexerConsumer(StattingConsumer):
     _PRINT_TRACEBACKS = "print_tracebacks_fl"
     _CHECK_FILESIZE = "check_filesize_fl"
     _MAX_FILESIZE = "max_filesize"
+    _DEDUP = "dedup_fl"
 
     DEFAULT_CONSUMER_CONFIG = {
         _FILELIST_MAX_LENGTH: 1000,
@@ -44,6 +46,7 @@ class IndexerConsumer(StattingConsumer):
         _PRINT_TRACEBACKS: False,
         _CHECK_FILESIZE: True,
         _MAX_FILESIZE: (500 * 1024 * 1024),  # in bytes, default=500MB
+        _DEDUP: False,
     }
 
     def __init__(self, queue=DEFAULT_QUEUE_NAME):
@@ -55,6 +58,7 @@ class IndexerConsumer(StattingConsumer):
         self.print_tracebacks_fl = self.load_config_value(self._PRINT_TRACEBACKS)
         self.check_filesize_fl = self.load_config_value(self._CHECK_FILESIZE)
         self.max_filesize = self.load_config_value(self._MAX_FILESIZE)
+        self.dedup_fl = self.load_config_value(self._DEDUP)
 
         self.reset()
 
@@ -267,6 +271,14 @@ class IndexerConsumer(StattingConsumer):
                     )
 
                     raise IndexError(message=error_reason)
+                # fingerprint the contents so that the catalog can find an identical
+                # file that has already been uploaded
+                if self.dedup_fl and item_path.path_type == PathType.FILE:
+                    try:
+                        item_path.checksum = file_checksum(item_path.path)
+                    except (FileNotFoundError, PermissionError):
+                        raise IndexError(inaccessible_err_msg)
+                    item_path.checksum_algorithm = FINGERPRINT_ALGORITHM
                 # add to the complete list - use append_and_send to subdivide if
                 # necessary
                 self.append_and_send(
@@ -0,0 +1,89 @@
+# encoding: utf-8
+"""
+compact_monitor.py
+Compact the finished transactions in the monitoring database that are older than a
+number of days: their sub records, failed files and warnings are deleted, leaving
+the transaction record (with its state and counts) as a summary.  The deleted
+records can first be exported to a gzipped JSON lines file.  The deletes are done
+in bounded batches, each in its own database transaction, so that the tables are
+not locked for long.  It can be run periodically, e.g. as a cronjob, or by the
+monitor worker itself (see the retention_days option).
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime, timedelta
+
+import click
+
+from nlds_processors.monitor.monitor import Monitor, MonitorError
+from nlds_processors.monitor.monitor_worker import MonitorConsumer
+from nlds_processors.db_mixin import DBError
+
+
+@click.command()
+@click.option(
+    "--days",
+    type=int,
+    default=None,
+    help="Compact the finished transactions created more than this many days ago "
+    "(default: the retention_days of the monitor_q config).",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=None,
+    help="Number of transactions compacted in each database transaction "
+    "(default: the retention_batch_size of the monitor_q config).",
+)
+@click.option(
+    "--max-batches",
+    type=int,
+    default=0,
+    help="Maximum number of batches to compact, 0 for all of them.",
+)
+@click.option(
+    "--export-dir",
+    type=click.Path(exists=True, file_okay=False, writable=True),
+    default=None,
+    help="Directory to export the compacted records to, as gzipped JSON lines "
+    "(default: the retention_export_dir of the monitor_q config, if any).",
+)
+def compact_monitor(days, batch_size, max_batches, export_dir):
+    # use the monitor_q config from the server config file
+    consumer = MonitorConsumer()
+    if days is None:
+        days = consumer.retention_days
+    if days <= 0:
+        raise click.BadParameter("must be greater than 0", param_hint="--days")
+    if batch_size is None:
+        batch_size = consumer.retention_batch_size
+    if export_dir is None:
+        export_dir = consumer.retention_export_dir
+    db_engine = consumer.load_config_value(consumer._DB_ENGINE)
+    db_options = consumer.load_config_value(consumer._DB_OPTIONS)
+    monitor = Monitor(db_engine, db_options)
+    try:
+        monitor.connect(create_db_fl=False)
+        monitor.start_session()
+        n_compacted = monitor.compact(
+            datetime.now() - timedelta(days=days),
+            batch_size=batch_size,
+            max_batches=max_batches,
+            export_path=MonitorConsumer.get_export_path(export_dir),
+        )
+    except (DBError, MonitorError) as e:
+        if monitor.session is not None:
+            monitor.session.rollback()
+        raise click.ClickException(e.message)
+    finally:
+        monitor.end_session()
+    click.echo(f"Compacted {n_compacted} transaction records.")
+
+
+if __name__ == "__main__":
+    compact_monitor()
@@ -9,11 +9,18 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
+from datetime import datetime
+import gzip
+import json
+
+from sqlalchemy import case, delete, exists, func, insert, literal, select, tuple_
+from sqlalchemy import bindparam, update
 from sqlalchemy.exc import IntegrityError, OperationalError, DataError, NoResultFound
-from sqlalchemy.orm import joinedload, lazyload
+from sqlalchemy.orm import joinedload, lazyload, noload, selectinload
 
 from nlds_processors.monitor.monitor_models import MonitorBase, TransactionRecord
 from nlds_processors.monitor.monitor_models import SubRecord, FailedFile, Warning
+from nlds_processors.monitor.monitor_models import MonitorEvent, HoldingLabel
 
 from nlds.rabbit.consumer import State
 from nlds.details import PathDetails
@@ -29,6 +36,14 @@ class MonitorError(MessageError):
 class Monitor(DBMixin):
     """Monitor object containing methods to manipulate the Monitor Database"""
 
+    # the overall states of the transactions that can be compacted
+    FINISHED_STATES = (
+        State.COMPLETE,
+        State.COMPLETE_WITH_ERRORS,
+        State.COMPLETE_WITH_WARNINGS,
+        State.FAILED,
+    )
+
     def __init__(self, db_engine: str, db_options: str):
         """Record the monitor engine from the config strings passed in"""
         self.db_engine_str = db_engine
@@ -52,6 +67,7 @@ class Monitor(DBMixin):
                 group=group,
                 api_action=api_action,
                 job_label=job_label,
+                label="",
             )
 
             self.session.add(transaction_record)
@@ -116,9 +132,21 @@ class Monitor(DBMixin):
         regex: bool = False,
         limit: int = None,
         descending: bool = False,
+        state: list[State] = None,
+        cursor: tuple[datetime, int] = None,
+        summary: bool = False,
+        failed_files: bool = False,
     ) -> list:
         """Gets a list of TransactionRecords from the DB from the given a whole host of
         information.  Only used for user queries.
+        state filters on the overall state of the TransactionRecord (see
+        TransactionRecord.get_state), which is stored in the DB so that the filter is
+        applied before the limit.
+        The records are ordered by (creation_time, id) and cursor, see
+        encode_cursor, returns the page of records after (or before, if descending)
+        that of a previous query.  If summary is True then the SubRecords and
+        Warnings are not loaded, otherwise they are loaded in one query each, with
+        the FailedFiles of the SubRecords if failed_files is True.
         This function is only used via user interaction.
         NRM - 16/03/2026.  Removed the joinedload on the transaction query as it made
         everything about 5 times slower!"""
@@ -169,18 +197,46 @@ class Monitor(DBMixin):
             # user filter
             if not groupall and user != "**all**":
                 trec_q = trec_q.filter(TransactionRecord.user == user)
-            # Order up or down
+            # state filter
+            if state is not None:
+                trec_q = trec_q.filter(TransactionRecord.state.in_(state))
+            # keyset pagination, from the (creation_time, id) of the last record
+            # of the previous page
+            page_key = tuple_(TransactionRecord.creation_time, TransactionRecord.id)
+            if cursor is not None:
+                if descending:
+                    trec_q = trec_q.filter(page_key < tuple_(*cursor))
+                else:
+                    trec_q = trec_q.filter(page_key > tuple_(*cursor))
+            # Order up or down, by id within the same creation_time
             if descending:
-                trec_q = trec_q.order_by(TransactionRecord.creation_time.desc())
+                trec_q = trec_q.order_by(
+                    TransactionRecord.creation_time.desc(), TransactionRecord.id.desc()
+                )
             else:
-                trec_q = trec_q.order_by(TransactionRecord.creation_time)
+                trec_q = trec_q.order_by(
+                    TransactionRecord.creation_time, TransactionRecord.id
+                )
 
             # limit for speed - but how many sub-records (where the api-action is
             # stored)
             if limit:
                 trec_q = trec_q.limit(limit)
 
-            if trec_q.count() == 0:
+            if summary:
+                trec_q = trec_q.options(
+                    noload(TransactionRecord.sub_records),
+                    noload(TransactionRecord.warnings),
+                )
+            else:
+                sub_records = selectinload(TransactionRecord.sub_records)
+                if failed_files:
+                    sub_records = sub_records.selectinload(SubRecord.failed_files)
+                trec_q = trec_q.options(
+                    sub_records, selectinload(TransactionRecord.warnings)
+                )
+            trecs = trec_q.all()
+            if len(trecs) == 0:
                 raise KeyError
 
         except (IntegrityError, KeyError, OperationalError):
@@ -205,8 +261,22 @@ class Monitor(DBMixin):
                 raise MonitorError(f"Invalid regular expression: {transaction_search}")
             else:
                 raise MonitorError(f"Error getting transaction_record: {e}")
-        trec_q = trec_q.options(joinedload(TransactionRecord.sub_records))
-        return trec_q
+        return trecs
+
+    @staticmethod
+    def encode_cursor(transaction_record: TransactionRecord) -> str:
+        """The cursor for the page of TransactionRecords after transaction_record"""
+        return f"{transaction_record.creation_time.isoformat()},{transaction_record.id}"
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        """The (creation_time, id) of the TransactionRecord that cursor was encoded
+        from"""
+        try:
+            creation_time, idd = cursor.split(",")
+            return datetime.fromisoformat(creation_time), int(idd)
+        except (AttributeError, ValueError):
+            raise MonitorError(f"Invalid cursor: {cursor}")
 
     def create_sub_record(
         self, transaction_record: TransactionRecord, sub_id: str, state: State = None
@@ -226,6 +296,8 @@ class Monitor(DBMixin):
                 transaction_record_id=transaction_record.id,
             )
             self.session.add(sub_record)
+            self._add_counts(transaction_record.id, 1, *self._state_counts(state))
+            self._update_state(transaction_record.id, None, state)
         except (IntegrityError, KeyError):
             raise MonitorError(
                 f"SubRecord for transaction_record_id:{transaction_record.id} "
@@ -233,28 +305,77 @@ class Monitor(DBMixin):
             )
         return sub_record
 
-    def create_failed_file(
-        self, sub_record: SubRecord, path_details: PathDetails, reason: str = None
-    ) -> FailedFile:
-        """Creates a FailedFile object for the monitoring database. Requires the
-        input of the parent SubRecord and the PathDetails object of the failed
-        file in question. Optionally requires a reason str, which will otherwise
-        be attempted to be taken from the PathDetails object. If no reason can
-        be found then a MonitorError will be raised.
-        """
+    @staticmethod
+    def _state_counts(state: State) -> tuple[int, int]:
+        """The contribution of a SubRecord in state to the (finished, failed)
+        counters of its TransactionRecord"""
+        return int(SubRecord.state_has_finished(state)), int(state == State.FAILED)
+
+    def _add_counts(
+        self, transaction_record_id: int, total: int, finished: int, failed: int
+    ) -> tuple[int, int, int]:
+        """Add to the SubRecord counters of a TransactionRecord with one atomic
+        UPDATE ... RETURNING, rather than reading and writing the values, so that
+        concurrent updates of the SubRecords of a transaction are all counted.
+        Returns the new (total, finished, failed) counts."""
+        return tuple(
+            self.session.execute(
+                update(TransactionRecord)
+                .where(TransactionRecord.id == transaction_record_id)
+                .values(
+                    total_count=TransactionRecord.total_count + total,
+                    finished_count=TransactionRecord.finished_count + finished,
+                    failed_count=TransactionRecord.failed_count + failed,
+                )
+                .returning(
+                    TransactionRecord.total_count,
+                    TransactionRecord.finished_count,
+                    TransactionRecord.failed_count,
+                )
+                .execution_options(synchronize_session=False)
+            ).one()
+        )
+
+    def create_failed_files(
+        self,
+        sub_record: SubRecord,
+        filelist: list[PathDetails],
+        blob_threshold: int = 0,
+    ) -> int:
+        """Create the FailedFile records for a list of PathDetails in one bulk
+        (executemany) INSERT, rather than an ORM object per file.  The reason for
+        each failure is taken from the failure_reason of the PathDetails.  If there
+        are more than blob_threshold failed files (and blob_threshold is not 0) then
+        they are added to the compressed failed_files_blob of the SubRecord instead.
+        Returns the number of failed files created."""
+        failed_files = [
+            {
+                "filepath": pd.original_path,
+                "reason": pd.failure_reason if pd.failure_reason is not None else "",
+            }
+            for pd in filelist
+        ]
+        if len(failed_files) == 0:
+            return 0
         try:
-            failed_file = FailedFile(
-                filepath=path_details.original_path,
-                reason=reason,
-                sub_record_id=sub_record.id,
-            )
-            self.session.add(failed_file)
-        except (IntegrityError, KeyError):
+            if blob_threshold and len(failed_files) > blob_threshold:
+                failed_files = (
+                    SubRecord.decompress_failed_files(sub_record.failed_files_blob)
+                    + failed_files
+                )
+                sub_record.failed_files_blob = SubRecord.compress_failed_files(
+                    failed_files
+                )
+            else:
+                for ff in failed_files:
+                    ff["sub_record_id"] = sub_record.id
+                self.session.execute(insert(FailedFile.__table__), failed_files)
+        except IntegrityError:
             raise MonitorError(
-                f"FailedFile for sub_record_id:{sub_record.id} could not be "
+                f"FailedFiles for sub_record_id:{sub_record.id} could not be "
                 "added to the database"
             )
-        return failed_file
+        return len(filelist)
 
     def get_sub_record(
         self,
@@ -338,25 +459,104 @@ class Monitor(DBMixin):
                 f"Monitoring state cannot go backwards from {sub_record.state}. "
                 f"Attempted {sub_record.state}->{new_state}"
             )
+        old_state = sub_record.state
+        old_finished, old_failed = self._state_counts(old_state)
+        new_finished, new_failed = self._state_counts(new_state)
         sub_record.state = new_state
+        if (old_finished, old_failed) != (new_finished, new_failed):
+            self._add_counts(
+                sub_record.transaction_record_id,
+                0,
+                new_finished - old_finished,
+                new_failed - old_failed,
+            )
+        if old_state != new_state:
+            self._update_state(sub_record.transaction_record_id, old_state, new_state)
+
+    def _update_state(
+        self,
+        transaction_record_id: int,
+        old_state: State = None,
+        new_state: State = None,
+    ) -> None:
+        """Maintain the overall state of a TransactionRecord, see
+        TransactionRecord.get_state, as one of its SubRecords moves from old_state to
+        new_state (old_state is None for a new SubRecord, and both are None when a
+        Warning is added to the TransactionRecord).  This has to be called
+        after the counters are updated, with the TransactionRecord locked.  The
+        SubRecords are only queried when the least advanced one moves on, with an
+        indexed probe for each of the (few) states above it."""
+        trec_state, failed_count = self.session.execute(
+            select(TransactionRecord.state, TransactionRecord.failed_count).where(
+                TransactionRecord.id == transaction_record_id
+            )
+        ).one()
+        min_state = TransactionRecord.min_state(trec_state)
+        if new_state is None:
+            pass
+        elif min_state is None or new_state < min_state:
+            min_state = new_state
+        elif old_state == min_state and new_state > old_state:
+            min_state = self._find_min_state(transaction_record_id, old_state)
+        self._set_state(transaction_record_id, min_state, trec_state, failed_count)
+
+    def _set_state(
+        self,
+        transaction_record_id: int,
+        min_state: State,
+        trec_state: State,
+        failed_count: int,
+    ) -> None:
+        """Store the overall state of a TransactionRecord whose least advanced
+        SubRecord is in min_state, if it differs from the stored trec_state"""
+        if min_state is None:
+            return
+        has_warnings = self.session.execute(
+            select(
+                exists().where(Warning.transaction_record_id == transaction_record_id)
+            )
+        ).scalar()
+        state = TransactionRecord.overall_state(min_state, failed_count, has_warnings)
+        if state != trec_state:
+            self.session.execute(
+                update(TransactionRecord)
+                .where(TransactionRecord.id == transaction_record_id)
+                .values(state=state)
+                .execution_options(synchronize_session=False)
+            )
+
+    def _find_min_state(self, transaction_record_id: int, from_state: State) -> State:
+        """The state of the least advanced SubRecord of a TransactionRecord, which is
+        known to be no less than from_state"""
+        for state in sorted(s for s in State if s.value >= from_state.value):
+            found = self.session.execute(
+                select(
+                    exists().where(
+                        SubRecord.transaction_record_id == transaction_record_id,
+                        SubRecord.state == state,
+                    )
+                )
+            ).scalar()
+            if found:
+                return state
+        return None
 
     def check_completion(self, transaction_record: TransactionRecord) -> None:
-        """Get the complete list of sub records from a transaction record and
-        check whether they are all in a final state, and update them to COMPLETE
-        if so.
+        """Check whether all the sub records of a transaction record are in a final
+        state, from the counters of the transaction record, and update them to
+        COMPLETE (or FAILED) if so.
         """
         try:
-            # Get all sub_records by transaction_record.id
-            sub_records = (
-                self.session.query(SubRecord)
-                .filter(SubRecord.transaction_record_id == transaction_record.id)
-                .with_for_update()
-                .all()
-            )
-
-            # Check for an empty query as this doesn't get caught by the below
-            # all() check.
-            if len(sub_records) == 0:
+            total, finished, failed, trec_state = self.session.execute(
+                select(
+                    TransactionRecord.total_count,
+                    TransactionRecord.finished_count,
+                    TransactionRecord.failed_count,
+                    TransactionRecord.state,
+                ).where(TransactionRecord.id == transaction_record.id)
+            ).one()
+
+            if total == 0:
                 raise MonitorError(
                     f"transaction_record {transaction_record.id} has no "
                     f"associated sub_records, something has gone wrong."
@@ -364,19 +564,86 @@ class Monitor(DBMixin):
 
             # Check whether all jobs have reached their final, but not-complete,
             # state.
-            if all([sr.has_finished() for sr in sub_records]):
-                # If all have, then set all non-failed jobs to complete
-                for sr in sub_records:
-                    if sr.state in State.get_failed_states():
-                        self.update_sub_record(sr, State.FAILED)
-                    else:
-                        self.update_sub_record(sr, State.COMPLETE)
+            if finished == total:
+                # If all have, then set all non-failed jobs to complete, with one
+                # UPDATE.  The finished and failed counts do not change, as every
+                # sub record has finished and only the failed ones become FAILED
+                self.session.execute(
+                    update(SubRecord)
+                    .where(SubRecord.transaction_record_id == transaction_record.id)
+                    .values(
+                        state=case(
+                            (
+                                SubRecord.state.in_(State.get_failed_states()),
+                                literal(State.FAILED, SubRecord.state.type),
+                            ),
+                            else_=literal(State.COMPLETE, SubRecord.state.type),
+                        )
+                    )
+                    .execution_options(synchronize_session="fetch")
+                )
+                # every sub record is now COMPLETE or FAILED
+                self._set_state(
+                    transaction_record.id,
+                    self._find_min_state(transaction_record.id, State.COMPLETE),
+                    trec_state,
+                    failed,
+                )
 
         except IntegrityError:
             raise MonitorError(
                 "IntegrityError raised when attempting to get sub_records"
             )
 
+    def set_holding(
+        self, transaction_record: TransactionRecord, holding_id: int, label: str
+    ) -> None:
+        """Record the id and label of the catalog holding that the transaction is
+        stored in.  A label that is already set is not overwritten, as it may have
+        been changed by relabel_holding since the update was sent.  If the holding
+        was relabelled before it was recorded here then it gets the new label."""
+        if holding_id is not None and holding_id != transaction_record.holding_id:
+            transaction_record.holding_id = holding_id
+            holding_label = self.session.get(
+                HoldingLabel, (transaction_record.group, holding_id)
+            )
+            if holding_label is not None:
+                transaction_record.label = holding_label.label
+                return
+        if label is not None and not transaction_record.label:
+            transaction_record.label = label
+
+    def relabel_holding(self, group: str, holding_id: int, label: str) -> int:
+        """Update the label of the TransactionRecords in a (relabelled) holding.
+        Holding ids are unique within a group (as a group is in one catalog shard).
+        The label is also kept, for the TransactionRecords that are assigned to the
+        holding later.  Returns the number of TransactionRecords updated."""
+        insert_label = self.upsert_insert(HoldingLabel.__table__).values(
+            group=group, holding_id=holding_id, label=label
+        )
+        try:
+            self.session.execute(
+                insert_label.on_conflict_do_update(
+                    index_elements=["group", "holding_id"],
+                    set_={"label": insert_label.excluded.label},
+                )
+            )
+            result = self.session.execute(
+                update(TransactionRecord)
+                .where(
+                    TransactionRecord.group == group,
+                    TransactionRecord.holding_id == holding_id,
+                )
+                .values(label=label)
+                .execution_options(synchronize_session=False)
+            )
+        except (IntegrityError, OperationalError):
+            raise MonitorError(
+                f"Could not update the label of the transaction records for "
+                f"holding_id:{holding_id}"
+            )
+        return result.rowcount
+
     def create_warning(
         self, transaction_record: TransactionRecord, warning: str
     ) -> Warning:
@@ -388,9 +655,196 @@ class Monitor(DBMixin):
                 warning=warning, transaction_record_id=transaction_record.id
             )
             self.session.add(warning)
+            self.session.flush()
+            self._update_state(transaction_record.id)
         except (IntegrityError, KeyError):
             raise MonitorError(
                 f"Warning for transaction_record:{transaction_record.id} could "
                 "not be added to the database"
             )
         return warning
+
+    def append_events(self, events: list[dict]) -> int:
+        """Append monitoring updates to the event log, in one bulk INSERT.  This does
+        not lock (or even read) the TransactionRecords, the updates are applied to
+        them later by the projection.  Returns the number of events appended."""
+        if len(events) == 0:
+            return 0
+        try:
+            self.session.execute(insert(MonitorEvent.__table__), events)
+        except (IntegrityError, OperationalError) as e:
+            raise MonitorError(f"Could not append the monitoring events: {e}")
+        return len(events)
+
+    def get_events(self, limit: int) -> list[MonitorEvent]:
+        """Get (up to limit of) the oldest events in the event log, in the order they
+        were appended, locking them (SELECT ... FOR UPDATE) so that a concurrent
+        projection waits for this one to commit, rather than projecting them twice.
+        The events that have failed to be projected are skipped."""
+        try:
+            return self.session.scalars(
+                select(MonitorEvent)
+                .where(MonitorEvent.failure_reason.is_(None))
+                .order_by(MonitorEvent.id)
+                .limit(limit)
+                .with_for_update()
+            ).all()
+        except OperationalError as e:
+            raise MonitorError(f"Could not get the monitoring events: {e}")
+
+    def delete_events(self, event_ids: list[int]) -> None:
+        """Delete the events that have been projected"""
+        try:
+            self.session.execute(
+                delete(MonitorEvent)
+                .where(MonitorEvent.id.in_(event_ids))
+                .execution_options(synchronize_session=False)
+            )
+        except (IntegrityError, OperationalError) as e:
+            raise MonitorError(f"Could not delete the monitoring events: {e}")
+
+    def fail_events(self, failure_reasons: dict[int, str]) -> None:
+        """Keep the events that could not be projected in the event log, with the
+        reason, given as {event_id: reason}, so that the projection skips them and
+        they can be inspected (and replayed, by clearing the reason) later"""
+        if len(failure_reasons) == 0:
+            return
+        try:
+            self.session.execute(
+                update(MonitorEvent.__table__)
+                .where(MonitorEvent.id == bindparam("b_id"))
+                .values(failure_reason=bindparam("b_reason"))
+                .execution_options(synchronize_session=False),
+                [{"b_id": i, "b_reason": r} for i, r in failure_reasons.items()],
+            )
+        except (IntegrityError, OperationalError) as e:
+            raise MonitorError(f"Could not mark the monitoring events as failed: {e}")
+
+    def get_event_backlog(self) -> tuple[int, datetime]:
+        """The number of events waiting to be projected and the time the oldest of
+        them was appended (None if there are none), i.e. how stale the
+        TransactionRecords and SubRecords are"""
+        return self.session.execute(
+            select(
+                func.count(MonitorEvent.id), func.min(MonitorEvent.creation_time)
+            ).where(MonitorEvent.failure_reason.is_(None))
+        ).one()
+
+    def get_compactable_transaction_records(
+        self, older_than: datetime, limit: int
+    ) -> list[int]:
+        """Get the ids of (up to limit) finished TransactionRecords, created before
+        older_than, that have not yet been compacted"""
+        return (
+            self.session.execute(
+                select(TransactionRecord.id)
+                .where(
+                    TransactionRecord.creation_time < older_than,
+                    TransactionRecord.compacted_time.is_(None),
+                    TransactionRecord.state.in_(self.FINISHED_STATES),
+                )
+                .order_by(TransactionRecord.id)
+                .limit(limit)
+            )
+            .scalars()
+            .all()
+        )
+
+    def export_transaction_records(self, trec_ids: list[int], fh) -> None:
+        """Write the TransactionRecords, with their SubRecords, FailedFiles and
+        Warnings, to the open (text) file fh, one JSON object per line"""
+        trecs = self.session.scalars(
+            select(TransactionRecord)
+            .where(TransactionRecord.id.in_(trec_ids))
+            .options(
+                selectinload(TransactionRecord.sub_records).selectinload(
+                    SubRecord.failed_files
+                ),
+                selectinload(TransactionRecord.warnings),
+            )
+        )
+        for tr in trecs:
+            record = {
+                "id": tr.id,
+                "transaction_id": tr.transaction_id,
+                "user": tr.user,
+                "group": tr.group,
+                "job_label": tr.job_label,
+                "api_action": tr.api_action,
+                "creation_time": tr.creation_time.isoformat(),
+                "state": tr.state.name,
+                "warnings": tr.get_warnings(),
+                "sub_records": [
+                    {
+                        "id": sr.id,
+                        "sub_id": sr.sub_id,
+                        "state": sr.state.name,
+                        "retry_count": sr.retry_count,
+                        "last_updated": sr.last_updated.isoformat(),
+                        "failed_files": sr.get_failed_files(),
+                    }
+                    for sr in tr.sub_records
+                ],
+            }
+            fh.write(json.dumps(record) + "\n")
+
+    def compact_transaction_records(self, trec_ids: list[int]) -> None:
+        """Delete the SubRecords, FailedFiles and Warnings of the TransactionRecords,
+        leaving each TransactionRecord as a summary (its state and counts) of the
+        transaction"""
+        srec_ids = select(SubRecord.id).where(
+            SubRecord.transaction_record_id.in_(trec_ids)
+        )
+        try:
+            self.session.execute(
+                delete(FailedFile)
+                .where(FailedFile.sub_record_id.in_(srec_ids))
+                .execution_options(synchronize_session=False)
+            )
+            self.session.execute(
+                delete(SubRecord)
+                .where(SubRecord.transaction_record_id.in_(trec_ids))
+                .execution_options(synchronize_session=False)
+            )
+            self.session.execute(
+                delete(Warning)
+                .where(Warning.transaction_record_id.in_(trec_ids))
+                .execution_options(synchronize_session=False)
+            )
+            self.session.execute(
+                update(TransactionRecord)
+                .where(TransactionRecord.id.in_(trec_ids))
+                .values(compacted_time=func.now())
+                .execution_options(synchronize_session=False)
+            )
+        except (IntegrityError, OperationalError) as e:
+            raise MonitorError(f"Could not compact the transaction records: {e}")
+
+    def compact(
+        self,
+        older_than: datetime,
+        batch_size: int = 1000,
+        max_batches: int = 0,
+        export_path: str = None,
+    ) -> int:
+        """Compact the finished TransactionRecords created before older_than, in
+        batches of batch_size, each in its own (short) database transaction, until
+        there are none left or max_batches (0 for no limit) have been compacted.  If
+        export_path is given then the records are first appended to it, as gzipped
+        JSON lines.  Returns the number of TransactionRecords compacted."""
+        n_compacted = 0
+        n_batches = 0
+        while max_batches == 0 or n_batches < max_batches:
+            trec_ids = self.get_compactable_transaction_records(older_than, batch_size)
+            if len(trec_ids) == 0:
+                break
+            if export_path is not None:
+                with gzip.open(export_path, "at") as fh:
+                    self.export_transaction_records(trec_ids, fh)
+            self.compact_transaction_records(trec_ids)
+            self.commit()
+            # the ORM objects loaded for the export have been deleted
+            self.session.expunge_all()
+            n_compacted += len(trec_ids)
+            n_batches += 1
+        return n_compacted
@@ -11,7 +11,11 @@ __contact__ = "neil.massey@stfc.ac.uk"
 
 """Declare the SQLAlchemy ORM models for the NLDS Monitoring database"""
 
-from sqlalchemy import Integer, String, Column, Enum, ForeignKey, DateTime
+import json
+import zlib
+
+from sqlalchemy import Integer, String, Column, Enum, ForeignKey, DateTime, Index
+from sqlalchemy import LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
@@ -39,11 +43,45 @@ class TransactionRecord(MonitorBase):
     api_action = Column(String, nullable=False)
     # Time of initial submission
     creation_time = Column(DateTime, default=func.now())
+    # counts of the SubRecords, and of the SubRecords that have finished and failed.
+    # These are updated atomically as the SubRecords change state, so that the
+    # completion of the transaction can be checked without loading the SubRecords
+    total_count = Column(Integer, nullable=False, default=0, server_default="0")
+    finished_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # overall state of the transaction, as returned by get_state, maintained as the
+    # SubRecords change state so that the records can be filtered on it in SQL
+    state = Column(Enum(State), nullable=True)
+    # time that the SubRecords, FailedFiles and Warnings of the transaction were
+    # deleted by the retention (compaction) of old, finished transactions, leaving
+    # this row (with its counts and state) as a summary
+    compacted_time = Column(DateTime, nullable=True)
+    # id and label of the catalog holding the transaction is stored in, copied from
+    # the messages once the catalog has assigned the holding, so that status queries
+    # do not have to ask the catalog for them.  The label is "" until the holding is
+    # known (or if there is none, e.g. for a GET) and NULL for records created before
+    # it was stored, for which the catalog has to be asked.
+    holding_id = Column(Integer, nullable=True)
+    label = Column(String, nullable=True)
     # relationship for SubRecords (One to many)
     sub_records = relationship("SubRecord")
     # relationship for Warnings (One to many)
     warnings = relationship("Warning", cascade="delete, delete-orphan")
 
+    # for the status queries, which filter on the user, group and state and order by
+    # the creation time
+    __table_args__ = (
+        Index(
+            "ix_transaction_record_user_group_state_creation_time",
+            "user",
+            "group",
+            "state",
+            "creation_time",
+        ),
+        # for updating the label when a holding is relabelled
+        Index("ix_transaction_record_group_holding_id", "group", "holding_id"),
+    )
+
     def get_warnings(self):
         warnings = []
         for w in self.warnings:
@@ -62,18 +100,32 @@ class TransactionRecord(MonitorBase):
             if sr.state == State.FAILED:
                 error_count += 1
 
+        return self.overall_state(min_state, error_count, len(self.get_warnings()) > 0)
+
+    @staticmethod
+    def overall_state(
+        min_state: State, error_count: int, has_warnings: bool
+    ) -> State | None:
+        """The overall state of a transaction whose least advanced SubRecord is in
+        min_state, with error_count FAILED SubRecords.  This is None while every
+        SubRecord is SEARCHING (or there are none)."""
         if min_state == State.SEARCHING:
             return None
-
         if min_state == State.COMPLETE and error_count > 0:
-            min_state = State.COMPLETE_WITH_ERRORS
-
+            return State.COMPLETE_WITH_ERRORS
         # see if any warnings were given
-        if min_state == State.COMPLETE and len(self.get_warnings()) > 0:
-            min_state = State.COMPLETE_WITH_WARNINGS
-
+        if min_state == State.COMPLETE and has_warnings:
+            return State.COMPLETE_WITH_WARNINGS
         return min_state
 
+    @staticmethod
+    def min_state(overall_state: State | None) -> State | None:
+        """The state of the least advanced SubRecord of a transaction in
+        overall_state, i.e. the inverse of overall_state"""
+        if overall_state in (State.COMPLETE_WITH_ERRORS, State.COMPLETE_WITH_WARNINGS):
+            return State.COMPLETE
+        return overall_state
+
 
 class SubRecord(MonitorBase):
     __tablename__ = "sub_record"
@@ -91,12 +143,25 @@ class SubRecord(MonitorBase):
     )
     # relationship for failed files (zero to many)
     failed_files = relationship("FailedFile")
+    # the failed files of a sub record with very many failures are stored here
+    # instead, as a zlib compressed JSON list of {"filepath", "reason"} dictionaries
+    failed_files_blob = Column(LargeBinary, nullable=True)
 
     # transaction_record_id as ForeignKey
     transaction_record_id = Column(
         Integer, ForeignKey("transaction_record.id"), index=True, nullable=False
     )
 
+    # for finding whether any of the SubRecords of a transaction are in a state,
+    # when maintaining the overall state of the transaction
+    __table_args__ = (
+        Index(
+            "ix_sub_record_transaction_record_id_state",
+            "transaction_record_id",
+            "state",
+        ),
+    )
+
     def has_finished(self):
         """Convenience method for checking whether a given SubRecord is in a
         'final' state, i.e. is no longer going to change and the transaction can
@@ -105,7 +170,44 @@ class SubRecord(MonitorBase):
         Checks whether all states have gotten to the final stage of a workflow
         (CATALOG_PUT or TRANSFER_GET) OR have failed. This should cover all bases.
         """
-        return (self.state in State.get_final_states()) or self.state == State.FAILED
+        return self.state_has_finished(self.state)
+
+    @staticmethod
+    def state_has_finished(state: State) -> bool:
+        return (state in State.get_final_states()) or state == State.FAILED
+
+    @staticmethod
+    def compress_failed_files(failed_files: list[dict]) -> bytes:
+        return zlib.compress(json.dumps(failed_files).encode())
+
+    @staticmethod
+    def decompress_failed_files(blob: bytes) -> list[dict]:
+        if blob is None:
+            return []
+        return json.loads(zlib.decompress(blob).decode())
+
+    def get_failed_files(self) -> list[dict]:
+        """The failed files of the SubRecord as dictionaries, both those stored as
+        FailedFile rows and those in the compressed failed_files_blob"""
+        failed_files = [
+            {
+                "id": ff.id,
+                "filepath": ff.filepath,
+                "reason": ff.reason,
+                "sub_record_id": ff.sub_record_id,
+            }
+            for ff in self.failed_files
+        ]
+        for ff in self.decompress_failed_files(self.failed_files_blob):
+            failed_files.append(
+                {
+                    "id": None,
+                    "filepath": ff["filepath"],
+                    "reason": ff["reason"],
+                    "sub_record_id": self.id,
+                }
+            )
+        return failed_files
 
 
 class FailedFile(MonitorBase):
@@ -135,6 +237,53 @@ class Warning(MonitorBase):
     )
 
 
+class MonitorEvent(MonitorBase):
+    """A monitoring update, appended to the event log (without locking the
+    TransactionRecord) when the monitor is in the event_log storage mode.  The events
+    are folded into the TransactionRecords and SubRecords, in id order, by the
+    projection and then deleted.  An event that cannot be folded in is kept, with
+    the reason why."""
+
+    __tablename__ = "monitor_event"
+
+    # primary key, the order the events are projected in
+    id = Column(Integer, primary_key=True)
+    # the transaction, and its owner, that the update is for
+    transaction_id = Column(String, nullable=False)
+    user = Column(String, nullable=False)
+    group = Column(String, nullable=False)
+    # the sub record and its new state
+    sub_id = Column(String, nullable=False)
+    state = Column(Enum(State), nullable=False)
+    # JSON list of the warnings
+    warnings = Column(String, nullable=True)
+    # the holding, once the catalog has assigned it
+    holding_id = Column(Integer, nullable=True)
+    label = Column(String, nullable=True)
+    # the failed files, if the sub record has failed, compressed in the same way as
+    # SubRecord.failed_files_blob
+    failed_files = Column(LargeBinary, nullable=True)
+    # time the update was appended, to measure how far behind the projection is
+    creation_time = Column(DateTime, default=func.now())
+    # why the projection could not apply the update, e.g. the transaction record was
+    # not found.  These events are skipped by the projection.
+    failure_reason = Column(String, nullable=True)
+
+
+class HoldingLabel(MonitorBase):
+    """The label a catalog holding has been relabelled to, kept so that a
+    TransactionRecord that is only assigned to the holding after the relabelling
+    (because the messages arrived out of order) gets the new label, rather than the
+    one in its update."""
+
+    __tablename__ = "holding_label"
+
+    # holding ids are unique within a group
+    group = Column(String, primary_key=True)
+    holding_id = Column(Integer, primary_key=True)
+    label = Column(String, nullable=False)
+
+
 def orm_to_dict(obj):
     retdict = obj.__dict__
     retdict.pop("_sa_instance_state", None)
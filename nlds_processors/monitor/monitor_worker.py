@@ -23,10 +23,48 @@ Requires these settings in the /etc/nlds/server_config file:
         "logging":{
             "enable": true
         }
+
+The failed files of a sub record that has failed are inserted into the failed_file
+table in one bulk insert.  If there are more than "failed_file_blob_threshold"
+failed files (default 0, meaning never) then they are instead stored in a single
+compressed blob on the sub record.
+
+If "batch_size" is greater than 1 (default 1) then the monitoring updates are
+applied in batches: up to batch_size messages are collected, or as many as arrive
+within "batch_timeout" milliseconds (default 100) of the first, and the updates
+for each transaction are applied with one lock of its transaction record and one
+commit, and acknowledged together.
+
+If "storage_mode" is "event_log" (default "direct") then the monitoring updates are
+not applied to the transaction and sub records as they arrive.  Instead they are
+appended to an event log table, without locking the transaction records, and every
+"projection_interval" milliseconds (default 1000) up to "projection_batch_size"
+(default 10000) of the events are folded into the records, in the order they were
+appended, in one database transaction.  The status queries read the records, so
+they lag behind the updates by about the projection interval.  Setting
+projection_interval to 0 stops a worker projecting the events, so that only some of
+the monitor workers need to do it.
+
+If "retention_days" is greater than 0 (default 0) then every "retention_interval"
+seconds (default 3600) the finished transactions created more than retention_days
+ago are compacted: their sub records, failed files and warnings are deleted, leaving
+the transaction record as a summary.  This is done in batches of
+"retention_batch_size" transactions (default 1000), up to "retention_max_batches"
+(default 10) each time.  If "retention_export_dir" is set then the deleted records
+are first exported to a gzipped JSON lines file in that directory.  See also the
+compact_monitor command.
+
+The database session is cleared of ORM objects after every message and is closed
+and restarted every "session_recycle_count" messages (default 1000, 0 to never
+restart it).
 """
 
+from datetime import datetime, timedelta
+import json
+import os.path
 from typing import Dict
 import sys
+import time
 
 from retry.api import retry_call
 
@@ -38,8 +76,10 @@ from pika.frame import Header
 from nlds.rabbit.consumer import RabbitMQConsumer as RMQC
 from nlds.rabbit.consumer import State
 from nlds_processors.monitor.monitor import Monitor, MonitorError
-from nlds_processors.monitor.monitor_models import orm_to_dict
+from nlds_processors.monitor.monitor_models import SubRecord
 from nlds_processors.db_mixin import DBError
+from nlds.utils.memory import get_rss
+from nlds.details import PathDetails
 
 import nlds.rabbit.routing_keys as RK
 import nlds.rabbit.message_keys as MSG
@@ -57,6 +97,18 @@ class MonitorConsumer(RMQC):
     _DB_OPTIONS_USER = "db_user"
     _DB_OPTIONS_PASSWD = "db_passwd"
     _DB_ECHO = "echo"
+    _SESSION_RECYCLE = "session_recycle_count"
+    _FAILED_FILE_BLOB_THRESHOLD = "failed_file_blob_threshold"
+    _BATCH_SIZE = "batch_size"
+    _BATCH_TIMEOUT = "batch_timeout"
+    _STORAGE_MODE = "storage_mode"
+    _PROJECTION_INTERVAL = "projection_interval"
+    _PROJECTION_BATCH_SIZE = "projection_batch_size"
+    _RETENTION_DAYS = "retention_days"
+    _RETENTION_INTERVAL = "retention_interval"
+    _RETENTION_BATCH_SIZE = "retention_batch_size"
+    _RETENTION_MAX_BATCHES = "retention_max_batches"
+    _RETENTION_EXPORT_DIR = "retention_export_dir"
 
     DEFAULT_CONSUMER_CONFIG = {
         _DB_ENGINE: "sqlite",
@@ -66,10 +118,59 @@ class MonitorConsumer(RMQC):
             _DB_OPTIONS_PASSWD: "",
             _DB_ECHO: True,
         },
+        _SESSION_RECYCLE: 1000,
+        _FAILED_FILE_BLOB_THRESHOLD: 0,
+        _BATCH_SIZE: 1,
+        _BATCH_TIMEOUT: 100,
+        _STORAGE_MODE: "direct",
+        _PROJECTION_INTERVAL: 1000,
+        _PROJECTION_BATCH_SIZE: 10000,
+        _RETENTION_DAYS: 0,
+        _RETENTION_INTERVAL: 3600,
+        _RETENTION_BATCH_SIZE: 1000,
+        _RETENTION_MAX_BATCHES: 10,
+        _RETENTION_EXPORT_DIR: None,
     }
 
+    # the api actions whose monitoring messages create and update the records
+    PUT_API_ACTIONS = (
+        RK.PUT,
+        RK.PUTLIST,
+        RK.GET,
+        RK.GETLIST,
+        RK.ARCHIVE_PUT,
+        RK.ARCHIVE_GET,
+    )
+
+    # the storage modes: apply the updates as they arrive, or append them to the
+    # event log for the projection to apply
+    STORAGE_DIRECT = "direct"
+    STORAGE_EVENT_LOG = "event_log"
+
     def __init__(self, queue=DEFAULT_QUEUE_NAME):
         super().__init__(queue=queue)
+        self.session_recycle_count = self.load_config_value(self._SESSION_RECYCLE)
+        self.failed_file_blob_threshold = self.load_config_value(
+            self._FAILED_FILE_BLOB_THRESHOLD
+        )
+        self.batch_size = self.load_config_value(self._BATCH_SIZE)
+        self.batch_timeout = self.load_config_value(self._BATCH_TIMEOUT)
+        # the monitoring updates waiting to be applied in batch mode, and the timer
+        # that applies them after batch_timeout
+        self.batch = []
+        self.batch_timer = None
+        self.storage_mode = self.load_config_value(self._STORAGE_MODE)
+        if self.storage_mode not in (self.STORAGE_DIRECT, self.STORAGE_EVENT_LOG):
+            raise ValueError(f"Unknown monitor storage_mode: {self.storage_mode}")
+        self.projection_interval = self.load_config_value(self._PROJECTION_INTERVAL)
+        self.projection_batch_size = self.load_config_value(self._PROJECTION_BATCH_SIZE)
+        self.retention_days = self.load_config_value(self._RETENTION_DAYS)
+        self.retention_interval = self.load_config_value(self._RETENTION_INTERVAL)
+        self.retention_batch_size = self.load_config_value(self._RETENTION_BATCH_SIZE)
+        self.retention_max_batches = self.load_config_value(self._RETENTION_MAX_BATCHES)
+        self.retention_export_dir = self.load_config_value(self._RETENTION_EXPORT_DIR)
+        # time (from time.monotonic) after which the retention is next run
+        self.next_retention = 0
         self.monitor = None
 
     @property
@@ -281,6 +382,26 @@ class MonitorConsumer(RMQC):
             descending = False
         return descending
 
+    def _parse_cursor(self, body: dict) -> tuple:
+        # get the (creation_time, id) to continue a paginated query from
+        try:
+            cursor = body[MSG.META][MSG.CURSOR]
+        except KeyError:
+            return None
+        try:
+            return Monitor.decode_cursor(cursor)
+        except MonitorError as e:
+            self.log(e.message, RK.LOG_ERROR)
+            raise e
+
+    def _parse_summary(self, body: dict) -> bool:
+        # get whether to return just the transaction records, without sub records
+        try:
+            summary = body[MSG.META][MSG.SUMMARY]
+        except KeyError:
+            summary = False
+        return summary
+
     def _parse_api_action_from_meta(self, body):
         # get the api-action from the metadata section of the message
         try:
@@ -402,10 +523,9 @@ class MonitorConsumer(RMQC):
         )
         return True
 
-    def _monitor_put(self, body: Dict[str, str]) -> None:
-        """
-        Update a monitoring record for an in-progress transaction.
-        """
+    def _parse_put(self, body: Dict[str, str]) -> dict:
+        """Get the details of a monitoring update from the message, returns None if
+        they could not be parsed."""
         # get the required details from the message
         try:
             transaction_id = self._parse_transaction_id(body)
@@ -418,7 +538,7 @@ class MonitorConsumer(RMQC):
             warnings = self._parse_warnings(body)
         except MonitorError:
             # Functions above handled message logging, here we just return
-            return True
+            return None
 
         # get last process from route
         route = body[MSG.DETAILS][MSG.ROUTE]
@@ -429,47 +549,63 @@ class MonitorConsumer(RMQC):
             f"last process {route_parts[-1]}.",
             RK.LOG_INFO,
         )
-        # get the filelist
-        filelist = self.parse_filelist(body)
-        # start the database transactions
-        self.monitor.start_session()
-
-        # For any given monitoring update, we need to:
-        # - find the transaction record (create if not present)
-        # - update the subrecord(s) associated with it
-        #   - find an existing
-        #   - see if it matches sub_id in message
-        #       - update it if it does
-        #           - change state
-        #           - add failed files if failed
-        #       - create a new one if it doesn't
-
-        # find the transaction record
+        return {
+            "transaction_id": transaction_id,
+            "user": user,
+            "group": group,
+            "state": state,
+            "sub_id": sub_id,
+            "warnings": warnings,
+            # the holding, once the catalog has assigned it
+            "holding_id": body[MSG.DETAILS].get(MSG.HOLDING_ID),
+            "label": body[MSG.DETAILS].get(MSG.LABEL),
+            # get the filelist
+            "filelist": self.parse_filelist(body),
+        }
 
+    def _lock_transaction_record(self, put: dict, retry: bool = True):
+        """Find the transaction record of a monitoring update and lock it (SELECT
+        ... FOR UPDATE) until the session is committed.  Returns None if it could
+        not be found.  If retry is False then it is not retried if it is not found,
+        as the projection must not hold the lock on the event log while waiting."""
         try:
-            trec = self._get_transaction_record_with_retry(
-                user,
-                group,
-                idd=None,
-                transaction_id=transaction_id,
-                with_for_update=True,
-            )
+            if retry:
+                trec = self._get_transaction_record_with_retry(
+                    put["user"],
+                    put["group"],
+                    idd=None,
+                    transaction_id=put["transaction_id"],
+                    with_for_update=True,
+                )
+            else:
+                trec = self.monitor.get_transaction_record(
+                    put["user"],
+                    put["group"],
+                    idd=None,
+                    transaction_id=put["transaction_id"],
+                    with_for_update=True,
+                )
         except MonitorError as e:
             # fine to pass here as if transaction_record is not returned then it
             # will be created in the next step
             self.log(e.message, RK.LOG_ERROR)
-            # don't ack - try again
-            return False
+            return None
+        return trec
 
+    def _apply_put(self, trec, put: dict) -> bool:
+        """Apply a monitoring update to its (locked) transaction record, without
+        committing it."""
+        state = put["state"]
+        self.monitor.set_holding(trec, put["holding_id"], put["label"])
         # create any warnings if there are any
-        if warnings and len(warnings) > 0:
-            for w in warnings:
+        if put["warnings"] and len(put["warnings"]) > 0:
+            for w in put["warnings"]:
                 warning = self.monitor.create_warning(trec, w)
 
         # find or create the sub record
         try:
             srec = self._get_or_create_sub_record(
-                trec, sub_id, state, with_for_update=True
+                trec, put["sub_id"], state, with_for_update=True
             )
         except MonitorError as e:
             # Function above handled message logging, here we just return
@@ -490,13 +626,18 @@ class MonitorConsumer(RMQC):
                 RK.LOG_INFO,
             )
             try:
-                for pd in filelist:
-                    reason = ""
-                    # Check which was the final reason for failure and pass
-                    # that as the failure reason for the FailedFile.
-                    if pd.failure_reason is not None:
-                        reason = pd.failure_reason
-                    self.monitor.create_failed_file(srec, pd, reason=reason)
+                # one bulk insert, as this is inside the lock on the trec
+                start = time.perf_counter()
+                n_failed = self.monitor.create_failed_files(
+                    srec,
+                    put["filelist"],
+                    blob_threshold=self.failed_file_blob_threshold,
+                )
+                self.log(
+                    f"Created {n_failed} FailedFiles records in "
+                    f"{time.perf_counter() - start:.3f}s",
+                    RK.LOG_DEBUG,
+                )
             except MonitorError as e:
                 self.log(e.message, RK.LOG_ERROR)
 
@@ -512,6 +653,37 @@ class MonitorConsumer(RMQC):
             except MonitorError as e:
                 self.log(e.message, RK.LOG_ERROR)
                 return False
+        return True
+
+    def _monitor_put(self, body: Dict[str, str]) -> None:
+        """
+        Update a monitoring record for an in-progress transaction.
+        """
+        put = self._parse_put(body)
+        if put is None:
+            return True
+        if self.storage_mode == self.STORAGE_EVENT_LOG:
+            return self._append_puts([put])
+        # start the database transactions
+        self.monitor.start_session()
+
+        # For any given monitoring update, we need to:
+        # - find the transaction record (create if not present)
+        # - update the subrecord(s) associated with it
+        #   - find an existing
+        #   - see if it matches sub_id in message
+        #       - update it if it does
+        #           - change state
+        #           - add failed files if failed
+        #       - create a new one if it doesn't
+
+        # find the transaction record
+        trec = self._lock_transaction_record(put)
+        if trec is None:
+            # don't ack - try again
+            return False
+        if not self._apply_put(trec, put):
+            return False
         self.monitor.commit()
 
         self.log(
@@ -520,6 +692,304 @@ class MonitorConsumer(RMQC):
         )
         return True
 
+    def _monitor_put_batch(self, bodies: list[Dict[str, str]]) -> bool:
+        """
+        Apply several monitoring updates, for the same transaction, in order, with
+        one lock of the transaction record and one commit.  Each update is applied
+        in a SAVEPOINT so that one that fails is rolled back on its own, without
+        losing the others.  Returns False if none of them could be applied, because
+        the transaction record could not be found, so that the messages are
+        requeued rather than acknowledged.
+        """
+        puts = [put for put in map(self._parse_put, bodies) if put is not None]
+        if len(puts) == 0:
+            return True
+        if self.storage_mode == self.STORAGE_EVENT_LOG:
+            return self._append_puts(puts)
+        self.monitor.start_session()
+        trec = self._lock_transaction_record(puts[0])
+        if trec is None:
+            self.monitor.session.rollback()
+            self.log(
+                f"Could not lock the TransactionRecord for transaction "
+                f"{puts[0]['transaction_id']}, requeueing {len(bodies)} monitoring "
+                "updates",
+                RK.LOG_ERROR,
+            )
+            # don't ack - try again
+            return False
+        applied = self._apply_puts(trec, puts).count(None)
+        self.monitor.commit()
+        self.log(
+            f"... Successfully committed {applied} of {len(bodies)} monitoring "
+            f"updates for transaction {puts[0]['transaction_id']}",
+            RK.LOG_INFO,
+        )
+        return True
+
+    def _apply_puts(self, trec, puts: list[dict]) -> list[str]:
+        """Apply several monitoring updates to their (locked) transaction record, in
+        order, each in a SAVEPOINT, without committing them.  Returns, for each
+        update, None if it was applied or the reason it was rolled back."""
+        failure_reasons = []
+        for put in puts:
+            savepoint = self.monitor.session.begin_nested()
+            try:
+                ok = self._apply_put(trec, put)
+                reason = None if ok else "The monitoring update could not be applied"
+            except Exception as e:
+                self.log(
+                    f"Monitoring update for sub_record {put['sub_id']} failed: {e}",
+                    RK.LOG_ERROR,
+                    exc_info=e,
+                )
+                reason = f"The monitoring update failed: {e}"
+            if reason is None:
+                savepoint.commit()
+            else:
+                savepoint.rollback()
+            failure_reasons.append(reason)
+        return failure_reasons
+
+    def _append_puts(self, puts: list[dict]) -> bool:
+        """Append monitoring updates to the event log, for the projection to apply
+        later"""
+        self.monitor.start_session()
+        try:
+            self.monitor.append_events([self._put_to_event(put) for put in puts])
+        except MonitorError as e:
+            self.log(e.message, RK.LOG_ERROR)
+            self.monitor.session.rollback()
+            # don't ack - try again
+            return False
+        self.monitor.commit()
+        self.log(
+            f"... Successfully appended {len(puts)} monitoring updates to the event "
+            "log",
+            RK.LOG_INFO,
+        )
+        return True
+
+    @staticmethod
+    def _put_to_event(put: dict) -> dict:
+        """Convert a parsed monitoring update to a row of the event log.  Only the
+        failed files are kept from the filelist, as that is all that is used."""
+        if put["state"] in State.get_failed_states() and len(put["filelist"]) > 0:
+            failed_files = SubRecord.compress_failed_files(
+                [
+                    {"filepath": pd.original_path, "reason": pd.failure_reason}
+                    for pd in put["filelist"]
+                ]
+            )
+        else:
+            failed_files = None
+        return {
+            "transaction_id": put["transaction_id"],
+            "user": put["user"],
+            "group": put["group"],
+            "sub_id": put["sub_id"],
+            "state": put["state"],
+            "warnings": json.dumps(put["warnings"]) if put["warnings"] else None,
+            "holding_id": put["holding_id"],
+            "label": put["label"],
+            "failed_files": failed_files,
+        }
+
+    @staticmethod
+    def _event_to_put(event) -> dict:
+        """Convert a row of the event log back to a monitoring update"""
+        return {
+            "transaction_id": event.transaction_id,
+            "user": event.user,
+            "group": event.group,
+            "state": event.state,
+            "sub_id": event.sub_id,
+            "warnings": json.loads(event.warnings) if event.warnings else [],
+            "holding_id": event.holding_id,
+            "label": event.label,
+            "filelist": [
+                PathDetails(original_path=ff["filepath"], failure_reason=ff["reason"])
+                for ff in SubRecord.decompress_failed_files(event.failed_files)
+            ],
+        }
+
+    def project_events(self) -> int:
+        """Fold (up to projection_batch_size of) the oldest events in the event log
+        into the transaction and sub records, in the order they were appended, and
+        delete them, all in one database transaction.  The events for each
+        transaction are applied with one lock of its transaction record.  The events
+        that cannot be applied, because the transaction record is not found or the
+        update is rolled back, are kept in the event log with the reason.  Returns
+        the number of events projected."""
+        self.monitor.start_session()
+        try:
+            events = self.monitor.get_events(self.projection_batch_size)
+            if len(events) == 0:
+                self.monitor.commit()
+                return 0
+            groups = {}
+            for event in events:
+                groups.setdefault(event.transaction_id, []).append(event)
+            failure_reasons = {}
+            for group_events in groups.values():
+                puts = [self._event_to_put(event) for event in group_events]
+                trec = self._lock_transaction_record(puts[0], retry=False)
+                if trec is None:
+                    reasons = ["TransactionRecord not found"] * len(puts)
+                else:
+                    reasons = self._apply_puts(trec, puts)
+                for event, reason in zip(group_events, reasons):
+                    if reason is not None:
+                        failure_reasons[event.id] = reason
+            self.monitor.delete_events(
+                [event.id for event in events if event.id not in failure_reasons]
+            )
+            self.monitor.fail_events(failure_reasons)
+            self.monitor.commit()
+        except MonitorError as e:
+            self.monitor.session.rollback()
+            self.log(f"Projecting the monitoring events failed: {e}", RK.LOG_ERROR)
+            return 0
+        self.log(
+            f"Projected {len(events) - len(failure_reasons)} of {len(events)} "
+            f"monitoring events for {len(groups)} transactions",
+            RK.LOG_INFO,
+        )
+        if len(failure_reasons) > 0:
+            self.log(
+                f"{len(failure_reasons)} monitoring events could not be projected, "
+                "they are kept in the event log with the reason",
+                RK.LOG_WARNING,
+            )
+        return len(events)
+
+    def _project_events_periodically(self) -> None:
+        """Project the events, then schedule the next projection.  If a full batch
+        was projected then there may be more waiting, so the next projection is
+        straight away."""
+        n_projected = 0
+        self.keepalive.start_polling()
+        try:
+            n_projected = self.project_events()
+        finally:
+            self.keepalive.stop_polling()
+            self.monitor.session.expunge_all()
+            delay = self.projection_interval / 1000
+            if n_projected >= self.projection_batch_size:
+                delay = 0
+            self.connection.call_later(delay, self._project_events_periodically)
+
+    def _is_monitor_put(self, method: Method, body: dict) -> bool:
+        """Whether a message is a monitoring update, which can be batched"""
+        try:
+            api_method = body[MSG.DETAILS][MSG.API_ACTION]
+            rk_parts = self.split_routing_key(method.routing_key)
+        except (KeyError, ValueError):
+            return False
+        return api_method in self.PUT_API_ACTIONS and rk_parts[2] == RK.START
+
+    def _wrapped_callback(
+        self,
+        ch: Channel,
+        method: Method,
+        properties: Header,
+        body: bytes,
+        connection: Connection,
+    ) -> None:
+        """In batch mode, collect the monitoring updates until there are
+        batch_size of them, or batch_timeout ms have passed since the first, and
+        then apply them together.  Any other message first applies the updates
+        collected so far, so that the order of the messages is kept."""
+        if self.batch_size <= 1:
+            return super()._wrapped_callback(ch, method, properties, body, connection)
+        body_json = self._deserialize(body)
+        if not self._is_monitor_put(method, body_json):
+            self._flush_batch()
+            return super()._wrapped_callback(ch, method, properties, body, connection)
+
+        self.batch.append((ch, method, body_json, connection))
+        if len(self.batch) >= self.batch_size:
+            self._flush_batch()
+        elif len(self.batch) == 1:
+            self.batch_timer = connection.call_later(
+                self.batch_timeout / 1000, self._flush_batch
+            )
+
+    def _flush_batch(self) -> None:
+        """Apply the collected monitoring updates, grouped by transaction id (in
+        the order each transaction was first seen, keeping the order of the
+        updates within it), committing and acknowledging each group together.  A
+        group that could not be applied is nacked, so that it is requeued."""
+        if self.batch_timer is not None:
+            self.batch[0][3].remove_timeout(self.batch_timer)
+            self.batch_timer = None
+        batch, self.batch = self.batch, []
+        if len(batch) == 0:
+            return
+
+        self.keepalive.start_polling()
+        self.setup_signal_handling()
+        groups = {}
+        for message in batch:
+            transaction_id = message[2].get(MSG.DETAILS, {}).get(MSG.TRANSACT_ID)
+            groups.setdefault(transaction_id, []).append(message)
+        for messages in groups.values():
+            try:
+                applied = self._monitor_put_batch([body for _, _, body, _ in messages])
+            except Exception as e:
+                raise Exception("Unhandled exception " + str(e))
+            self.end_callback()
+            if not applied:
+                for ch, method, _, connection in messages:
+                    self.nack_message(ch, method.delivery_tag, connection)
+                self.log(
+                    f"Batch failed.  Requeued {len(messages)} messages",
+                    RK.LOG_WARNING,
+                )
+                continue
+            for ch, method, _, connection in messages:
+                self.acknowledge_message(ch, method.delivery_tag, connection)
+            self.log(
+                f"Batch complete.  Acknowledged {len(messages)} messages",
+                RK.LOG_INFO,
+            )
+        self.keepalive.stop_polling()
+
+    def declare_bindings(self) -> None:
+        # allow a whole batch of messages to be delivered before any are acked
+        if self.batch_size > 1:
+            self.channel.basic_qos(prefetch_count=self.batch_size)
+        super().declare_bindings()
+        # (re)start projecting the event log on the (new) connection
+        if self.storage_mode == self.STORAGE_EVENT_LOG and self.projection_interval > 0:
+            self.connection.call_later(
+                self.projection_interval / 1000, self._project_events_periodically
+            )
+
+    def _monitor_relabel(self, body: Dict[str, str]) -> None:
+        """Update the label of the transaction records of a holding that has been
+        relabelled in the catalog"""
+        try:
+            group = self._parse_group(body)
+            holding_id = body[MSG.DETAILS][MSG.HOLDING_ID]
+            label = body[MSG.DETAILS][MSG.LABEL]
+        except (MonitorError, KeyError):
+            self.log(
+                "Holding id or label not in message, exiting callback.", RK.LOG_ERROR
+            )
+            return
+        self.monitor.start_session()
+        try:
+            n_updated = self.monitor.relabel_holding(group, holding_id, label)
+        except MonitorError as e:
+            self.log(e.message, RK.LOG_ERROR)
+            return
+        self.monitor.commit()
+        self.log(
+            f"Relabelled {n_updated} transaction records for holding {holding_id}",
+            RK.LOG_INFO,
+        )
+
     def _monitor_get(self, body: Dict[str, str], properties: Header) -> None:
         """
         Get a list of monitoring records for in-progress or finished
@@ -545,10 +1015,16 @@ class MonitorConsumer(RMQC):
             regex = self._parse_regex(body)
             limit = self._parse_limit(body)
             descending = self._parse_descending(body)
+            cursor = self._parse_cursor(body)
+            summary = self._parse_summary(body)
         except MonitorError:
             # Functions above handled message logging, here we just return
             return
 
+        # only get the failed files if the user asked for them - i.e. they specified
+        # a transaction
+        failed_files = bool(idd or job_label or transaction_id)
+
         # start a SQL alchemy session
         self.monitor.start_session()
 
@@ -584,6 +1060,10 @@ class MonitorConsumer(RMQC):
                 regex=regex,
                 limit=limit,
                 descending=descending,
+                state=state,
+                cursor=cursor,
+                summary=summary,
+                failed_files=failed_files,
             )
         except MonitorError as e:
             self.log(e.message, RK.LOG_ERROR)
@@ -598,30 +1078,36 @@ class MonitorConsumer(RMQC):
         if groupall:
             query_user = None
         for tr in trecs:
-            # filter on the state
-            if state is not None:
-                if tr.get_state() not in state:
-                    continue
-
             # Note that state is used to filter on the final state, not the state of
-            # each sub record - so return the sub records no matter what state they
-            # are in
-            if tr.id in trecs_dict:
-                t_rec = trecs_dict[tr.id]
-            else:
-                t_rec = {
-                    "id": tr.id,
-                    "transaction_id": tr.transaction_id,
-                    "user": tr.user,
-                    "group": tr.group,
-                    "job_label": tr.job_label,
-                    "api_action": tr.api_action,
-                    "creation_time": tr.creation_time.isoformat(),
-                    "warnings": [w.warning for w in tr.warnings],
-                    "sub_records": [],
-                }
-                trecs_dict[tr.id] = t_rec
-
+            # each sub record (in get_transaction_records) - so return the sub records
+            # no matter what state they are in
+            t_rec = {
+                "id": tr.id,
+                "transaction_id": tr.transaction_id,
+                "user": tr.user,
+                "group": tr.group,
+                "job_label": tr.job_label,
+                "api_action": tr.api_action,
+                "creation_time": tr.creation_time.isoformat(),
+                "state": tr.state.name if tr.state is not None else None,
+                # the sub records of a compacted transaction have been deleted
+                "compacted": tr.compacted_time is not None,
+            }
+            # the holding label, unless it was not recorded (a legacy record)
+            if tr.label is not None:
+                t_rec[MSG.LABEL] = tr.label
+                t_rec[MSG.HOLDING_ID] = tr.holding_id
+            trecs_dict[tr.id] = t_rec
+
+            if summary:
+                # the counts of the sub records, rather than the sub records
+                t_rec["total_count"] = tr.total_count
+                t_rec["finished_count"] = tr.finished_count
+                t_rec["failed_count"] = tr.failed_count
+                continue
+
+            t_rec["warnings"] = [w.warning for w in tr.warnings]
+            t_rec["sub_records"] = []
             for sr in tr.sub_records:
                 s_rec = {
                     "id": sr.id,
@@ -629,10 +1115,8 @@ class MonitorConsumer(RMQC):
                     "state": sr.state.name,
                     "last_updated": sr.last_updated.isoformat(),
                 }
-                # only get the failed files if the user asked for them - i.e. they
-                # specified a transaction id
-                if idd or job_label or transaction_id:
-                    s_rec["failed_files"] = [orm_to_dict(ff) for ff in sr.failed_files]
+                if failed_files:
+                    s_rec["failed_files"] = sr.get_failed_files()
 
                 t_rec["sub_records"].append(s_rec)
 
@@ -643,6 +1127,15 @@ class MonitorConsumer(RMQC):
             # if len(trecs_dict[id_]["sub_records"]) > 0:
             ret_list.append(trecs_dict[id_])
         body[MSG.DATA][MSG.RECORD_LIST] = ret_list
+        # a full page may be followed by another
+        if limit and len(trecs) == limit:
+            body[MSG.DATA][MSG.NEXT_CURSOR] = Monitor.encode_cursor(trecs[-1])
+        # if every record has its label then the status query does not need to ask
+        # the catalog for them, see CatalogConsumer._catalog_stat
+        if all(MSG.LABEL in tr for tr in ret_list):
+            body[MSG.DATA][MSG.TRANSACTIONS] = {
+                tr["transaction_id"]: tr[MSG.LABEL] for tr in ret_list
+            }
         self.publish_message(
             properties.reply_to,
             msg_dict=body,
@@ -688,14 +1181,10 @@ class MonitorConsumer(RMQC):
             self.log("Starting stat from monitoring db.", RK.LOG_INFO)
             self._monitor_get(body, properties)
 
-        elif api_method in (
-            RK.PUT,
-            RK.PUTLIST,
-            RK.GET,
-            RK.GETLIST,
-            RK.ARCHIVE_PUT,
-            RK.ARCHIVE_GET,
-        ):
+        elif api_method == RK.META:
+            self._monitor_relabel(body)
+
+        elif api_method in self.PUT_API_ACTIONS:
             # Verify routing key is appropriate
             try:
                 rk_parts = self.split_routing_key(method.routing_key)
@@ -736,6 +1225,50 @@ class MonitorConsumer(RMQC):
         # end the session
         self.monitor.end_session()
 
+    def end_callback(self):
+        """Finish the unit-of-work for the message by clearing the session, so that
+        the ORM objects loaded while processing it do not accumulate."""
+        if self.monitor is None:
+            return
+        if self.monitor.recycle_session(self.session_recycle_count):
+            self.log(
+                f"Recycled database session after {self.monitor.message_count} "
+                f"messages, RSS is {get_rss() // 1024**2}MB",
+                RK.LOG_INFO,
+            )
+        self.run_retention()
+
+    @staticmethod
+    def get_export_path(export_dir: str) -> str:
+        """Path of a new file, in export_dir, to export compacted records to"""
+        if export_dir is None:
+            return None
+        return os.path.join(
+            export_dir, f"monitor-{datetime.now().strftime('%Y%m%dT%H%M%S')}.jsonl.gz"
+        )
+
+    def run_retention(self) -> None:
+        """Compact the finished transactions older than retention_days, if it is
+        retention_interval seconds since this was last done.  Only
+        retention_max_batches batches are compacted each time, so that processing
+        the messages is not held up for long."""
+        if self.retention_days <= 0 or time.monotonic() < self.next_retention:
+            return
+        self.next_retention = time.monotonic() + self.retention_interval
+        try:
+            n_compacted = self.monitor.compact(
+                datetime.now() - timedelta(days=self.retention_days),
+                batch_size=self.retention_batch_size,
+                max_batches=self.retention_max_batches,
+                export_path=self.get_export_path(self.retention_export_dir),
+            )
+        except (MonitorError, OSError) as e:
+            self.monitor.session.rollback()
+            self.log(f"Compacting the monitoring records failed: {e}", RK.LOG_ERROR)
+            return
+        if n_compacted > 0:
+            self.log(f"Compacted {n_compacted} transaction records", RK.LOG_INFO)
+
     def get_engine(self):
         # Method for making the db_engine available to alembic
         return self.database.db_engine
@@ -18,6 +18,7 @@ from nlds.rabbit.statting_consumer import StattingConsumer
 from nlds.details import PathDetails
 from nlds.rabbit.consumer import State
 from nlds_processors.utils.aggregations import bin_files
+from nlds_processors.utils.concurrent_transfers import DEFAULT_MAX_IN_FLIGHT_SIZE
 import nlds.rabbit.routing_keys as RK
 import nlds.rabbit.message_keys as MSG
 from nlds_processors.transfer.transfer_error import TransferError
@@ -35,6 +36,8 @@ class BaseTransferConsumer(StattingConsumer, ABC):
     _PARALLEL_UPLOADS = "num_parallel_uploads"
     _FILELIST_MAX_LENGTH = "filelist_max_length"
     _HTTP_TIMEOUT = "http_timeout"
+    _CONCURRENT_TRANSFERS = "num_concurrent_transfers"
+    _MAX_IN_FLIGHT_SIZE = "max_in_flight_size"
     DEFAULT_CONSUMER_CONFIG = {
         _TENANCY: None,
         _REQUIRE_SECURE: True,
@@ -43,6 +46,8 @@ class BaseTransferConsumer(StattingConsumer, ABC):
         _CHUNK_SIZE: 5 * (1024**2),  # Default to 5 MiB
         _PARALLEL_UPLOADS: 1,
         _HTTP_TIMEOUT: 24 * 60 * 60,  # Default to 24 hours
+        _CONCURRENT_TRANSFERS: 1,
+        _MAX_IN_FLIGHT_SIZE: DEFAULT_MAX_IN_FLIGHT_SIZE,
         StattingConsumer._FILELIST_MAX_SIZE: 16 * 1024 * 1024,
     }
 
@@ -57,6 +62,10 @@ class BaseTransferConsumer(StattingConsumer, ABC):
         self.chunk_size = int(self.load_config_value(self._CHUNK_SIZE))
         self.num_parallel_uploads = int(self.load_config_value(self._PARALLEL_UPLOADS))
         self.http_timeout = int(self.load_config_value(self._HTTP_TIMEOUT))
+        self.num_concurrent_transfers = int(
+            self.load_config_value(self._CONCURRENT_TRANSFERS)
+        )
+        self.max_in_flight_size = int(self.load_config_value(self._MAX_IN_FLIGHT_SIZE))
         self.reset()
 
     def _callback_common(self, cm, method, properties, body, connection):
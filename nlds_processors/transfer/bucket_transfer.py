@@ -35,10 +35,10 @@ class BucketTransferConsumer(BaseTransferConsumer, BucketMixin, ABC):
         self, tenancy: str, access_key: str, secret_key: str, secure: bool
     ):
         # Create a minio S3 client with a custom http client with a timeout of 24
-        # hours
+        # hours, and enough connections in the pool for the concurrent transfers
         _http = urllib3.PoolManager(
             timeout=Timeout(connect=self.http_timeout, read=self.http_timeout),
-            maxsize=10,
+            maxsize=max(10, self.num_concurrent_transfers * self.num_parallel_uploads),
             cert_reqs="CERT_NONE",
             ca_certs=certifi.where(),
             retries=Retry(
@@ -25,6 +25,8 @@ import nlds.rabbit.message_keys as MSG
 from nlds_processors.transfer.transfer_error import TransferError
 from nlds_processors.transfer.bucket_transfer import BucketTransferConsumer
 from nlds_processors.bucket_mixin import BucketError
+from nlds_processors.utils.checksum import ChecksumFile, checksum_algorithms
+from nlds_processors.utils.concurrent_transfers import run_transfers
 
 
 class GetTransferConsumer(BucketTransferConsumer):
@@ -128,22 +130,57 @@ class GetTransferConsumer(BucketTransferConsumer):
             raise TransferError(message=reason)
         return download_path
 
-    def _transfer(self, bucket_name, object_name, download_path):
+    def _download(self, bucket_name, object_name, download_path, path_details):
+        """Stream the object to a temporary file next to download_path and rename it
+        to download_path once it is complete, so that a partial file is never left
+        at download_path.  If the catalog has a checksum for the file, in an
+        algorithm that is available, then the checksum of the bytes is calculated as
+        they are written and, if it does not match, the downloaded file is removed
+        and a TransferError raised.  The parent directory must already exist."""
+        verify = (
+            path_details is not None
+            and path_details.checksum
+            and path_details.checksum_algorithm in checksum_algorithms()
+        )
+        part_path = download_path.with_name(download_path.name + ".part.nlds")
+        response = self.s3_client.get_object(bucket_name, object_name)
+        try:
+            with open(part_path, "wb") as fh:
+                if verify:
+                    data = ChecksumFile(fh, path_details.checksum_algorithm)
+                else:
+                    data = fh
+                for chunk in response.stream(self.chunk_size):
+                    data.write(chunk)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        finally:
+            response.close()
+            response.release_conn()
+        if verify and data.checksum != path_details.checksum:
+            part_path.unlink()
+            raise TransferError(
+                message=(
+                    f"Checksum mismatch for {path_details.original_path}: the "
+                    f"{path_details.checksum_algorithm} checksum of the download is "
+                    f"{data.checksum}, but was {path_details.checksum} when it was "
+                    f"uploaded."
+                )
+            )
+        os.replace(part_path, download_path)
+
+    def _transfer(self, bucket_name, object_name, download_path, path_details=None):
+        """Download an object.  This is run in the threads of the concurrent
+        downloads, so it does not log, but raises a TransferError with the reason if
+        the download fails."""
         if self.s3_client is None:
             raise RuntimeError("self.s3_client is None")
-        download_path_str = str(download_path)
         # Attempt the download!
         try:
-            # make any parent directories first
-            # fget_object will make parent directories, but the permissions will be
-            # masked by the users current permissions.
-            # We will have to change the permissions for all of the created parent
-            # directories later
-            resp = self.s3_client.fget_object(
-                bucket_name,
-                object_name,
-                download_path_str,
-            )
+            self._download(bucket_name, object_name, download_path, path_details)
+        except TransferError:
+            raise
         except Exception as e:
             reason = (
                 f"Download-time exception occurred: {e}. "
@@ -238,6 +275,12 @@ class GetTransferConsumer(BucketTransferConsumer):
         created_paths = []
         # keep a list of all the links so that they can be recreated later
         file_is_link_paths = []
+        # the buckets that are known to exist, and the parent directories that have
+        # been made, so that each is only checked (or made) once
+        buckets = set()
+        parent_dirs = set()
+        downloads = []
+        download_paths = {}
         for path_details in filelist:
             # Don't transfer symbolic links
             if path_details.path_type == PathType.LINK:
@@ -248,17 +291,30 @@ class GetTransferConsumer(BucketTransferConsumer):
                 bucket_name, object_name = self._get_bucket_name_object_name(
                     path_details
                 )
-                if not self._bucket_exists(bucket_name):
-                    raise TransferError(
-                        f"Bucket {bucket_name} does not exist in get_transfer."
-                        f"_transfer_files"
-                    )
+                if bucket_name not in buckets:
+                    if not self._bucket_exists(bucket_name):
+                        raise TransferError(
+                            f"Bucket {bucket_name} does not exist in get_transfer."
+                            f"_transfer_files"
+                        )
+                    buckets.add(bucket_name)
                 self.log(
                     f"Starting to get file {object_name} from {bucket_name}",
                     RK.LOG_DEBUG,
                 )
                 download_path = self._get_download_path(path_details, target_path)
-                self._transfer(bucket_name, object_name, download_path)
+                # make any parent directories first - the permissions will be masked
+                # by the users current permissions.  We will have to change the
+                # permissions for all of the created parent directories later
+                if download_path.parent not in parent_dirs:
+                    try:
+                        download_path.parent.mkdir(parents=True, exist_ok=True)
+                    except OSError as e:
+                        raise TransferError(
+                            f"Unable to download {download_path}. Could not make the "
+                            f"directory {download_path.parent}: {e}"
+                        )
+                    parent_dirs.add(download_path.parent)
             except (BucketError, TransferError) as e:
                 path_details.failure_reason = e.message
                 self.log(e.message, RK.LOG_DEBUG)
@@ -269,10 +325,48 @@ class GetTransferConsumer(BucketTransferConsumer):
                     body_json=body_json,
                     state=State.FAILED,
                 )
+                continue
+            download_paths[path_details] = download_path
+            downloads.append(
+                (
+                    path_details,
+                    self._transfer,
+                    (bucket_name, object_name, download_path, path_details),
+                )
+            )
+
+        # download the files concurrently, the permissions and ownership are changed
+        # once all the downloads have finished
+        downloaded = []
+        for path_details, error in run_transfers(
+            downloads,
+            max_transfers=self.num_concurrent_transfers,
+            max_in_flight_size=self.max_in_flight_size,
+        ):
+            if error is None:
+                downloaded.append(path_details)
+            elif isinstance(error, TransferError):
+                path_details.failure_reason = error.message
+                self.log(error.message, RK.LOG_DEBUG)
+                self.append_and_send(
+                    self.failedlist,
+                    path_details,
+                    routing_key=rk_failed,
+                    body_json=body_json,
+                    state=State.FAILED,
+                )
             else:
-                # This is where we change the permissions for all of the created parent
-                # directories
-                # get the parent directories all the way up to the target_path
+                raise error
+
+        # the parent directories whose permissions have been checked
+        checked_dirs = set()
+        for path_details in downloaded:
+            download_path = download_paths[path_details]
+            # This is where we change the permissions for all of the created parent
+            # directories
+            # get the parent directories all the way up to the target_path
+            if download_path.parent not in checked_dirs:
+                checked_dirs.add(download_path.parent)
                 par_dirs = self._get_parent_dirs(download_path, target_path)
                 for p in par_dirs:
                     if p not in created_paths:
@@ -280,23 +374,23 @@ class GetTransferConsumer(BucketTransferConsumer):
                         # into the created directories
                         os.chmod(p, 0o770)
                         created_paths.append(p)
-                try:
-                    # change ownership and permissions.
-                    # This might have to be move to an additional process.
-                    self._change_permissions(download_path, path_details)
-                except TransferError as e:
-                    self.log(
-                        f"Error changing file owner and permissions: {e}", RK.LOG_ERROR
-                    )
-                # all finished successfully!
-                self.log(f"Successfully got {path_details.original_path}", RK.LOG_DEBUG)
-                self.append_and_send(
-                    self.completelist,
-                    path_details,
-                    routing_key=rk_complete,
-                    body_json=body_json,
-                    state=State.TRANSFER_GETTING,
+            try:
+                # change ownership and permissions.
+                # This might have to be move to an additional process.
+                self._change_permissions(download_path, path_details)
+            except TransferError as e:
+                self.log(
+                    f"Error changing file owner and permissions: {e}", RK.LOG_ERROR
                 )
+            # all finished successfully!
+            self.log(f"Successfully got {path_details.original_path}", RK.LOG_DEBUG)
+            self.append_and_send(
+                self.completelist,
+                path_details,
+                routing_key=rk_complete,
+                body_json=body_json,
+                state=State.TRANSFER_GETTING,
+            )
 
         # change the owner on the created paths
         for cp in created_paths:
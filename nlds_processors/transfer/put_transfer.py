@@ -10,6 +10,7 @@ __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
 from typing import List, Dict, Any
+import os
 
 import minio
 from minio.error import S3Error
@@ -17,6 +18,9 @@ from retry import retry
 from urllib3.exceptions import HTTPError, MaxRetryError
 
 from nlds_processors.transfer.bucket_transfer import BucketTransferConsumer
+from nlds_processors.transfer.base_transfer import BaseTransferConsumer
+from nlds_processors.utils.checksum import ChecksumFile, checksum_algorithms
+from nlds_processors.utils.concurrent_transfers import run_transfers
 from nlds.rabbit.consumer import State
 from nlds.details import PathDetails, PathType
 import nlds.rabbit.routing_keys as RK
@@ -28,9 +32,53 @@ class PutTransferConsumer(BucketTransferConsumer):
     DEFAULT_ROUTING_KEY = f"{RK.ROOT}." f"{RK.TRANSFER_PUT}." f"{RK.WILD}"
     DEFAULT_STATE = State.TRANSFER_PUTTING
 
+    _CHECKSUM_ALGORITHM = "checksum_algorithm"
+    TRANSFER_PUT_CONSUMER_CONFIG = {
+        _CHECKSUM_ALGORITHM: "adler32",
+    }
+    DEFAULT_CONSUMER_CONFIG = (
+        TRANSFER_PUT_CONSUMER_CONFIG | BaseTransferConsumer.DEFAULT_CONSUMER_CONFIG
+    )
+
     def __init__(self, queue=DEFAULT_QUEUE_NAME):
         super().__init__(queue=queue)
         self.s3_client = None
+        self.checksum_algorithm = self.load_config_value(self._CHECKSUM_ALGORITHM)
+        if (
+            self.checksum_algorithm is not None
+            and self.checksum_algorithm not in checksum_algorithms()
+        ):
+            raise ValueError(
+                f"Checksum algorithm {self.checksum_algorithm} is not available, "
+                f"choose one of {checksum_algorithms()}"
+            )
+
+    def _upload(self, bucket_name: str, object_name: str, path_details: PathDetails):
+        """Upload a file to the object storage.  The checksum of the file is
+        calculated as it is read for the upload, and stored in the PathDetails."""
+        if self.checksum_algorithm is None:
+            return self.s3_client.fput_object(
+                bucket_name,
+                object_name,
+                path_details.original_path,
+                part_size=self.chunk_size,
+                num_parallel_uploads=self.num_parallel_uploads,
+            )
+        with open(path_details.original_path, "rb") as fh:
+            # minio reads the parts sequentially, even when they are uploaded in
+            # parallel, so the checksum is that of the whole file
+            data = ChecksumFile(fh, self.checksum_algorithm)
+            result = self.s3_client.put_object(
+                bucket_name,
+                object_name,
+                data,
+                length=os.fstat(fh.fileno()).st_size,
+                part_size=self.chunk_size,
+                num_parallel_uploads=self.num_parallel_uploads,
+            )
+        path_details.checksum = data.checksum
+        path_details.checksum_algorithm = self.checksum_algorithm
+        return result
 
     def _transfer_files(
         self,
@@ -73,12 +121,36 @@ class PutTransferConsumer(BucketTransferConsumer):
         if self.s3_client is None:
             raise RuntimeError("self.s3_client is None")
 
+        # the files to upload, the others are acknowledged or failed straight away
+        uploads = []
         for path_details in filelist:
             # Don't transfer symbolic links, but do acknowledge them
             if path_details.path_type == PathType.LINK:
                 self.completelist.append(path_details)
                 continue
 
+            # Don't transfer files that the catalog has found to be duplicates of an
+            # object that has already been uploaded, their location is that object
+            # (rather than the object this transfer would create)
+            pl = path_details.get_object_store()
+            if pl is not None and (pl.root, pl.path) != (
+                transaction_id,
+                path_details.original_path,
+            ):
+                self.log(
+                    f"Not uploading {path_details.original_path}, it is a duplicate "
+                    f"of {path_details.bucket_name}/{path_details.object_name}",
+                    RK.LOG_DEBUG,
+                )
+                self.append_and_send(
+                    self.completelist,
+                    path_details,
+                    routing_key=rk_complete,
+                    body_json=body_json,
+                    state=State.TRANSFER_PUTTING,
+                )
+                continue
+
             # Get the path
             item_path = path_details.path
 
@@ -111,17 +183,22 @@ class PutTransferConsumer(BucketTransferConsumer):
 
             # Add this to the PathDetails as the StorageLocation
             pl = path_details.set_object_store(tenancy=tenancy, bucket=transaction_id)
-            try:
-                result = self.s3_client.fput_object(
-                    bucket_name,
-                    pl.path,
-                    path_details.original_path,
-                    part_size=self.chunk_size,
-                    num_parallel_uploads=self.num_parallel_uploads,
-                )
+            uploads.append(
+                (path_details, self._upload, (bucket_name, pl.path, path_details))
+            )
+
+        # upload the files concurrently, the results are handled in this thread as
+        # each upload finishes
+        for path_details, error in run_transfers(
+            uploads,
+            max_transfers=self.num_concurrent_transfers,
+            max_in_flight_size=self.max_in_flight_size,
+        ):
+            if error is None:
                 self.log(
                     f"Successfully uploaded {path_details.original_path} to "
-                    f"bucket {bucket_name} with object_name {pl.path}",
+                    f"bucket {bucket_name} with object_name "
+                    f"{path_details.object_name}",
                     RK.LOG_DEBUG,
                 )
                 self.log(f"Uploaded {path_details.original_path}", RK.LOG_INFO)
@@ -132,9 +209,9 @@ class PutTransferConsumer(BucketTransferConsumer):
                     body_json=body_json,
                     state=State.TRANSFER_PUTTING,
                 )
-            except (HTTPError, MaxRetryError, PermissionError) as e:
+            elif isinstance(error, (HTTPError, MaxRetryError, PermissionError)):
                 reason = (
-                    f"Error uploading {path_details.path} to object " f"store: {e}."
+                    f"Error uploading {path_details.path} to object store: {error}."
                 )
                 self.log(f"{reason} Adding to failed list.", RK.LOG_ERROR)
                 path_details.failure_reason = reason
@@ -145,7 +222,8 @@ class PutTransferConsumer(BucketTransferConsumer):
                     body_json=body_json,
                     state=State.FAILED,
                 )
-                continue
+            else:
+                raise error
 
     @retry(S3Error, tries=5, delay=1, backoff=2, logger=None)
     def transfer(
@@ -0,0 +1,105 @@
+# encoding: utf-8
+"""
+checksum.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import hashlib
+from zlib import adler32
+
+# xxhash and blake3 are optional, the algorithms are only available if they are
+# installed
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# the algorithm used for the content fingerprint of a file, when deduplicating
+# uploads.  This has to be a cryptographic hash: two files with the same size and
+# fingerprint are treated as identical, and only one of them is uploaded.
+FINGERPRINT_ALGORITHM = "blake2b"
+# size of the blocks that files are read in when calculating a checksum
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class Adler32Hash:
+    """adler32 with the same interface as the hashlib hashes"""
+
+    def __init__(self):
+        self.value = 1
+
+    def update(self, b) -> None:
+        self.value = adler32(b, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:08x}"
+
+
+def checksum_algorithms() -> list[str]:
+    """The checksum algorithms that are available"""
+    algorithms = ["adler32", "blake2b"]
+    if xxhash is not None:
+        algorithms.append("xxhash")
+    if blake3 is not None:
+        algorithms.append("blake3")
+    return algorithms
+
+
+def new_hash(algorithm: str):
+    """Create a hash object, with update and hexdigest methods, for the algorithm"""
+    if algorithm == "adler32":
+        return Adler32Hash()
+    elif algorithm == "blake2b":
+        return hashlib.blake2b()
+    elif algorithm == "xxhash" and xxhash is not None:
+        return xxhash.xxh3_64()
+    elif algorithm == "blake3" and blake3 is not None:
+        return blake3.blake3()
+    raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+
+
+class ChecksumFile:
+    """Wrapper class around a File object that calculates the checksum of all the
+    bytes read from, or written to, the file, as Adler32File does.  The bytes must
+    be read or written sequentially for the checksum to be that of the file."""
+
+    def __init__(self, f, algorithm: str):
+        self.f = f
+        self.algorithm = algorithm
+        self.hash = new_hash(algorithm)
+
+    def read(self, size: int = -1):
+        result = self.f.read(size)
+        self.hash.update(result)
+        return result
+
+    def write(self, b):
+        self.hash.update(b)
+        return self.f.write(b)
+
+    @property
+    def checksum(self) -> str:
+        return self.hash.hexdigest()
+
+
+def file_checksum(
+    path: str,
+    algorithm: str = FINGERPRINT_ALGORITHM,
+    block_size: int = CHECKSUM_BLOCK_SIZE,
+) -> str:
+    """Calculate the checksum of the contents of the file at path, reading it in
+    blocks of block_size bytes.  Returns the checksum as a hex string."""
+    with open(path, "rb") as fh:
+        cf = ChecksumFile(fh, algorithm)
+        while cf.read(block_size):
+            pass
+    return cf.checksum
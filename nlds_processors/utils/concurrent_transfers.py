@@ -0,0 +1,63 @@
+# encoding: utf-8
+"""
+concurrent_transfers.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+from nlds.details import PathDetails
+
+DEFAULT_MAX_IN_FLIGHT_SIZE = 1024**3  # 1 GiB
+
+# a transfer is the PathDetails of the file, and the function (and its arguments)
+# that transfers it
+Transfer = Tuple[PathDetails, Callable, Tuple[Any, ...]]
+
+
+def run_transfers(
+    transfers: Iterable[Transfer],
+    max_transfers: int = 1,
+    max_in_flight_size: int = DEFAULT_MAX_IN_FLIGHT_SIZE,
+) -> Iterator[Tuple[PathDetails, BaseException]]:
+    """Run the transfers in a pool of max_transfers threads, so that many (small)
+    files are transferred at the same time, rather than one after another.  A
+    transfer is not started while the total size of the files being transferred
+    would be more than max_in_flight_size, unless no others are running, so that a
+    file bigger than max_in_flight_size is still transferred (on its own).
+
+    Yields the PathDetails of each transfer as it finishes, with the exception it
+    raised (or None if it succeeded).  The transfers are taken from the iterable,
+    and the results yielded, in the calling thread, so that it is safe for the
+    caller to add the PathDetails to its lists and send messages while the
+    transfers run.  Only the transfer functions are run in the threads."""
+    in_flight = {}
+    in_flight_size = 0
+    with ThreadPoolExecutor(max_workers=max_transfers) as executor:
+
+        def finished():
+            # wait for at least one of the transfers in flight to finish
+            nonlocal in_flight_size
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path_details = in_flight.pop(future)
+                in_flight_size -= path_details.size or 0
+                yield path_details, future.exception()
+
+        for path_details, transfer_fn, args in transfers:
+            size = path_details.size or 0
+            while len(in_flight) > 0 and (
+                len(in_flight) >= max_transfers
+                or in_flight_size + size > max_in_flight_size
+            ):
+                yield from finished()
+            in_flight[executor.submit(transfer_fn, *args)] = path_details
+            in_flight_size += size
+        while len(in_flight) > 0:
+            yield from finished()
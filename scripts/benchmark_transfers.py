@@ -0,0 +1,115 @@
+# encoding: utf-8
+"""
+benchmark_transfers.py
+Benchmark the concurrent uploads of the transfer-put consumer against an object
+store, reporting the files/s and MB/s for each number of concurrent transfers.  Use
+a local S3 stand-in, rather than a production tenancy, e.g. a MinIO server:
+
+    minio server /tmp/minio-data --address localhost:9000
+    python -m scripts.benchmark_transfers localhost:9000 minioadmin minioadmin
+
+or a moto server (`moto_server -p 9000`, any access and secret key).  Note that a
+local stand-in has almost no latency per request, and a moto server is limited by
+its own CPU, so the gain from concurrency is much smaller than against a real
+object store.
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import os
+import tempfile
+import time
+import uuid
+
+import click
+import minio
+import urllib3
+
+from nlds.details import PathDetails
+from nlds_processors.utils.concurrent_transfers import (
+    DEFAULT_MAX_IN_FLIGHT_SIZE,
+    run_transfers,
+)
+
+
+@click.command()
+@click.argument("endpoint", type=str)
+@click.argument("access_key", type=str)
+@click.argument("secret_key", type=str)
+@click.option("--files", type=int, default=1000, help="Number of files to upload.")
+@click.option("--size", type=int, default=64 * 1024, help="Size of each file, bytes.")
+@click.option(
+    "--concurrency",
+    type=int,
+    multiple=True,
+    default=(1, 4, 16, 32),
+    help="Number of concurrent transfers, can be given more than once.",
+)
+@click.option(
+    "--max-in-flight-size",
+    type=int,
+    default=DEFAULT_MAX_IN_FLIGHT_SIZE,
+    help="Maximum bytes being uploaded at the same time.",
+)
+@click.option("--secure/--insecure", default=False, help="Use https.")
+def benchmark_transfers(
+    endpoint,
+    access_key,
+    secret_key,
+    files,
+    size,
+    concurrency,
+    max_in_flight_size,
+    secure,
+):
+    http = urllib3.PoolManager(maxsize=max(concurrency))
+    client = minio.Minio(
+        endpoint,
+        access_key=access_key,
+        secret_key=secret_key,
+        secure=secure,
+        http_client=http,
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filelist = []
+        for i in range(files):
+            path = os.path.join(tmpdir, f"file_{i}")
+            with open(path, "wb") as fh:
+                fh.write(os.urandom(size))
+            filelist.append(PathDetails(original_path=path, size=size))
+
+        for n in concurrency:
+            bucket_name = f"nlds-benchmark-{uuid.uuid4()}"
+            client.make_bucket(bucket_name)
+            uploads = [
+                (
+                    pd,
+                    client.fput_object,
+                    (bucket_name, pd.original_path, pd.original_path),
+                )
+                for pd in filelist
+            ]
+            start = time.perf_counter()
+            n_failed = 0
+            for _, error in run_transfers(
+                uploads, max_transfers=n, max_in_flight_size=max_in_flight_size
+            ):
+                if error is not None:
+                    n_failed += 1
+            elapsed = time.perf_counter() - start
+            click.echo(
+                f"concurrency {n:3d}: {files / elapsed:8.1f} files/s "
+                f"{files * size / elapsed / 1024**2:8.1f} MB/s "
+                f"({n_failed} failed)"
+            )
+            for obj in client.list_objects(bucket_name, recursive=True):
+                client.remove_object(bucket_name, obj.object_name)
+            client.remove_bucket(bucket_name)
+
+
+if __name__ == "__main__":
+    benchmark_transfers()
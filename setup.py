@@ -90,6 +90,9 @@ setup(
             "archive_put_q=nlds_processors.archive.archive_put:main",
             "archive_get_q=nlds_processors.archive.archive_get:main",
             "send_archive_next=nlds_processors.archive.send_archive_next:send_archive_next",
+            "reconcile_catalog_usage=nlds_processors.catalog.reconcile_usage:reconcile_catalog_usage",
+            "partition_catalog=nlds_processors.catalog.partition_catalog:partition_catalog",
+            "compact_monitor=nlds_processors.monitor.compact_monitor:compact_monitor",
         ],
     },
 )
@@ -25,6 +25,12 @@ from nlds_utils.generate_server_config import generate_server_config
 TEMPLATE_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "server_config.j2")
 
 
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "postgresql: needs a PostgreSQL database, see NLDS_TEST_POSTGRES_DB"
+    )
+
+
 @pytest.fixture
 def template_config():
     config_path = TEMPLATE_CONFIG_PATH
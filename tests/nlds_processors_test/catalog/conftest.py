@@ -0,0 +1,131 @@
+# encoding: utf-8
+"""
+conftest.py
+Fixtures shared by the catalog tests: an in-memory SQLite catalog, and factories
+for the PathDetails, Files and Holdings that the tests add to it.
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_models import File, Storage
+from nlds.details import PathDetails, PathType
+
+USER = "test-user"
+GROUP = "test-group"
+TENANCY = "test-tenancy"
+
+
+@pytest.fixture()
+def catalog_options():
+    """Keyword arguments for the Catalog, override in a test module to change
+    them"""
+    return {}
+
+
+@pytest.fixture()
+def mock_catalog(catalog_options):
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    catalog = Catalog("sqlite", db_options, **catalog_options)
+    catalog.connect()
+    catalog.start_session()
+    yield catalog
+    catalog.end_session()
+
+
+def _make_path_details(path, size=1024, checksum=None):
+    return PathDetails(
+        original_path=path,
+        path_type=PathType.FILE,
+        size=size,
+        user=100,
+        group=100,
+        permissions=0o644,
+        checksum=checksum,
+        checksum_algorithm=None if checksum is None else "blake2b",
+    )
+
+
+@pytest.fixture()
+def make_path_details():
+    """Factory for the PathDetails of a file:
+    make_path_details(path, size=1024, checksum=None)"""
+    return _make_path_details
+
+
+@pytest.fixture()
+def add_files(mock_catalog):
+    """Factory adding a transaction, <label>-transaction, to a holding with n_files
+    files called /<label>/file_<i> (or the PathDetails in filelist), each with a
+    Location of storage_type (or none if storage_type is None), and returning the
+    Files:
+    add_files(holding, label, n_files=0, size=1024, filelist=None,
+              storage_type=Storage.OBJECT_STORAGE, url_scheme="http",
+              url_netloc=TENANCY, root="bucket", age=0)
+    age is the number of days since the transaction was ingested."""
+
+    def add_files(
+        holding,
+        label,
+        n_files=0,
+        size=1024,
+        filelist=None,
+        storage_type=Storage.OBJECT_STORAGE,
+        url_scheme="http",
+        url_netloc=TENANCY,
+        root="bucket",
+        age=0,
+    ):
+        if filelist is None:
+            filelist = [
+                _make_path_details(f"/{label}/file_{i}", size) for i in range(n_files)
+            ]
+        transaction = mock_catalog.create_transaction(holding, f"{label}-transaction")
+        transaction.ingest_time = datetime.now() - timedelta(days=age)
+        mock_catalog.create_files(transaction, filelist)
+        files = (
+            mock_catalog.session.query(File)
+            .filter(File.transaction_id == transaction.id)
+            .all()
+        )
+        if storage_type is not None:
+            mock_catalog.create_locations(
+                [
+                    mock_catalog.create_location(
+                        f,
+                        storage_type,
+                        url_scheme,
+                        url_netloc,
+                        root,
+                        f.original_path,
+                        datetime.now(),
+                    )
+                    for f in files
+                ]
+            )
+        return files
+
+    return add_files
+
+
+@pytest.fixture()
+def add_holding(mock_catalog, add_files):
+    """Factory adding a holding, with the files of add_files, committing it and
+    returning the Holding and its Files:
+    add_holding(label, n_files=0, user=USER, group=GROUP, **add_files_kwargs)"""
+
+    def add_holding(label, n_files=0, user=USER, group=GROUP, **kwargs):
+        holding = mock_catalog.create_holding(user, group, label)
+        files = add_files(holding, label, n_files, **kwargs)
+        mock_catalog.commit()
+        return holding, files
+
+    return add_holding
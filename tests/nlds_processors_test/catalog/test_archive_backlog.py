@@ -0,0 +1,94 @@
+# encoding: utf-8
+"""
+test_archive_backlog.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime
+
+import pytest
+
+from nlds_processors.catalog.catalog import CatalogError
+from nlds_processors.catalog.catalog_models import Storage, ArchiveBacklog
+
+TENANCY = "test-tenancy"
+
+
+class TestArchiveBacklog:
+
+    def test_backlog_maintained(self, mock_catalog, add_holding):
+        holding, files = add_holding("label-1", 3, group="group-1")
+        assert mock_catalog.session.query(ArchiveBacklog).count() == 3
+        assert mock_catalog.get_unarchived_files(holding).count() == 3
+        # adding a tape location removes the file from the backlog
+        mock_catalog.bulk_insert_objects(
+            [
+                mock_catalog.create_location(
+                    files[0],
+                    Storage.TAPE,
+                    "",
+                    "",
+                    "",
+                    files[0].original_path,
+                    datetime.now(),
+                )
+            ]
+        )
+        mock_catalog.commit()
+        assert mock_catalog.get_unarchived_files(holding).count() == 2
+        # and removing it again puts the file back
+        mock_catalog.delete_location(files[0], Storage.TAPE)
+        mock_catalog.commit()
+        assert mock_catalog.get_unarchived_files(holding).count() == 3
+        # removing the object storage location takes it out
+        mock_catalog.delete_location(files[1], Storage.OBJECT_STORAGE)
+        mock_catalog.commit()
+        assert mock_catalog.get_unarchived_files(holding).count() == 2
+
+    def test_no_backlog(self, mock_catalog, add_holding):
+        assert mock_catalog.get_next_unarchived_holding(TENANCY) is None
+        add_holding("label-1", 3, group="group-1")
+        assert mock_catalog.get_next_unarchived_holding("other-tenancy") is None
+
+    def test_policies(self, mock_catalog, add_holding):
+        oldest, _ = add_holding("label-1", 2, group="group-1", age=10)
+        largest, _ = add_holding("label-2", 4, group="group-2", age=5)
+        newest, _ = add_holding("label-3", 1, group="group-3", age=1)
+        get_next = mock_catalog.get_next_unarchived_holding
+        assert get_next(TENANCY, policy="oldest").id == oldest.id
+        assert get_next(TENANCY, policy="largest").id == largest.id
+        assert get_next(TENANCY, policy="random").id in (
+            oldest.id,
+            largest.id,
+            newest.id,
+        )
+        with pytest.raises(CatalogError):
+            get_next(TENANCY, policy="gibberish")
+
+    def test_round_robin(self, mock_catalog, add_holding):
+        add_holding("label-1", 1, group="group-1", age=10)
+        add_holding("label-2", 1, group="group-1", age=9)
+        add_holding("label-3", 1, group="group-2", age=1)
+        groups = []
+        for _ in range(3):
+            holding = mock_catalog.get_next_unarchived_holding(
+                TENANCY, policy="round_robin"
+            )
+            groups.append(holding.group)
+            # archive it, as catalog_archive_put does, by adding tape locations
+            files = mock_catalog.get_unarchived_files(holding).all()
+            mock_catalog.bulk_insert_objects(
+                [
+                    mock_catalog.create_location(
+                        f, Storage.TAPE, "", "", "", f.original_path, datetime.now()
+                    )
+                    for f in files
+                ]
+            )
+            mock_catalog.commit()
+        assert groups == ["group-1", "group-2", "group-1"]
@@ -0,0 +1,124 @@
+# encoding: utf-8
+"""
+test_bulk_locations.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime
+
+import pytest
+
+from nlds_processors.catalog.catalog import CatalogError
+from nlds_processors.catalog.catalog_models import (
+    File,
+    Holding,
+    Location,
+    Storage,
+    Tag,
+    Transaction,
+)
+from nlds.details import PathDetails
+
+USER = "test-user"
+GROUP = "test-group"
+# small files with empty locations, as catalog_put adds them before the transfer
+EMPTY_FILES = {"size": 10, "url_scheme": "", "url_netloc": "", "root": ""}
+
+
+class TestBulkLocations:
+
+    def test_update_locations(self, mock_catalog, add_holding):
+        holding, files = add_holding("label-1", 3, **EMPTY_FILES)
+        mock_catalog.update_locations(
+            Storage.OBJECT_STORAGE,
+            [
+                {
+                    "file_id": f.id,
+                    "url_scheme": "http",
+                    "url_netloc": "tenancy",
+                    "root": "bucket",
+                    "path": f"object_{i}",
+                    "access_time": datetime.now(),
+                }
+                for i, f in enumerate(files[:2])
+            ],
+        )
+        mock_catalog.commit()
+        locations = {l.file_id: l for l in mock_catalog.session.query(Location).all()}
+        assert locations[files[0].id].path == "object_0"
+        assert locations[files[1].id].url_netloc == "tenancy"
+        assert locations[files[2].id].url_netloc == ""
+        # the files are in the archive backlog, with the updated tenancy
+        assert mock_catalog.get_next_unarchived_holding("tenancy").id == holding.id
+
+    def test_update_locations_path(self, mock_catalog, add_holding):
+        _, files = add_holding("label-1", 2, **EMPTY_FILES)
+        mock_catalog.update_locations(
+            Storage.OBJECT_STORAGE,
+            [
+                {"file_id": files[0].id, "path": files[0].original_path},
+                {"file_id": files[1].id, "path": "object_1"},
+            ],
+        )
+        mock_catalog.commit()
+        mock_catalog.session.expire_all()
+        locations = {l.file_id: l for l in mock_catalog.session.query(Location).all()}
+        # the original path of the file is not stored again in the Location
+        assert locations[files[0].id].stored_path is None
+        assert locations[files[0].id].path == files[0].original_path
+        assert locations[files[1].id].stored_path == "object_1"
+
+    def test_delete_empty_locations(self, mock_catalog, add_holding):
+        _, files = add_holding("label-1", 3, storage_type=Storage.TAPE, **EMPTY_FILES)
+        mock_catalog.update_locations(
+            Storage.TAPE,
+            [{"file_id": files[0].id, "url_netloc": "tape", "root": "tarfile"}],
+        )
+        deleted = mock_catalog.delete_locations(
+            Storage.TAPE, [f.id for f in files], empty_only=True
+        )
+        mock_catalog.commit()
+        assert sorted(deleted) == sorted(f.id for f in files[1:])
+        assert mock_catalog.session.query(Location).count() == 1
+
+    def test_delete_files(self, mock_catalog, add_holding):
+        holding, files = add_holding("label-1", 3, **EMPTY_FILES)
+        other, _ = add_holding("label-2", 2, **EMPTY_FILES)
+        mock_catalog.create_tag(holding, "key", "value")
+        mock_catalog.create_tag(other, "key", "value")
+        paths = [f.original_path for f in files]
+        deleted = mock_catalog.delete_files(
+            USER,
+            GROUP,
+            holding_label="label-1",
+            filelist=[PathDetails(original_path=p) for p in paths[:2]],
+        )
+        mock_catalog.commit()
+        assert sorted(deleted) == sorted(paths[:2])
+        assert mock_catalog.session.query(File).count() == 3
+        assert mock_catalog.session.query(Location).count() == 3
+        mock_catalog.session.refresh(holding)
+        assert holding.file_count == 1
+        # deleting the last file removes the transaction, holding and tags
+        mock_catalog.delete_files(USER, GROUP, holding_label="label-1", path=paths[2])
+        mock_catalog.commit()
+        assert mock_catalog.session.query(Holding).count() == 1
+        assert mock_catalog.session.query(Transaction).count() == 1
+        assert mock_catalog.session.query(Tag).count() == 1
+        assert mock_catalog.get_group_usage(GROUP).file_count == 2
+        with pytest.raises(CatalogError):
+            mock_catalog.delete_files(
+                USER, GROUP, holding_label="label-2", path="/not/a/file"
+            )
+
+    def test_get_file_ids(self, mock_catalog, add_holding):
+        holding, files = add_holding("label-1", 3, **EMPTY_FILES)
+        file_ids = mock_catalog.get_file_ids(
+            holding.id, [files[0].original_path, "/not/a/file"]
+        )
+        assert file_ids == {files[0].original_path: files[0].id}
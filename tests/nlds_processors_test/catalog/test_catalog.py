@@ -57,7 +57,7 @@ def mock_transaction():
 def mock_file():
     new_file = File(
         transaction_id=None,
-        original_path="/test/path",
+        basename="path",
         path_type=PathType["FILE"],
         link_path=None,
         size=1050,
@@ -467,7 +467,7 @@ class TestCatalog:
         for i in range(10):
             new_file_2 = File(
                 transaction_id=mock_transaction.id,
-                original_path=f"/test/path-{i}",
+                basename=f"path-{i}",
                 path_type=PathType["FILE"],
                 link_path=None,
                 size=1050,
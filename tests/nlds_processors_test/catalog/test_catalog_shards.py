@@ -0,0 +1,107 @@
+# encoding: utf-8
+"""
+test_catalog_shards.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime
+
+import pytest
+
+from nlds_processors.catalog.catalog import Catalog, CatalogError
+from nlds_processors.catalog.catalog_shards import CatalogShards
+from nlds.details import PathDetails, PathType
+
+
+def make_catalog():
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    return Catalog("sqlite", db_options)
+
+
+@pytest.fixture()
+def shards():
+    # two separate in-memory databases, group-b is stored in shard-b
+    shards = CatalogShards(
+        {"shard-a": make_catalog(), "shard-b": make_catalog()},
+        routing={"group-b": "shard-b"},
+    )
+    shards.connect()
+    shards.start_session()
+    yield shards
+    shards.end_session()
+
+
+def add_holding(catalog, user, group, label, ingest_time):
+    holding = catalog.create_holding(user, group, label)
+    transaction = catalog.create_transaction(holding, f"{label}-transaction")
+    transaction.ingest_time = ingest_time
+    catalog.create_files(
+        transaction,
+        [PathDetails(original_path=f"/{label}/file", path_type=PathType.FILE, size=1)],
+    )
+    catalog.commit()
+    return holding
+
+
+class TestCatalogShards:
+
+    def test_routing(self, shards):
+        assert shards.default_shard == "shard-a"
+        assert shards.catalog("group-b") is shards.catalogs["shard-b"]
+        assert shards.catalog("group-c") is shards.catalogs["shard-a"]
+        assert list(shards.route("group-b").keys()) == ["shard-b"]
+        assert shards.route("**all**") == shards.catalogs
+        with pytest.raises(CatalogError):
+            CatalogShards({"shard-a": make_catalog()}, routing={"group": "shard-b"})
+
+    def test_fan_out(self, shards):
+        add_holding(
+            shards.catalog("group-a"),
+            "user",
+            "group-a",
+            "label-1",
+            datetime(2024, 1, 3),
+        )
+        add_holding(
+            shards.catalog("group-b"),
+            "user",
+            "group-b",
+            "label-2",
+            datetime(2024, 1, 1),
+        )
+        add_holding(
+            shards.catalog("group-a"),
+            "user",
+            "group-a",
+            "label-3",
+            datetime(2024, 1, 2),
+        )
+        # a group's holdings are only in its own shard
+        labels = [h.label for h in shards.get_holdings("user", "group-b")]
+        assert labels == ["label-2"]
+        # the holdings of all groups are merged, in order of ingest time
+        labels = [h.label for h in shards.get_holdings("**all**", "**all**")]
+        assert labels == ["label-2", "label-3", "label-1"]
+        labels = [
+            h.label
+            for h in shards.get_holdings("**all**", "**all**", limit=2, descending=True)
+        ]
+        assert labels == ["label-1", "label-3"]
+        rows = shards.get_files("**all**", "**all**")
+        assert [r.File.original_path for r in rows] == [
+            "/label-2/file",
+            "/label-3/file",
+            "/label-1/file",
+        ]
+        # no shard has a matching holding
+        with pytest.raises(CatalogError):
+            shards.get_holdings("**all**", "**all**", label="label-4")
+        with pytest.raises(CatalogError):
+            shards.get_files("**all**", "**all**", holding_label="label-4")
+        with shards.read_session("**all**"):
+            assert len(shards.get_holdings("**all**", "**all**")) == 3
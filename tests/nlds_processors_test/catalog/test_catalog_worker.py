@@ -9,11 +9,15 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
+from collections import namedtuple
 import pytest
 import functools
 
-from nlds.rabbit import publisher as publ
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_shards import CatalogShards
 from nlds_processors.catalog.catalog_worker import CatalogConsumer
+from nlds.utils.cache import LRUCache
+import nlds.rabbit.message_keys as MSG
 
 
 def mock_load_config(template_config):
@@ -24,6 +28,143 @@ def mock_load_config(template_config):
 def default_catalog(monkeypatch, template_config):
     # Ensure template is loaded instead of .server_config
     monkeypatch.setattr(
-        publ, "load_config", functools.partial(mock_load_config, template_config)
+        "nlds.server_config.load_config",
+        functools.partial(mock_load_config, template_config),
     )
     return CatalogConsumer()
+
+
+def test_catalog_stat(default_catalog, monkeypatch):
+    consumer = default_catalog
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    consumer.catalog = Catalog("sqlite", db_options)
+    consumer.catalog.connect()
+    consumer.catalog.start_session()
+    holding = consumer.catalog.create_holding("test-user", "test-group", "label-1")
+    consumer.catalog.create_transaction(holding, "transaction-1")
+    other = consumer.catalog.create_holding("other-user", "other-group", "label-2")
+    consumer.catalog.create_transaction(other, "transaction-2")
+    consumer.catalog.commit()
+
+    sent = []
+    monkeypatch.setattr(
+        consumer, "publish_message", lambda *args, **kwargs: sent.append(kwargs)
+    )
+    properties = namedtuple("Properties", ["reply_to", "correlation_id"])(
+        "reply", "correlation"
+    )
+
+    def stat():
+        body = {
+            MSG.DETAILS: {MSG.USER: "test-user", MSG.GROUP: "test-group"},
+            MSG.DATA: {
+                MSG.RECORD_LIST: [
+                    {"transaction_id": "transaction-1"},
+                    {"transaction_id": "transaction-2"},
+                    {"transaction_id": "transaction-3"},
+                ]
+            },
+            MSG.META: {},
+        }
+        consumer._catalog_stat(body, properties)
+        return sent[-1]["msg_dict"][MSG.DATA][MSG.TRANSACTIONS]
+
+    # labels of other groups' holdings and unknown transactions are blank
+    expected = {"transaction-1": "label-1", "transaction-2": "", "transaction-3": ""}
+    assert stat() == expected
+    assert "transaction-1" in consumer.transaction_cache
+    assert "transaction-3" not in consumer.transaction_cache
+    # a relabelled holding is returned with its new label
+    holding.label = "label-3"
+    consumer.catalog.commit()
+    expected["transaction-1"] = "label-3"
+    assert stat() == expected
+
+
+@pytest.mark.parametrize("cache_size", [0, 2])
+def test_catalog_stat_cache_size(default_catalog, monkeypatch, cache_size):
+    # the labels are returned whether the cache is disabled or too small to hold
+    # all the transactions of the stat
+    consumer = default_catalog
+    consumer.transaction_cache = LRUCache(cache_size)
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    consumer.catalog = Catalog("sqlite", db_options)
+    consumer.catalog.connect()
+    consumer.catalog.start_session()
+    expected = {}
+    for i in range(5):
+        holding = consumer.catalog.create_holding(
+            "test-user", "test-group", f"label-{i}"
+        )
+        consumer.catalog.create_transaction(holding, f"transaction-{i}")
+        expected[f"transaction-{i}"] = f"label-{i}"
+    consumer.catalog.commit()
+
+    sent = []
+    monkeypatch.setattr(
+        consumer, "publish_message", lambda *args, **kwargs: sent.append(kwargs)
+    )
+    properties = namedtuple("Properties", ["reply_to", "correlation_id"])(
+        "reply", "correlation"
+    )
+    body = {
+        MSG.DETAILS: {MSG.USER: "test-user", MSG.GROUP: "test-group"},
+        MSG.DATA: {MSG.RECORD_LIST: [{"transaction_id": t} for t in expected]},
+        MSG.META: {},
+    }
+    for _ in range(2):
+        consumer._catalog_stat(body, properties)
+        assert sent[-1]["msg_dict"][MSG.DATA][MSG.TRANSACTIONS] == expected
+        assert len(consumer.transaction_cache) == cache_size
+
+
+def test_catalog_stat_sharded(default_catalog, monkeypatch):
+    consumer = default_catalog
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    consumer._shards = CatalogShards(
+        {
+            "shard-a": Catalog("sqlite", db_options),
+            "shard-b": Catalog("sqlite", db_options),
+        },
+        routing={"group-b": "shard-b"},
+    )
+    consumer._shards.connect()
+    consumer._shards.start_session()
+    # the holdings in the two shards have the same id
+    for group in ("group-a", "group-b"):
+        catalog = consumer.shards.catalog(group)
+        holding = catalog.create_holding("test-user", group, f"label-{group}")
+        catalog.create_transaction(holding, f"transaction-{group}")
+        catalog.commit()
+
+    sent = []
+    monkeypatch.setattr(
+        consumer, "publish_message", lambda *args, **kwargs: sent.append(kwargs)
+    )
+    properties = namedtuple("Properties", ["reply_to", "correlation_id"])(
+        "reply", "correlation"
+    )
+
+    def stat(group):
+        body = {
+            MSG.DETAILS: {MSG.USER: "test-user", MSG.GROUP: group},
+            MSG.DATA: {
+                MSG.RECORD_LIST: [
+                    {"transaction_id": "transaction-group-a"},
+                    {"transaction_id": "transaction-group-b"},
+                ]
+            },
+            MSG.META: {},
+        }
+        consumer._catalog_stat(body, properties)
+        return sent[-1]["msg_dict"][MSG.DATA][MSG.TRANSACTIONS]
+
+    # a group's query only goes to its shard, a query of all groups to every shard
+    assert stat("group-b") == {
+        "transaction-group-a": "",
+        "transaction-group-b": "label-group-b",
+    }
+    assert stat("**all**") == {
+        "transaction-group-a": "label-group-a",
+        "transaction-group-b": "label-group-b",
+    }
@@ -0,0 +1,112 @@
+# encoding: utf-8
+"""
+test_dedup.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+from nlds_processors.catalog.catalog_models import Checksum, File
+from nlds_processors.utils.checksum import file_checksum
+from nlds.details import PathDetails
+
+USER = "test-user"
+GROUP = "test-group"
+TENANCY = "test-tenancy"
+
+
+class TestDedup:
+
+    def test_file_checksum(self, tmp_path):
+        a = tmp_path / "a"
+        b = tmp_path / "b"
+        a.write_bytes(b"some contents")
+        b.write_bytes(b"some contents")
+        assert file_checksum(a) == file_checksum(b)
+        b.write_bytes(b"other contents")
+        assert file_checksum(a) != file_checksum(b)
+
+    def test_checksums_stored(self, mock_catalog, add_holding, make_path_details):
+        add_holding(
+            "label-1",
+            filelist=[
+                make_path_details("/a", checksum="x"),
+                make_path_details("/b", checksum="x"),
+            ],
+        )
+        add_holding("label-2", filelist=[make_path_details("/c", checksum=None)])
+        # identical contents share a checksum
+        assert mock_catalog.session.query(Checksum).count() == 2
+
+    def test_find_duplicate_objects(self, mock_catalog, add_holding, make_path_details):
+        add_holding(
+            "label-1",
+            filelist=[
+                make_path_details("/a", checksum="x"),
+                make_path_details("/b", checksum="y"),
+            ],
+        )
+        add_holding(
+            "label-2",
+            filelist=[make_path_details("/c", checksum="z")],
+            storage_type=None,
+        )
+        add_holding(
+            "label-3", filelist=[make_path_details("/d", checksum="w")], group="other"
+        )
+        duplicates = mock_catalog.find_duplicate_objects(
+            GROUP,
+            TENANCY,
+            [
+                make_path_details("/new/a", checksum="x"),
+                # same checksum, different size
+                make_path_details("/new/b", checksum="y", size=11),
+                # not uploaded yet
+                make_path_details("/new/c", checksum="z"),
+                # in another group
+                make_path_details("/new/d", checksum="w"),
+                make_path_details("/new/e", checksum=None),
+            ],
+        )
+        assert duplicates == {"/new/a": ("http", TENANCY, "bucket", "/a")}
+        assert (
+            mock_catalog.find_duplicate_objects(
+                GROUP, "other-tenancy", [make_path_details("/new/a", checksum="x")]
+            )
+            == {}
+        )
+
+    def test_shared_object(self, mock_catalog, add_holding, make_path_details):
+        obj = ("http", TENANCY, "bucket", "/a")
+        add_holding("label-1", filelist=[make_path_details("/a", checksum="x")])
+        # the Location of the deduplicated file points at the original object
+        add_holding("label-2", filelist=[make_path_details("/a", checksum="x")])
+        # deleting the original file leaves the object, found via the other file
+        mock_catalog.delete_files(USER, GROUP, holding_label="label-1", path="/a")
+        mock_catalog.commit()
+        new = make_path_details("/new/a", checksum="x")
+        assert mock_catalog.find_duplicate_objects(GROUP, TENANCY, [new]) == {
+            "/new/a": obj
+        }
+
+    def test_create_checksums(self, mock_catalog, add_holding, make_path_details):
+        add_holding("label-1", filelist=[make_path_details("/a", checksum="x")])
+        file_id = mock_catalog.session.query(File.id).scalar()
+        mock_catalog.create_checksums(
+            [
+                {"file_id": file_id, "checksum": "0000abcd", "algorithm": "adler32"},
+                # replaces the fingerprint from indexing
+                {"file_id": file_id, "checksum": "y", "algorithm": "blake2b"},
+            ]
+        )
+        mock_catalog.commit()
+        assert mock_catalog.session.query(Checksum).count() == 2
+        # the checksums are loaded with the files, and carried in the PathDetails
+        result = mock_catalog.get_files(USER, GROUP, holding_label="label-1")
+        pd = PathDetails.from_filemodel(result[0].File)
+        assert (pd.checksum, pd.checksum_algorithm) == ("0000abcd", "adler32")
@@ -0,0 +1,154 @@
+# encoding: utf-8
+"""
+test_directory.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+from sqlalchemy import select
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_models import (
+    Directory,
+    File,
+    Location,
+    Storage,
+    directory_ancestors,
+    split_path,
+)
+from nlds.details import PathDetails
+
+USER = "test-user"
+GROUP = "test-group"
+PATHS = [
+    "/gws/x/y/a.nc",
+    "/gws/x/y/z/b.nc",
+    "/gws/x/y/z/c.txt",
+    "/gws/x/yz/d.nc",
+    "/gws/X/y/e.nc",
+    "/gws/f.nc",
+]
+
+
+@pytest.fixture(autouse=True)
+def add_paths(add_holding, make_path_details):
+    add_holding(
+        "test-label",
+        filelist=[make_path_details(p, size=1) for p in PATHS],
+        storage_type=None,
+    )
+
+
+def find(catalog, pattern):
+    files = catalog.get_files(
+        USER, GROUP, filelist=[PathDetails(original_path=pattern)], regex=True
+    )
+    if files is None:
+        return []
+    return sorted(r.File.original_path for r in files)
+
+
+class TestDirectory:
+
+    def test_directory_ancestors(self):
+        assert directory_ancestors("/a/b/") == ["/", "/a/", "/a/b/"]
+        assert directory_ancestors("/") == ["/"]
+        assert directory_ancestors("a/") == ["", "a/"]
+
+    def test_split_path(self):
+        # the original path is always the directory + the basename
+        for path in ["/a/b/c.nc", "/c.nc", "c.nc", "/a//b", "/a/b/", "a/b"]:
+            directory, basename = split_path(path)
+            assert directory + basename == path
+        assert split_path("/a/b/c.nc") == ("/a/b/", "c.nc")
+
+    def test_create_files(self, mock_catalog):
+        f = mock_catalog.session.query(File).filter(File.basename == "b.nc").one()
+        directory = mock_catalog.session.get(Directory, f.directory_id)
+        assert directory.path == "/gws/x/y/z/"
+        # the parents are created too, and shared
+        parent = mock_catalog.session.get(Directory, directory.parent_id)
+        assert parent.path == "/gws/x/y/"
+        assert mock_catalog.session.query(Directory).count() == 8
+
+    def test_create_file(self, mock_catalog, monkeypatch):
+        holding = mock_catalog.get_holding(USER, GROUP, label="test-label")
+        transaction = mock_catalog.create_transaction(holding, "create-file")
+        # the directories of a batch of files are got once, not for every file
+        directory_ids = mock_catalog.get_directory_ids(["/gws/new/"])
+        calls = []
+        monkeypatch.setattr(mock_catalog, "get_directory_ids", calls.append)
+        for i in range(3):
+            mock_catalog.session.add(
+                mock_catalog.create_file(
+                    transaction,
+                    original_path=f"/gws/new/file_{i}",
+                    size=1,
+                    directory_ids=directory_ids,
+                )
+            )
+        mock_catalog.commit()
+        assert calls == []
+        f = mock_catalog.get_file(holding.id, "/gws/new/file_1")
+        assert f.original_path == "/gws/new/file_1"
+
+    def test_original_path_not_stored(self, mock_catalog):
+        assert "original_path" not in File.__table__.c
+        f = mock_catalog.get_file(
+            mock_catalog.get_holding(USER, GROUP, label="test-label").id,
+            "/gws/x/y/z/b.nc",
+        )
+        assert f.original_path == "/gws/x/y/z/b.nc"
+        # a Location at the original path of its file does not store the path
+        mock_catalog.create_locations(
+            [
+                mock_catalog.create_location(
+                    f,
+                    Storage.OBJECT_STORAGE,
+                    "http",
+                    "tenancy",
+                    "bucket",
+                    f.original_path,
+                    None,
+                ),
+                mock_catalog.create_location(
+                    f, Storage.TAPE, "root", "tape", "tarfile", "/other/b.nc", None
+                ),
+            ]
+        )
+        mock_catalog.commit()
+        rows = mock_catalog.session.execute(
+            select(Location.storage_type, Location.stored_path, Location.path)
+        ).all()
+        assert {r[0]: tuple(r[1:]) for r in rows} == {
+            Storage.OBJECT_STORAGE: (None, "/gws/x/y/z/b.nc"),
+            Storage.TAPE: ("/other/b.nc", "/other/b.nc"),
+        }
+        mock_catalog.session.expire_all()
+        locations = {l.storage_type: l.path for l in f.locations}
+        assert locations == {
+            Storage.OBJECT_STORAGE: "/gws/x/y/z/b.nc",
+            Storage.TAPE: "/other/b.nc",
+        }
+
+    def test_regex_directory(self):
+        assert Catalog._regex_directory("^/gws/x/y/.*") == "/gws/x/y/"
+        assert Catalog._regex_directory("^/gws/x/y/z.*\\.nc$") == "/gws/x/y/"
+        assert Catalog._regex_directory("^/gws/x/y?") == "/gws/x/"
+        # not anchored or alternatives
+        assert Catalog._regex_directory("/gws/x/y/.*") is None
+        assert Catalog._regex_directory("^/gws/x/.*|^/gws/y/.*") is None
+        assert Catalog._regex_directory("^/gws") is None
+
+    def test_subtree_query(self, mock_catalog):
+        assert find(mock_catalog, "^/gws/x/y/.*") == PATHS[0:3]
+        assert find(mock_catalog, "^/gws/x/y/.*\\.nc$") == PATHS[0:2]
+        assert find(mock_catalog, "^/gws/x/y.*") == PATHS[0:4]
+        assert find(mock_catalog, "^/gws/X/.*") == [PATHS[4]]
+        # unanchored regexes still match anywhere in the path
+        assert find(mock_catalog, "y/z/") == PATHS[1:3]
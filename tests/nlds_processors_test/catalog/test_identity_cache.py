@@ -0,0 +1,84 @@
+# encoding: utf-8
+"""
+test_identity_cache.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+USER = "test-user"
+GROUP = "test-group"
+
+
+@pytest.fixture()
+def catalog_options():
+    return {"identity_cache_size": 16}
+
+
+def cache_holding(catalog, label):
+    holding = catalog.create_holding(USER, GROUP, label)
+    transaction = catalog.create_transaction(holding, f"{label}-transaction")
+    catalog.cache_identity(holding, transaction)
+    return holding, transaction
+
+
+class TestIdentityCache:
+
+    def test_cached_holding(self, mock_catalog):
+        holding, transaction = cache_holding(mock_catalog, "label-1")
+        mock_catalog.commit()
+        h, t = mock_catalog.get_cached_holding(
+            USER, GROUP, transaction_id="label-1-transaction"
+        )
+        assert (h.id, t.id) == (holding.id, transaction.id)
+        h, t = mock_catalog.get_cached_holding(USER, GROUP, label="label-1")
+        assert h.id == holding.id and t is None
+        # another group does not have permission, so must use get_holding
+        assert mock_catalog.get_cached_holding(
+            USER, "other-group", transaction_id="label-1-transaction"
+        ) == (None, None)
+        assert mock_catalog.identity_cache.hits == 3
+
+    def test_rollback_discards_identity(self, mock_catalog):
+        cache_holding(mock_catalog, "label-1")
+        mock_catalog.session.rollback()
+        assert len(mock_catalog.identity_cache) == 0
+
+    def test_relabel_invalidates_identity(self, mock_catalog):
+        holding, _ = cache_holding(mock_catalog, "label-1")
+        mock_catalog.commit()
+        mock_catalog.modify_holding(holding, new_label="label-2")
+        mock_catalog.commit()
+        assert mock_catalog.get_cached_holding(USER, GROUP, label="label-1") == (
+            None,
+            None,
+        )
+        assert len(mock_catalog.identity_cache) == 0
+
+    def test_delete_invalidates_identity(self, mock_catalog, make_path_details):
+        holding, transaction = cache_holding(mock_catalog, "label-1")
+        mock_catalog.create_files(transaction, [make_path_details("/a/file")])
+        mock_catalog.commit()
+        mock_catalog.delete_files(USER, GROUP, holding_label="label-1", path="/a/file")
+        mock_catalog.commit()
+        assert len(mock_catalog.identity_cache) == 0
+        assert mock_catalog.get_cached_holding(
+            USER, GROUP, transaction_id="label-1-transaction"
+        ) == (None, None)
+
+    def test_stale_identity(self, mock_catalog):
+        # an identity that no longer matches the database is discarded
+        holding, _ = cache_holding(mock_catalog, "label-1")
+        mock_catalog.commit()
+        holding.label = "changed-elsewhere"
+        mock_catalog.commit()
+        assert mock_catalog.get_cached_holding(USER, GROUP, label="label-1") == (
+            None,
+            None,
+        )
+        assert ("label", USER, GROUP, "label-1") not in mock_catalog.identity_cache
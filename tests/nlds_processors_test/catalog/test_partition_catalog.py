@@ -0,0 +1,51 @@
+# encoding: utf-8
+"""
+test_partition_catalog.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+from nlds_processors.catalog.catalog import CatalogError
+from nlds_processors.catalog.catalog_models import Location
+from nlds_processors.catalog.partition_catalog import (
+    create_partition_sql,
+    create_partitions,
+    partition_ranges,
+)
+
+
+class TestPartitionCatalog:
+
+    def test_partition_ranges(self):
+        # no partitions yet, the newest holding is in the first partition
+        assert partition_ranges(0, 5, 10, 1) == [(0, 10), (10, 20)]
+        # enough partitions already
+        assert partition_ranges(20, 5, 10, 1) == []
+        # the newest holding has reached the last partition
+        assert partition_ranges(20, 12, 10, 1) == [(20, 30)]
+        with pytest.raises(CatalogError):
+            partition_ranges(0, 5, 0, 1)
+
+    def test_create_partition_sql(self):
+        assert create_partition_sql("file", 100, 200) == (
+            "CREATE TABLE IF NOT EXISTS file_p100 PARTITION OF file "
+            "FOR VALUES FROM (100) TO (200)"
+        )
+
+    def test_not_postgresql(self, mock_catalog):
+        with pytest.raises(CatalogError):
+            create_partitions(mock_catalog.session.connection(), "file")
+
+    def test_location_holding_id(self, mock_catalog, add_holding):
+        # the partition key of the location table is copied from the file
+        holding, files = add_holding("label-1", 1, size=10)
+        location = mock_catalog.session.query(Location).one()
+        assert location.holding_id == holding.id
+        assert files[0].locations == [location]
+        assert len(mock_catalog.get_unarchived_files(holding).all()) == 1
@@ -0,0 +1,61 @@
+# encoding: utf-8
+"""
+test_tag_search.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+from nlds_processors.catalog.catalog import CatalogError
+
+USER = "test-user"
+GROUP = "test-group"
+
+
+@pytest.fixture(autouse=True)
+def add_tags(mock_catalog, add_holding):
+    tags = {
+        "label-1": {"project": "cmip6", "model": "ukesm"},
+        "label-2": {"project": "cmip6", "model": "hadgem"},
+        "label-3": {"project": "cordex", "model": "ukesm"},
+        "label-4": {"project": "cmip6"},
+    }
+    for label, holding_tags in tags.items():
+        holding, _ = add_holding(label)
+        for key, value in holding_tags.items():
+            mock_catalog.create_tag(holding, key, value)
+    mock_catalog.commit()
+
+
+def search(catalog, tag):
+    return sorted(h.label for h in catalog.get_holdings(USER, GROUP, tag=tag))
+
+
+class TestTagSearch:
+
+    def test_single_tag(self, mock_catalog):
+        assert search(mock_catalog, {"project": "cmip6"}) == [
+            "label-1",
+            "label-2",
+            "label-4",
+        ]
+        assert search(mock_catalog, {"model": "ukesm"}) == ["label-1", "label-3"]
+
+    def test_multiple_tags(self, mock_catalog):
+        assert search(mock_catalog, {"project": "cmip6", "model": "ukesm"}) == [
+            "label-1"
+        ]
+        assert search(mock_catalog, {"project": "cordex", "model": "ukesm"}) == [
+            "label-3"
+        ]
+
+    def test_no_match(self, mock_catalog):
+        with pytest.raises(CatalogError):
+            search(mock_catalog, {"project": "cordex", "model": "hadgem"})
+        with pytest.raises(CatalogError):
+            search(mock_catalog, {"experiment": "historical"})
@@ -0,0 +1,140 @@
+# encoding: utf-8
+"""
+test_usage.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from nlds_processors.catalog.catalog import Catalog
+from nlds_processors.catalog.catalog_models import Holding, Storage
+
+USER = "test-user"
+
+
+def get_usage(catalog, holding):
+    catalog.session.refresh(holding)
+    return holding.get_usage()
+
+
+class TestUsage:
+
+    def test_put_and_archive(self, mock_catalog, add_files):
+        holding = mock_catalog.create_holding(USER, "group-1", "label-1")
+        files = add_files(holding, "t1", 3, size=100)
+        mock_catalog.commit()
+        usage = get_usage(mock_catalog, holding)
+        assert usage["file_count"] == 3
+        assert usage["total_size"] == 300
+        assert usage["object_store_size"] == 300
+        assert usage["tape_size"] == 0
+        assert usage["last_ingest_time"] is not None
+        # archive two of the files
+        mock_catalog.create_locations(
+            [
+                mock_catalog.create_location(
+                    f, Storage.TAPE, "", "", "", f.original_path, datetime.now()
+                )
+                for f in files[:2]
+            ]
+        )
+        mock_catalog.commit()
+        assert get_usage(mock_catalog, holding)["tape_size"] == 200
+        # and remove one of them from object storage
+        mock_catalog.delete_location(files[0], Storage.OBJECT_STORAGE)
+        mock_catalog.commit()
+        assert get_usage(mock_catalog, holding)["object_store_size"] == 200
+
+    def test_modify_storage_type(self, mock_catalog, add_files):
+        holding = mock_catalog.create_holding(USER, "group-1", "label-1")
+        files = add_files(holding, "t1", 4, size=100)
+        mock_catalog.commit()
+        # move one location to tape on its own, and two more in bulk
+        location = mock_catalog.get_location(files[0], Storage.OBJECT_STORAGE)
+        mock_catalog.modify_location(
+            location,
+            "",
+            "",
+            "",
+            files[0].original_path,
+            datetime.now(),
+            storage_type=Storage.TAPE,
+        )
+        mock_catalog.update_locations(
+            Storage.OBJECT_STORAGE,
+            [
+                {"file_id": f.id, "storage_type": Storage.TAPE, "root": "tarfile"}
+                for f in files[1:3]
+            ],
+        )
+        mock_catalog.commit()
+        usage = get_usage(mock_catalog, holding)
+        assert usage["object_store_size"] == 100
+        assert usage["tape_size"] == 300
+        group_usage = mock_catalog.get_group_usage("group-1")
+        mock_catalog.session.refresh(group_usage)
+        assert group_usage.object_store_size == 100
+        assert group_usage.tape_size == 300
+        # the aggregates agree with a reconcile
+        mock_catalog.reconcile_usage()
+        mock_catalog.commit()
+        reconciled = get_usage(mock_catalog, holding)
+        for field in Catalog.USAGE_FIELDS:
+            assert reconciled[field] == usage[field]
+
+    def test_group_usage(self, mock_catalog, add_files):
+        h1 = mock_catalog.create_holding(USER, "group-1", "label-1")
+        h2 = mock_catalog.create_holding(USER, "group-1", "label-2")
+        h3 = mock_catalog.create_holding(USER, "group-2", "label-3")
+        add_files(h1, "t1", 2)
+        add_files(h2, "t2", 3)
+        add_files(h3, "t3", 1)
+        mock_catalog.commit()
+        assert mock_catalog.get_group_usage("group-1").file_count == 5
+        assert mock_catalog.get_group_usage("group-2").file_count == 1
+        assert mock_catalog.get_group_usage("group-3") is None
+        # deleting the files of a holding takes them out of the group totals
+        mock_catalog.delete_files(USER, "group-1", holding_label="label-2")
+        mock_catalog.commit()
+        group_usage = mock_catalog.get_group_usage("group-1")
+        mock_catalog.session.refresh(group_usage)
+        assert group_usage.file_count == 2
+        assert group_usage.total_size == 2048
+        assert group_usage.object_store_size == 2048
+
+    def test_rollback_discards(self, mock_catalog, add_files):
+        holding = mock_catalog.create_holding(USER, "group-1", "label-1")
+        mock_catalog.commit()
+        add_files(holding, "t1", 3)
+        mock_catalog.session.rollback()
+        mock_catalog.commit()
+        assert get_usage(mock_catalog, holding)["file_count"] == 0
+        assert mock_catalog.get_group_usage("group-1") is None
+
+    def test_reconcile(self, mock_catalog, add_files):
+        holding = mock_catalog.create_holding(USER, "group-1", "label-1")
+        add_files(holding, "t1", 4, size=10)
+        mock_catalog.commit()
+        # make the aggregates drift
+        mock_catalog.session.execute(
+            update(Holding).values(file_count=100, tape_size=5)
+        )
+        mock_catalog.commit()
+        mock_catalog.reconcile_usage()
+        mock_catalog.commit()
+        usage = get_usage(mock_catalog, holding)
+        assert usage["file_count"] == 4
+        assert usage["total_size"] == 40
+        assert usage["object_store_size"] == 40
+        assert usage["tape_size"] == 0
+        group_usage = mock_catalog.get_group_usage("group-1")
+        mock_catalog.session.refresh(group_usage)
+        assert group_usage.file_count == 4
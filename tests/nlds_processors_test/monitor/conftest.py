@@ -0,0 +1,25 @@
+# encoding: utf-8
+"""
+conftest.py
+Fixtures shared by the monitor tests: an in-memory SQLite monitor.
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+from nlds_processors.monitor.monitor import Monitor
+
+
+@pytest.fixture()
+def mock_monitor():
+    db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+    monitor = Monitor("sqlite", db_options)
+    monitor.connect()
+    monitor.start_session()
+    yield monitor
+    monitor.end_session()
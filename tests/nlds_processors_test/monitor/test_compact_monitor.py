@@ -0,0 +1,95 @@
+# encoding: utf-8
+"""
+test_compact_monitor.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from datetime import datetime, timedelta
+import gzip
+import json
+
+import pytest
+
+from nlds.rabbit.consumer import State
+from nlds.details import PathDetails
+from nlds_processors.monitor.monitor_models import (
+    FailedFile,
+    SubRecord,
+    TransactionRecord,
+    Warning,
+)
+
+
+def add_transaction(monitor, transaction_id, state, age_days):
+    trec = monitor.create_transaction_record(
+        "user", "group", transaction_id, None, "put"
+    )
+    trec.creation_time = datetime.now() - timedelta(days=age_days)
+    monitor.commit()
+    srec = monitor.create_sub_record(trec, f"{transaction_id}-sub", state)
+    monitor.session.flush()
+    if state == State.FAILED:
+        monitor.create_failed_files(
+            srec, [PathDetails(original_path="/file", failure_reason="reason")]
+        )
+    monitor.create_warning(trec, "a warning")
+    monitor.commit()
+    return trec.id
+
+
+class TestCompactMonitor:
+
+    def test_compact(self, mock_monitor, tmp_path):
+        ids = [
+            add_transaction(mock_monitor, "old-complete", State.COMPLETE, 40),
+            add_transaction(mock_monitor, "old-failed", State.FAILED, 40),
+            add_transaction(mock_monitor, "old-running", State.ROUTING, 40),
+            add_transaction(mock_monitor, "new-complete", State.COMPLETE, 1),
+        ]
+        older_than = datetime.now() - timedelta(days=30)
+        assert mock_monitor.get_compactable_transaction_records(older_than, 10) == (
+            ids[:2]
+        )
+        export_path = str(tmp_path / "export.jsonl.gz")
+        n = mock_monitor.compact(older_than, batch_size=1, export_path=export_path)
+        assert n == 2
+        # nothing left to compact
+        assert mock_monitor.compact(older_than) == 0
+
+        session = mock_monitor.session
+        assert session.query(TransactionRecord).count() == 4
+        compacted = {
+            tr.transaction_id: tr
+            for tr in session.query(TransactionRecord).filter(
+                TransactionRecord.compacted_time.is_not(None)
+            )
+        }
+        assert sorted(compacted.keys()) == ["old-complete", "old-failed"]
+        # the summary is kept
+        assert compacted["old-failed"].state == State.FAILED
+        assert compacted["old-failed"].failed_count == 1
+        assert sorted(sr.sub_id for sr in session.query(SubRecord)) == [
+            "new-complete-sub",
+            "old-running-sub",
+        ]
+        assert session.query(FailedFile).count() == 0
+        assert session.query(Warning).count() == 2
+
+        with gzip.open(export_path, "rt") as fh:
+            records = [json.loads(line) for line in fh]
+        assert [r["transaction_id"] for r in records] == ["old-complete", "old-failed"]
+        assert records[1]["state"] == "FAILED"
+        assert records[1]["warnings"] == ["a warning"]
+        assert records[1]["sub_records"][0]["failed_files"][0]["filepath"] == "/file"
+
+    def test_compact_max_batches(self, mock_monitor):
+        for i in range(3):
+            add_transaction(mock_monitor, f"old-{i}", State.COMPLETE, 40)
+        older_than = datetime.now() - timedelta(days=30)
+        assert mock_monitor.compact(older_than, batch_size=1, max_batches=2) == 2
+        assert mock_monitor.compact(older_than, batch_size=1, max_batches=2) == 1
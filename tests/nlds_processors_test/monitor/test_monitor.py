@@ -63,10 +63,6 @@ def test_update_sub_record(mock_monitor):
     pass
 
 
-def test_create_failed_file(mock_monitor):
-    pass
-
-
 def test_check_completion(mock_monitor):
     pass
 
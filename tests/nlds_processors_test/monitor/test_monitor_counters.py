@@ -0,0 +1,168 @@
+# encoding: utf-8
+"""
+test_monitor_counters.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import pytest
+
+from nlds.rabbit.consumer import State
+from nlds.details import PathDetails
+from nlds_processors.monitor.monitor import MonitorError
+from nlds_processors.monitor.monitor_models import SubRecord, TransactionRecord
+
+
+def counts(monitor, trec):
+    return (
+        monitor.session.execute(
+            TransactionRecord.__table__.select().where(TransactionRecord.id == trec.id)
+        )
+        .one()
+        ._mapping
+    )
+
+
+class TestMonitorCounters:
+
+    def test_counters(self, mock_monitor):
+        trec = mock_monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, "put"
+        )
+        mock_monitor.commit()
+        srecs = [
+            mock_monitor.create_sub_record(trec, f"sub-{i}", State.ROUTING)
+            for i in range(3)
+        ]
+        c = counts(mock_monitor, trec)
+        assert (c["total_count"], c["finished_count"], c["failed_count"]) == (3, 0, 0)
+
+        mock_monitor.update_sub_record(srecs[0], State.FAILED)
+        mock_monitor.update_sub_record(srecs[1], State.COMPLETE)
+        # updating to the same state does not count twice
+        mock_monitor.update_sub_record(srecs[1], State.COMPLETE)
+        c = counts(mock_monitor, trec)
+        assert (c["total_count"], c["finished_count"], c["failed_count"]) == (3, 2, 1)
+        # not all finished, nothing changes
+        mock_monitor.check_completion(trec)
+        assert srecs[2].state == State.ROUTING
+
+        mock_monitor.update_sub_record(srecs[2], State.COMPLETE)
+        mock_monitor.check_completion(trec)
+        mock_monitor.commit()
+        states = [
+            sr.state
+            for sr in mock_monitor.session.query(SubRecord).order_by(SubRecord.id)
+        ]
+        assert states == [State.FAILED, State.COMPLETE, State.COMPLETE]
+
+    def test_check_completion_no_sub_records(self, mock_monitor):
+        trec = mock_monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, "put"
+        )
+        mock_monitor.commit()
+        with pytest.raises(MonitorError):
+            mock_monitor.check_completion(trec)
+
+    def test_state(self, mock_monitor):
+        trec = mock_monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, "put"
+        )
+        mock_monitor.commit()
+        assert counts(mock_monitor, trec)["state"] is None
+        srecs = [
+            mock_monitor.create_sub_record(trec, f"sub-{i}", State.SPLITTING)
+            for i in range(2)
+        ]
+        assert counts(mock_monitor, trec)["state"] == State.SPLITTING
+        mock_monitor.create_sub_record(trec, "sub-2", State.ROUTING)
+        assert counts(mock_monitor, trec)["state"] == State.ROUTING
+        mock_monitor.update_sub_record(srecs[0], State.TRANSFER_PUTTING)
+        assert counts(mock_monitor, trec)["state"] == State.ROUTING
+        mock_monitor.update_sub_record(srecs[1], State.CATALOG_PUTTING)
+        mock_monitor.update_sub_record(trec.sub_records[2], State.TRANSFER_PUTTING)
+        # the least advanced sub record has moved on
+        assert counts(mock_monitor, trec)["state"] == State.CATALOG_PUTTING
+        for srec in trec.sub_records:
+            mock_monitor.update_sub_record(srec, State.COMPLETE)
+        assert counts(mock_monitor, trec)["state"] == State.COMPLETE
+        mock_monitor.create_warning(trec, "a warning")
+        assert counts(mock_monitor, trec)["state"] == State.COMPLETE_WITH_WARNINGS
+        mock_monitor.update_sub_record(srecs[0], State.FAILED)
+        mock_monitor.check_completion(trec)
+        assert counts(mock_monitor, trec)["state"] == State.COMPLETE_WITH_ERRORS
+        mock_monitor.commit()
+        assert trec.get_state() == State.COMPLETE_WITH_ERRORS
+
+    def test_state_searching(self, mock_monitor):
+        # the overall state of a transaction that is still SEARCHING is None, both
+        # stored and from get_state (the back-fill uses overall_state too)
+        assert TransactionRecord.overall_state(State.SEARCHING, 0, False) is None
+        trec = mock_monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, "put"
+        )
+        mock_monitor.commit()
+        for i in range(2):
+            mock_monitor.create_sub_record(trec, f"sub-{i}", State.SEARCHING)
+        mock_monitor.commit()
+        assert counts(mock_monitor, trec)["state"] is None
+        assert trec.get_state() is None
+        srec = mock_monitor.create_sub_record(trec, "sub-2", State.ROUTING)
+        mock_monitor.commit()
+        assert counts(mock_monitor, trec)["state"] == State.ROUTING
+        assert trec.get_state() == State.ROUTING
+        # the least advanced sub record moves on to SEARCHING
+        mock_monitor.update_sub_record(srec, State.SEARCHING)
+        mock_monitor.commit()
+        assert counts(mock_monitor, trec)["state"] is None
+        assert trec.get_state() is None
+
+    def test_state_filter(self, mock_monitor):
+        for i, state in enumerate((State.ROUTING, State.COMPLETE, State.FAILED)):
+            trec = mock_monitor.create_transaction_record(
+                "user", "group", f"transaction-{i}", None, "put"
+            )
+            mock_monitor.commit()
+            mock_monitor.create_sub_record(trec, f"sub-{i}", state)
+        mock_monitor.commit()
+        trecs = mock_monitor.get_transaction_records(
+            "user", "group", state=[State.COMPLETE, State.FAILED], limit=1
+        )
+        assert [tr.transaction_id for tr in trecs] == ["transaction-1"]
+        with pytest.raises(MonitorError):
+            mock_monitor.get_transaction_records(
+                "user", "group", state=[State.COMPLETE_WITH_ERRORS]
+            )
+
+    def test_create_failed_files(self, mock_monitor):
+        trec = mock_monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, "put"
+        )
+        mock_monitor.commit()
+        srec = mock_monitor.create_sub_record(trec, "sub-0", State.FAILED)
+        mock_monitor.session.flush()
+        filelist = [
+            PathDetails(original_path=f"/file_{i}", failure_reason="reason")
+            for i in range(3)
+        ]
+        filelist.append(PathDetails(original_path="/file_3"))
+        assert mock_monitor.create_failed_files(srec, filelist) == 4
+        # more than the threshold are stored in the compressed blob
+        assert mock_monitor.create_failed_files(srec, filelist, blob_threshold=2) == 4
+        assert mock_monitor.create_failed_files(srec, filelist, blob_threshold=2) == 4
+        mock_monitor.commit()
+        mock_monitor.session.expire_all()
+        srec = mock_monitor.session.query(SubRecord).one()
+        assert len(srec.failed_files) == 4
+        failed_files = srec.get_failed_files()
+        assert len(failed_files) == 12
+        assert [ff["filepath"] for ff in failed_files[4:]] == [
+            pd.original_path for pd in filelist * 2
+        ]
+        assert failed_files[3]["reason"] == ""
+        assert failed_files[4]["reason"] == "reason"
+        assert failed_files[4]["sub_record_id"] == srec.id
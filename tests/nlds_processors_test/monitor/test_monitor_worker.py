@@ -0,0 +1,455 @@
+# encoding: utf-8
+"""
+test_monitor_worker.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import functools
+import json
+
+import pytest
+
+from nlds.rabbit.consumer import State
+from nlds.details import PathDetails
+from nlds_processors.monitor.monitor import Monitor, MonitorError
+from nlds_processors.monitor.monitor_models import MonitorEvent, SubRecord
+from nlds_processors.monitor.monitor_models import TransactionRecord
+from nlds_processors.monitor.monitor_worker import MonitorConsumer
+import nlds.rabbit.message_keys as MSG
+import nlds.rabbit.routing_keys as RK
+
+
+def mock_load_config(template_config):
+    return template_config
+
+
+class MockMethod:
+    def __init__(self, routing_key, delivery_tag):
+        self.routing_key = routing_key
+        self.delivery_tag = delivery_tag
+
+
+class MockConnection:
+    """Runs the thread safe callbacks (i.e. the acks) straight away, and records
+    the timers"""
+
+    def __init__(self):
+        self.timers = {}
+
+    def add_callback_threadsafe(self, cb):
+        cb()
+
+    def call_later(self, delay, cb):
+        self.timers[len(self.timers)] = cb
+        return len(self.timers) - 1
+
+    def remove_timeout(self, timer):
+        del self.timers[timer]
+
+
+class MockChannel:
+    is_open = True
+
+    def __init__(self):
+        self.acked = []
+        self.nacked = []
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag):
+        self.nacked.append(delivery_tag)
+
+
+class MockKeepalive:
+    def start_polling(self):
+        pass
+
+    def stop_polling(self):
+        pass
+
+
+@pytest.fixture()
+def consumer(monkeypatch, template_config, mock_monitor):
+    # Ensure template is loaded instead of .server_config
+    monkeypatch.setattr(
+        "nlds.server_config.load_config",
+        functools.partial(mock_load_config, template_config),
+    )
+    consumer = MonitorConsumer()
+    consumer.monitor = mock_monitor
+    consumer.keepalive = MockKeepalive()
+    consumer.batch_size = 5
+    # the signal handlers can only be set in the main thread
+    monkeypatch.setattr(consumer, "setup_signal_handling", lambda: None)
+    # no rabbit connection to log to
+    monkeypatch.setattr(consumer, "publish_message", lambda *args, **kwargs: None)
+    return consumer
+
+
+def put_message(transaction_id, sub_id, state):
+    details = {
+        MSG.TRANSACT_ID: transaction_id,
+        MSG.USER: "user",
+        MSG.GROUP: "group",
+        MSG.API_ACTION: RK.PUTLIST,
+        MSG.STATE: state.value,
+        MSG.SUB_ID: sub_id,
+        MSG.ROUTE: "->MONITOR_Q",
+    }
+    if sub_id is None:
+        del details[MSG.SUB_ID]
+    return {MSG.DETAILS: details, MSG.DATA: {MSG.FILELIST: []}}
+
+
+def sub_record_states(monitor):
+    return {
+        sr.sub_id: sr.state
+        for sr in monitor.session.query(SubRecord).order_by(SubRecord.id)
+    }
+
+
+class TestMonitorBatch:
+
+    def test_batch(self, consumer, monkeypatch):
+        for transaction_id in ("transaction-1", "transaction-2"):
+            consumer.monitor.create_transaction_record(
+                "user", "group", transaction_id, None, RK.PUTLIST
+            )
+        consumer.monitor.commit()
+
+        # fail the updates of sub-bad, without losing the others in the batch
+        update_sub_record = consumer.monitor.update_sub_record
+
+        def failing_update_sub_record(srec, state):
+            if srec.sub_id == "sub-bad":
+                raise MonitorError("update failed")
+            return update_sub_record(srec, state)
+
+        monkeypatch.setattr(
+            consumer.monitor, "update_sub_record", failing_update_sub_record
+        )
+
+        channel = MockChannel()
+        connection = MockConnection()
+        messages = [
+            put_message("transaction-1", "sub-1", State.ROUTING),
+            put_message("transaction-2", "sub-2", State.ROUTING),
+            put_message("transaction-1", "sub-1", State.COMPLETE),
+            put_message("transaction-1", "sub-bad", State.ROUTING),
+            # no sub_id, can't be parsed
+            put_message("transaction-2", None, State.ROUTING),
+            put_message("transaction-2", "sub-2", State.SPLITTING),
+        ]
+        for tag, body in enumerate(messages):
+            consumer._wrapped_callback(
+                channel,
+                MockMethod(f"nlds-api.{RK.MONITOR_PUT}.{RK.START}", tag),
+                None,
+                json.dumps(body).encode(),
+                connection,
+            )
+            if tag == 0:
+                # the first message starts the timer
+                assert len(connection.timers) == 1
+            if tag < 4:
+                assert channel.acked == []
+
+        # the first five were applied when the batch was full
+        assert sorted(channel.acked) == [0, 1, 2, 3, 4]
+        assert connection.timers == {0: consumer._flush_batch}
+        assert sub_record_states(consumer.monitor) == {
+            "sub-1": State.COMPLETE,
+            "sub-2": State.ROUTING,
+        }
+        # the last is applied when the timer fires
+        connection.timers[0]()
+        assert sorted(channel.acked) == [0, 1, 2, 3, 4, 5]
+        consumer.monitor.session.expire_all()
+        assert sub_record_states(consumer.monitor) == {
+            "sub-1": State.COMPLETE,
+            "sub-2": State.SPLITTING,
+        }
+        trec = (
+            consumer.monitor.session.query(TransactionRecord)
+            .filter(TransactionRecord.transaction_id == "transaction-1")
+            .one()
+        )
+        assert trec.state == State.COMPLETE
+
+    def test_batch_requeued(self, consumer, monkeypatch):
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, RK.PUTLIST
+        )
+        consumer.monitor.commit()
+
+        # the transaction record of transaction-2 can't be found, without waiting
+        # for the retries
+        def get_transaction_record(user, group, idd, transaction_id, **kwargs):
+            if transaction_id == "transaction-2":
+                raise MonitorError("not found")
+            return consumer.monitor.get_transaction_record(
+                user, group, idd, transaction_id, **kwargs
+            )
+
+        monkeypatch.setattr(
+            consumer, "_get_transaction_record_with_retry", get_transaction_record
+        )
+
+        channel = MockChannel()
+        connection = MockConnection()
+        messages = [
+            put_message("transaction-1", "sub-1", State.ROUTING),
+            put_message("transaction-2", "sub-2", State.ROUTING),
+            put_message("transaction-1", "sub-1", State.SPLITTING),
+            put_message("transaction-2", "sub-2", State.SPLITTING),
+            put_message("transaction-1", "sub-1", State.COMPLETE),
+        ]
+        for tag, body in enumerate(messages):
+            consumer._wrapped_callback(
+                channel,
+                MockMethod(f"nlds-api.{RK.MONITOR_PUT}.{RK.START}", tag),
+                None,
+                json.dumps(body).encode(),
+                connection,
+            )
+
+        # the updates of transaction-2 are requeued, not acknowledged
+        assert sorted(channel.acked) == [0, 2, 4]
+        assert sorted(channel.nacked) == [1, 3]
+        assert sub_record_states(consumer.monitor) == {"sub-1": State.COMPLETE}
+
+
+def stat(consumer, monkeypatch, meta=None, details=None):
+    sent = []
+    monkeypatch.setattr(
+        consumer, "publish_message", lambda *args, **kwargs: sent.append(kwargs)
+    )
+    properties = namedtuple("Properties", ["reply_to", "correlation_id"])(
+        "reply", "correlation"
+    )
+    body = {
+        MSG.DETAILS: {MSG.USER: "user", MSG.GROUP: "group", **(details or {})},
+        MSG.DATA: {},
+        MSG.META: meta or {},
+    }
+    consumer._monitor_get(body, properties)
+    return sent[-1]["msg_dict"][MSG.DATA]
+
+
+class TestMonitorLabels:
+
+    def test_labels(self, consumer, monkeypatch):
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, RK.PUTLIST
+        )
+        consumer.monitor.commit()
+        # the holding is assigned by the catalog
+        body = put_message("transaction-1", "sub-1", State.CATALOG_PUTTING)
+        body[MSG.DETAILS][MSG.HOLDING_ID] = 7
+        body[MSG.DETAILS][MSG.LABEL] = "label-1"
+        consumer._monitor_put(body)
+        data = stat(consumer, monkeypatch)
+        assert data[MSG.RECORD_LIST][0][MSG.HOLDING_ID] == 7
+        assert data[MSG.TRANSACTIONS] == {"transaction-1": "label-1"}
+
+        # the holding is relabelled in the catalog
+        consumer._monitor_relabel(
+            {
+                MSG.DETAILS: {
+                    MSG.USER: "user",
+                    MSG.GROUP: "group",
+                    MSG.API_ACTION: RK.META,
+                    MSG.HOLDING_ID: 7,
+                    MSG.LABEL: "label-2",
+                }
+            }
+        )
+        data = stat(consumer, monkeypatch)
+        assert data[MSG.TRANSACTIONS] == {"transaction-1": "label-2"}
+        # a later update, sent before the relabelling, does not overwrite the label
+        body = put_message("transaction-1", "sub-1", State.TRANSFER_PUTTING)
+        body[MSG.DETAILS][MSG.HOLDING_ID] = 7
+        body[MSG.DETAILS][MSG.LABEL] = "label-1"
+        consumer._monitor_put(body)
+        data = stat(consumer, monkeypatch)
+        assert data[MSG.TRANSACTIONS] == {"transaction-1": "label-2"}
+
+        # a legacy record has no label, so the labels come from the catalog
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-2", None, RK.PUTLIST
+        ).label = None
+        consumer.monitor.commit()
+        data = stat(consumer, monkeypatch)
+        assert MSG.TRANSACTIONS not in data
+
+    def test_relabel_before_holding(self, consumer, monkeypatch):
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, RK.PUTLIST
+        )
+        consumer.monitor.commit()
+        # the relabelling arrives before the update that assigns the holding
+        consumer._monitor_relabel(
+            {
+                MSG.DETAILS: {
+                    MSG.USER: "user",
+                    MSG.GROUP: "group",
+                    MSG.API_ACTION: RK.META,
+                    MSG.HOLDING_ID: 7,
+                    MSG.LABEL: "label-2",
+                }
+            }
+        )
+        body = put_message("transaction-1", "sub-1", State.CATALOG_PUTTING)
+        body[MSG.DETAILS][MSG.HOLDING_ID] = 7
+        body[MSG.DETAILS][MSG.LABEL] = "label-1"
+        consumer._monitor_put(body)
+        data = stat(consumer, monkeypatch)
+        assert data[MSG.RECORD_LIST][0][MSG.HOLDING_ID] == 7
+        assert data[MSG.TRANSACTIONS] == {"transaction-1": "label-2"}
+
+
+class TestMonitorPagination:
+
+    def test_pages(self, consumer, monkeypatch):
+        creation_time = datetime(2026, 1, 1)
+        for i in range(5):
+            trec = consumer.monitor.create_transaction_record(
+                "user", "group", f"transaction-{i}", None, RK.PUTLIST
+            )
+            # two records are created at the same time
+            trec.creation_time = creation_time + timedelta(seconds=min(i, 3))
+            consumer.monitor.commit()
+            consumer.monitor.create_sub_record(trec, f"sub-{i}", State.ROUTING)
+            consumer.monitor.commit()
+
+        for descending in (False, True):
+            meta = {MSG.LIMIT: 2, MSG.DESCENDING: descending}
+            pages = []
+            while True:
+                data = stat(consumer, monkeypatch, meta=meta)
+                pages.append([tr["transaction_id"] for tr in data[MSG.RECORD_LIST]])
+                if MSG.NEXT_CURSOR not in data:
+                    break
+                meta[MSG.CURSOR] = data[MSG.NEXT_CURSOR]
+            ids = [f"transaction-{i}" for i in range(5)]
+            if descending:
+                ids.reverse()
+            # the last page is not full, so has no cursor
+            assert pages == [ids[0:2], ids[2:4], ids[4:5]]
+
+        data = stat(consumer, monkeypatch, meta={MSG.SUMMARY: True})
+        record = data[MSG.RECORD_LIST][0]
+        assert "sub_records" not in record
+        assert record["total_count"] == 1
+        assert record["state"] == "ROUTING"
+        # the sub records (and their failed files) of a transaction
+        trec = (
+            consumer.monitor.session.query(TransactionRecord)
+            .filter(TransactionRecord.transaction_id == "transaction-1")
+            .one()
+        )
+        data = stat(consumer, monkeypatch, details={MSG.ID: trec.id})
+        record = data[MSG.RECORD_LIST][0]
+        assert record["sub_records"][0]["failed_files"] == []
+
+    def test_invalid_cursor(self):
+        with pytest.raises(MonitorError):
+            Monitor.decode_cursor("not-a-cursor")
+
+
+class TestMonitorEventLog:
+
+    def test_event_log(self, consumer, monkeypatch):
+        consumer.storage_mode = MonitorConsumer.STORAGE_EVENT_LOG
+        consumer.projection_batch_size = 3
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, RK.PUTLIST
+        )
+        consumer.monitor.commit()
+
+        consumer._monitor_put(put_message("transaction-1", "sub-1", State.ROUTING))
+        body = put_message("transaction-1", "sub-2", State.ROUTING)
+        body[MSG.DETAILS][MSG.WARNING] = ["a warning"]
+        consumer._monitor_put(body)
+        consumer._monitor_put_batch(
+            [
+                put_message("transaction-1", "sub-1", State.COMPLETE),
+                put_message("transaction-1", "sub-2", State.FAILED),
+            ]
+        )
+        body = put_message("transaction-1", "sub-2", State.FAILED)
+        # the failed files are kept in the event
+        body[MSG.DATA][MSG.FILELIST] = [
+            PathDetails(original_path="/file", failure_reason="reason").to_json()
+        ]
+        consumer._monitor_put(body)
+        # nothing has been applied to the records yet
+        assert sub_record_states(consumer.monitor) == {}
+        assert consumer.monitor.get_event_backlog()[0] == 5
+
+        # a full batch, in the order the events were appended
+        assert consumer.project_events() == 3
+        consumer.monitor.session.expire_all()
+        assert sub_record_states(consumer.monitor) == {
+            "sub-1": State.COMPLETE,
+            "sub-2": State.ROUTING,
+        }
+        assert consumer.project_events() == 2
+        assert consumer.project_events() == 0
+        assert consumer.monitor.get_event_backlog() == (0, None)
+        consumer.monitor.session.expire_all()
+        assert sub_record_states(consumer.monitor) == {
+            "sub-1": State.COMPLETE,
+            "sub-2": State.FAILED,
+        }
+        trec = consumer.monitor.session.query(TransactionRecord).one()
+        assert trec.state == State.COMPLETE_WITH_ERRORS
+        assert trec.get_warnings() == ["a warning"]
+        srec = trec.sub_records[1]
+        assert [ff["filepath"] for ff in srec.get_failed_files()] == ["/file"]
+
+    def test_event_log_failed_events(self, consumer, monkeypatch):
+        consumer.storage_mode = MonitorConsumer.STORAGE_EVENT_LOG
+        consumer.monitor.create_transaction_record(
+            "user", "group", "transaction-1", None, RK.PUTLIST
+        )
+        consumer.monitor.commit()
+        # the lock of a missing transaction record is not retried by the projection
+        monkeypatch.setattr(
+            consumer,
+            "_get_transaction_record_with_retry",
+            lambda *args, **kwargs: pytest.fail("the lock was retried"),
+        )
+        apply_put = consumer._apply_put
+
+        def _apply_put(trec, put):
+            if put["sub_id"] == "sub-bad":
+                raise MonitorError("cannot apply")
+            return apply_put(trec, put)
+
+        monkeypatch.setattr(consumer, "_apply_put", _apply_put)
+        consumer._monitor_put(put_message("transaction-1", "sub-1", State.ROUTING))
+        consumer._monitor_put(put_message("transaction-1", "sub-bad", State.ROUTING))
+        consumer._monitor_put(put_message("transaction-2", "sub-2", State.ROUTING))
+        assert consumer.project_events() == 3
+        consumer.monitor.session.expire_all()
+        assert sub_record_states(consumer.monitor) == {"sub-1": State.ROUTING}
+        # the failed events are kept with the reason, and not projected again
+        failed = {
+            e.sub_id: e.failure_reason
+            for e in consumer.monitor.session.query(MonitorEvent)
+        }
+        assert failed == {
+            "sub-bad": "The monitoring update failed: cannot apply",
+            "sub-2": "TransactionRecord not found",
+        }
+        assert consumer.monitor.get_event_backlog() == (0, None)
+        assert consumer.project_events() == 0
@@ -9,9 +9,32 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 __license__ = "BSD - see LICENSE file in top-level package directory"
 __contact__ = "neil.massey@stfc.ac.uk"
 
+import gc
+import os
+
 import pytest
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.orm import declarative_base
 
 from nlds_processors.db_mixin import DBMixin, DBError
+from nlds_processors.catalog.catalog import Catalog, CatalogError
+from nlds_processors.catalog.catalog_models import File, Holding, Location, path_hash
+from nlds.details import PathType, PathDetails
+from nlds.utils.memory import get_rss
+
+# a PostgreSQL database to run the postgresql tests against, as
+# "user:passwd@host/db_name", they are skipped if it is not set
+POSTGRES_DB = os.environ.get("NLDS_TEST_POSTGRES_DB")
+
+CopyBase = declarative_base()
+
+
+class CopyRow(CopyBase):
+    """Table without client-side defaults, so that it can be COPYed into"""
+
+    __tablename__ = "copy_row"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
 
 
 class MockDBMixinInheritor(DBMixin):
@@ -83,3 +106,256 @@ class TestCatalogCreation:
 
         # TODO: Test with a mock SQLAlchemy.Base and see if we can break it in
         # any interesting ways
+
+
+class TestReadEngine:
+
+    def _mock_dbmixin(self, tmp_path, db_read_options=None):
+        db_options = {
+            "db_name": f"/{tmp_path}/write.db",
+            "db_user": "",
+            "db_passwd": "",
+            "echo": False,
+        }
+        mock_dbmixin = MockDBMixinInheritor("sqlite", db_options)
+        mock_dbmixin.base = declarative_base()
+        mock_dbmixin.session = None
+        mock_dbmixin.db_read_options = db_read_options
+        return mock_dbmixin
+
+    def test_read_engine_defaults_to_write_engine(self, tmp_path):
+        mock_dbmixin = self._mock_dbmixin(tmp_path)
+        mock_dbmixin.connect()
+        assert mock_dbmixin.db_read_engine is mock_dbmixin.db_engine
+        mock_dbmixin.start_session()
+        write_session = mock_dbmixin.session
+        with mock_dbmixin.read_session() as session:
+            assert session is write_session
+        assert mock_dbmixin.session is write_session
+
+    def test_read_session_uses_read_engine(self, tmp_path):
+        mock_dbmixin = self._mock_dbmixin(
+            tmp_path, db_read_options={"db_name": f"/{tmp_path}/read.db"}
+        )
+        mock_dbmixin.connect()
+        assert mock_dbmixin.db_read_engine is not mock_dbmixin.db_engine
+        assert str(mock_dbmixin.db_read_engine.url).endswith("read.db")
+        mock_dbmixin.start_session()
+        write_session = mock_dbmixin.session
+        with mock_dbmixin.read_session() as session:
+            assert session is not write_session
+            assert session.get_bind() is mock_dbmixin.db_read_engine
+        # the write session is restored afterwards
+        assert mock_dbmixin.session is write_session
+
+
+class TestSessionLifecycle:
+
+    def _mock_catalog(self, n_files=0):
+        db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+        catalog = Catalog("sqlite", db_options)
+        catalog.connect()
+        catalog.start_session()
+        if n_files > 0:
+            holding = catalog.create_holding("test-user", "test-group", "test-label")
+            transaction = catalog.create_transaction(holding, "test-transaction")
+            directory_ids = catalog.get_directory_ids(["/test/path/"])
+            for i in range(n_files):
+                catalog.session.add(
+                    catalog.create_file(
+                        transaction,
+                        user=100,
+                        group=100,
+                        original_path=f"/test/path/file_{i}",
+                        path_type=PathType.FILE,
+                        size=1024,
+                        file_permissions=0o644,
+                        directory_ids=directory_ids,
+                    )
+                )
+            catalog.commit()
+        return catalog
+
+    def _process_message(self, catalog):
+        # mimic a catalog_get message - load all of the files in the holding
+        files = catalog.get_files("test-user", "test-group", holding_label="test-label")
+        return len(files.all())
+
+    def test_recycle_session_expunges(self):
+        catalog = self._mock_catalog(n_files=10)
+        assert self._process_message(catalog) == 10
+        # keep hold of the results so that the identity map cannot drop them
+        files = catalog.get_files("test-user", "test-group").all()
+        assert catalog.identity_map_size > 0
+        session = catalog.session
+        assert not catalog.recycle_session(recycle_count=2)
+        assert catalog.identity_map_size == 0
+        assert catalog.session is session
+        # the second message recycles the session
+        assert catalog.recycle_session(recycle_count=2)
+        assert catalog.session is not session
+        assert catalog.message_count == 2
+        # and the new session is still usable
+        assert self._process_message(catalog) == 10
+
+    def test_recycle_session_rolls_back(self):
+        catalog = self._mock_catalog()
+        catalog.create_holding("test-user", "test-group", "uncommitted")
+        catalog.recycle_session()
+        with pytest.raises(CatalogError):
+            catalog.get_holding("test-user", "test-group", label="uncommitted")
+
+    def test_soak_rss(self):
+        # the number of messages can be raised (e.g. to 100000) for a longer soak
+        n_messages = int(os.environ.get("NLDS_SOAK_MESSAGES", 500))
+        warmup = max(n_messages // 10, 1)
+        catalog = self._mock_catalog(n_files=200)
+        for i in range(n_messages):
+            self._process_message(catalog)
+            catalog.recycle_session(recycle_count=100)
+            if i == warmup:
+                gc.collect()
+                rss_start = get_rss()
+        gc.collect()
+        # the identity map is empty between messages and the memory is flat
+        assert catalog.identity_map_size == 0
+        assert get_rss() - rss_start < 16 * 1024**2
+
+
+class TestBulkInsert:
+
+    def _mock_catalog(self):
+        db_options = {"db_name": "", "db_user": "", "db_passwd": "", "echo": False}
+        catalog = Catalog("sqlite", db_options)
+        catalog.connect()
+        catalog.start_session()
+        holding = catalog.create_holding("test-user", "test-group", "test-label")
+        transaction = catalog.create_transaction(holding, "test-transaction")
+        return catalog, transaction
+
+    def _files(self, catalog, transaction, n_files):
+        directory_ids = catalog.get_directory_ids(["/test/path/"])
+        return [
+            catalog.create_file(
+                transaction,
+                user=100,
+                group=100,
+                original_path=f"/test/path/file_{i}",
+                path_type=PathType.FILE,
+                size=1024,
+                file_permissions=0o644,
+                directory_ids=directory_ids,
+            )
+            for i in range(n_files)
+        ]
+
+    def test_bulk_insert_objects(self):
+        catalog, transaction = self._mock_catalog()
+        files = self._files(catalog, transaction, 10)
+        catalog.bulk_insert_objects(files)
+        catalog.commit()
+        assert catalog.session.query(File).count() == 10
+        f = catalog.get_file(transaction.holding_id, "/test/path/file_3")
+        assert f.path_type == PathType.FILE
+        assert f.transaction_id == transaction.id
+
+    def test_bulk_insert_returning(self):
+        catalog, transaction = self._mock_catalog()
+        files = self._files(catalog, transaction, 10)
+        catalog.bulk_insert_objects(files, returning=True)
+        catalog.commit()
+        # the ids are returned in the same order as the objects
+        for f in files:
+            assert catalog.session.get(File, f.id).path_hash == f.path_hash
+
+    def test_bulk_insert_error(self):
+        catalog, transaction = self._mock_catalog()
+        with pytest.raises(DBError):
+            catalog.bulk_insert(Location, [{"file_id": 1, "url_scheme": None}])
+
+    def _path_details(self, paths):
+        return [
+            PathDetails(
+                original_path=p,
+                path_type=PathType.FILE,
+                size=1024,
+                user=100,
+                group=100,
+                permissions=0o644,
+            )
+            for p in paths
+        ]
+
+    def test_create_files(self):
+        catalog, transaction = self._mock_catalog()
+        filelist = self._path_details([f"/test/path/file_{i}" for i in range(10)])
+        created = catalog.create_files(transaction, filelist)
+        catalog.commit()
+        assert len(created) == 10
+        file_id = created[path_hash("/test/path/file_4")]
+        f = catalog.session.get(File, file_id)
+        assert f.original_path == "/test/path/file_4"
+        assert f.holding_id == transaction.holding_id
+
+    def test_create_files_skips_existing(self):
+        catalog, transaction = self._mock_catalog()
+        catalog.create_files(
+            transaction, self._path_details([f"/test/path/file_{i}" for i in range(5)])
+        )
+        catalog.commit()
+        # a second transaction in the same holding, overlapping the first
+        transaction2 = catalog.create_transaction(
+            catalog.session.get(Holding, transaction.holding_id), "test-transaction-2"
+        )
+        created = catalog.create_files(
+            transaction2,
+            self._path_details([f"/test/path/file_{i}" for i in range(3, 8)]),
+        )
+        catalog.commit()
+        assert set(created.keys()) == {
+            path_hash(f"/test/path/file_{i}") for i in range(5, 8)
+        }
+        assert catalog.session.query(File).count() == 8
+
+
+@pytest.mark.postgresql
+@pytest.mark.skipif(POSTGRES_DB is None, reason="NLDS_TEST_POSTGRES_DB is not set")
+class TestCopyInsert:
+
+    @pytest.fixture()
+    def mock_dbmixin(self):
+        user_passwd, db_name = POSTGRES_DB.rsplit("@", 1)
+        user, _, passwd = user_passwd.partition(":")
+        db_options = {
+            "db_name": db_name,
+            "db_user": user,
+            "db_passwd": passwd,
+            "echo": False,
+        }
+        mock_dbmixin = MockDBMixinInheritor("postgresql+psycopg", db_options)
+        mock_dbmixin.base = CopyBase
+        mock_dbmixin.session = None
+        mock_dbmixin.connect()
+        mock_dbmixin.start_session()
+        yield mock_dbmixin
+        mock_dbmixin.session.rollback()
+        CopyBase.metadata.drop_all(mock_dbmixin.db_engine)
+        mock_dbmixin.end_session()
+
+    def test_copy_insert(self, mock_dbmixin):
+        rows = [{"id": i, "name": f"row_{i}"} for i in range(10)]
+        assert mock_dbmixin._can_copy(CopyRow.__table__, rows[0].keys())
+        mock_dbmixin.bulk_insert(CopyRow, rows)
+        mock_dbmixin.commit()
+        assert mock_dbmixin.session.query(CopyRow).count() == 10
+
+    def test_copy_insert_error(self, mock_dbmixin):
+        rows = [{"id": 1, "name": "row_1"}, {"id": 1, "name": "duplicate"}]
+        # the UniqueViolation from psycopg is raised as a DBError, as it is for the
+        # executemany INSERT
+        with pytest.raises(DBError):
+            mock_dbmixin.bulk_insert(CopyRow, rows)
+        # and a NOT NULL violation
+        mock_dbmixin.session.rollback()
+        with pytest.raises(DBError):
+            mock_dbmixin.bulk_insert(CopyRow, [{"id": 2, "name": None}])
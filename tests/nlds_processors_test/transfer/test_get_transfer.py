@@ -0,0 +1,232 @@
+# encoding: utf-8
+"""
+test_get_transfer.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import functools
+from pathlib import Path
+import threading
+
+import pytest
+
+from nlds.details import PathDetails, PathType
+from nlds_processors.transfer.get_transfer import GetTransferConsumer
+from nlds_processors.utils.checksum import new_hash
+
+BUCKET = "nlds.test-transaction"
+
+
+class StubResponse:
+    """The response of get_object, streaming the data in chunks, or raising the
+    error after the first chunk"""
+
+    def __init__(self, data, error=None):
+        self.data = data
+        self.error = error
+
+    def stream(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class StubS3Client:
+    """An S3 client holding the objects in memory, keyed on (bucket, object name).
+    An object can be given an error to raise part way through its download."""
+
+    def __init__(self):
+        self.objects = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.bucket_checks = 0
+
+    def bucket_exists(self, bucket_name):
+        with self.lock:
+            self.bucket_checks += 1
+        return bucket_name == BUCKET
+
+    def get_object(self, bucket_name, object_name):
+        key = (bucket_name, object_name)
+        return StubResponse(self.objects[key], self.errors.get(key))
+
+
+def mock_load_config(template_config):
+    return template_config
+
+
+@pytest.fixture()
+def consumer(monkeypatch, template_config):
+    monkeypatch.setattr(
+        "nlds.server_config.load_config",
+        functools.partial(mock_load_config, template_config),
+    )
+    consumer = GetTransferConsumer()
+    consumer.s3_client = StubS3Client()
+    consumer.chunk_size = 4
+    consumer.num_concurrent_transfers = 4
+    consumer.completelist = []
+    consumer.failedlist = []
+    # record the order that the files are downloaded and their permissions changed
+    consumer.events = []
+    monkeypatch.setattr(consumer, "_create_s3_client", lambda **kw: consumer.s3_client)
+    monkeypatch.setattr(
+        consumer,
+        "_get_bucket_name_object_name",
+        lambda pd: (BUCKET, pd.original_path),
+    )
+    monkeypatch.setattr(
+        consumer, "append_and_send", lambda files, pd, **kwargs: files.append(pd)
+    )
+    monkeypatch.setattr(consumer, "log", lambda *args, **kwargs: None)
+    download = consumer._download
+
+    def _download(bucket_name, object_name, download_path, path_details):
+        download(bucket_name, object_name, download_path, path_details)
+        consumer.events.append(("download", path_details.original_path))
+
+    monkeypatch.setattr(consumer, "_download", _download)
+    monkeypatch.setattr(
+        consumer,
+        "_change_permissions",
+        lambda path, pd: consumer.events.append(("permissions", pd.original_path)),
+    )
+    return consumer
+
+
+def add_file(consumer, path, data, checksum=None, error=None):
+    """Add an object to the stub S3 client, and return its PathDetails"""
+    consumer.s3_client.objects[(BUCKET, path)] = data
+    if error is not None:
+        consumer.s3_client.errors[(BUCKET, path)] = error
+    if checksum is None:
+        hash_ = new_hash("blake2b")
+        hash_.update(data)
+        checksum = hash_.hexdigest()
+    return PathDetails(
+        original_path=path,
+        path_type=PathType.FILE,
+        size=len(data),
+        permissions=0o644,
+        checksum=checksum,
+        checksum_algorithm="blake2b",
+    )
+
+
+def transfer_files(consumer, filelist, target_path):
+    consumer._transfer_files(
+        tenancy="tenancy",
+        filelist=filelist,
+        rk_origin="nlds-api",
+        body_json={},
+        access_key="access",
+        secret_key="secret",
+        target_path=target_path,
+    )
+    return (
+        {pd.original_path for pd in consumer.completelist},
+        {pd.original_path: pd.failure_reason for pd in consumer.failedlist},
+    )
+
+
+def part_files(path: Path):
+    return list(path.rglob("*.part.nlds"))
+
+
+def test_download(consumer, tmp_path):
+    filelist = [
+        add_file(consumer, f"/dir_{i % 3}/file_{i}", b"contents %d" % i)
+        for i in range(12)
+    ]
+    complete, failed = transfer_files(consumer, filelist, tmp_path)
+    assert complete == {pd.original_path for pd in filelist}
+    assert failed == {}
+    assert (tmp_path / "dir_1" / "file_4").read_bytes() == b"contents 4"
+    assert part_files(tmp_path) == []
+    # the bucket is only checked once
+    assert consumer.s3_client.bucket_checks == 1
+
+
+def test_stream_error(consumer, tmp_path):
+    filelist = [
+        add_file(consumer, "/good", b"good contents"),
+        add_file(
+            consumer,
+            "/broken",
+            b"broken contents",
+            error=ConnectionResetError("connection reset"),
+        ),
+    ]
+    complete, failed = transfer_files(consumer, filelist, tmp_path)
+    assert complete == {"/good"}
+    assert "connection reset" in failed["/broken"]
+    # the partial download is removed
+    assert not (tmp_path / "broken").exists()
+    assert part_files(tmp_path) == []
+
+
+def test_checksum_mismatch(consumer, tmp_path):
+    filelist = [
+        add_file(consumer, "/good", b"good contents"),
+        add_file(consumer, "/corrupt", b"corrupt contents", checksum="0123abcd"),
+    ]
+    complete, failed = transfer_files(consumer, filelist, tmp_path)
+    assert complete == {"/good"}
+    assert failed["/corrupt"].startswith("Checksum mismatch for /corrupt")
+    assert not (tmp_path / "corrupt").exists()
+    assert part_files(tmp_path) == []
+
+
+def test_parent_dirs_made_once(consumer, tmp_path, monkeypatch):
+    made = []
+    mkdir = Path.mkdir
+    depth = 0
+
+    def record_mkdir(self, *args, **kwargs):
+        # record the calls made by _transfer_files, not the recursive ones made by
+        # mkdir(parents=True)
+        nonlocal depth
+        if depth == 0:
+            made.append(self)
+        depth += 1
+        try:
+            return mkdir(self, *args, **kwargs)
+        finally:
+            depth -= 1
+
+    monkeypatch.setattr(Path, "mkdir", record_mkdir)
+    filelist = [
+        add_file(consumer, f"/a/dir_{i % 3}/file_{i}", b"contents") for i in range(12)
+    ]
+    complete, _ = transfer_files(consumer, filelist, tmp_path)
+    assert len(complete) == 12
+    # each parent directory is made once
+    assert sorted(made) == sorted(tmp_path / "a" / f"dir_{i}" for i in range(3))
+
+
+def test_permissions_after_downloads(consumer, tmp_path):
+    filelist = [
+        add_file(consumer, f"/file_{i}", b"contents %d" % i) for i in range(8)
+    ] + [add_file(consumer, "/missing", b"")]
+    # the object is not in the stub S3 client, so its download fails
+    del consumer.s3_client.objects[(BUCKET, "/missing")]
+    complete, failed = transfer_files(consumer, filelist, tmp_path)
+    assert len(complete) == 8
+    assert failed["/missing"].startswith("Download-time exception occurred")
+    # all the downloads finish before the permissions are changed, and the
+    # permissions of the failed file are not changed
+    kinds = [kind for kind, _ in consumer.events]
+    assert kinds == ["download"] * 8 + ["permissions"] * 8
+    assert {path for kind, path in consumer.events if kind == "permissions"} == complete
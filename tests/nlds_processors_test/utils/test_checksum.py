@@ -0,0 +1,51 @@
+# encoding: utf-8
+"""
+test_checksum.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import hashlib
+import io
+from zlib import adler32
+
+import pytest
+
+from nlds_processors.utils.checksum import (
+    ChecksumFile,
+    checksum_algorithms,
+    file_checksum,
+    new_hash,
+)
+
+DATA = b"0123456789" * 1000
+
+
+@pytest.mark.parametrize("algorithm", checksum_algorithms())
+def test_read_write_checksums_match(algorithm):
+    # the checksum calculated when reading (uploading) a file is the same as the one
+    # calculated when writing (downloading) it
+    reader = ChecksumFile(io.BytesIO(DATA), algorithm)
+    while reader.read(999):
+        pass
+    writer = ChecksumFile(io.BytesIO(), algorithm)
+    for i in range(0, len(DATA), 1234):
+        writer.write(DATA[i : i + 1234])
+    assert reader.checksum == writer.checksum
+    assert writer.f.getvalue() == DATA
+
+
+def test_known_checksums(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(DATA)
+    assert file_checksum(path, "adler32") == f"{adler32(DATA):08x}"
+    assert file_checksum(path, "blake2b") == hashlib.blake2b(DATA).hexdigest()
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        new_hash("md4")
@@ -0,0 +1,82 @@
+# encoding: utf-8
+"""
+test_concurrent_transfers.py
+"""
+
+__author__ = "Neil Massey and Jack Leland"
+__date__ = "18 Oct 2026"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+__license__ = "BSD - see LICENSE file in top-level package directory"
+__contact__ = "neil.massey@stfc.ac.uk"
+
+import threading
+import time
+
+from nlds.details import PathDetails
+from nlds_processors.utils.concurrent_transfers import run_transfers
+
+
+class InFlight:
+    """Records the most transfers, and bytes, in flight at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = self.size = 0
+        self.max_count = self.max_size = 0
+
+    def transfer(self, path_details):
+        with self.lock:
+            self.count += 1
+            self.size += path_details.size
+            self.max_count = max(self.max_count, self.count)
+            self.max_size = max(self.max_size, self.size)
+        time.sleep(0.01)
+        with self.lock:
+            self.count -= 1
+            self.size -= path_details.size
+        if path_details.original_path.endswith("bad"):
+            raise PermissionError("no access")
+
+
+def transfers(in_flight, sizes):
+    for i, size in enumerate(sizes):
+        pd = PathDetails(original_path=f"/file_{i}", size=size)
+        yield pd, in_flight.transfer, (pd,)
+
+
+def test_max_transfers():
+    in_flight = InFlight()
+    results = list(run_transfers(transfers(in_flight, [1] * 20), max_transfers=4))
+    assert sorted(pd.original_path for pd, _ in results) == sorted(
+        f"/file_{i}" for i in range(20)
+    )
+    assert all(error is None for _, error in results)
+    assert 1 < in_flight.max_count <= 4
+
+
+def test_max_in_flight_size():
+    in_flight = InFlight()
+    sizes = [40] * 10 + [500]
+    results = list(
+        run_transfers(
+            transfers(in_flight, sizes), max_transfers=8, max_in_flight_size=100
+        )
+    )
+    assert len(results) == 11
+    # a file bigger than the limit is still transferred, on its own
+    assert in_flight.max_size == 500
+    assert in_flight.max_count == 2
+
+
+def test_errors():
+    in_flight = InFlight()
+    bad = PathDetails(original_path="/file_bad", size=1)
+    good = PathDetails(original_path="/file_good", size=1)
+    results = dict(
+        run_transfers(
+            [(bad, in_flight.transfer, (bad,)), (good, in_flight.transfer, (good,))],
+            max_transfers=2,
+        )
+    )
+    assert isinstance(results[bad], PermissionError)
+    assert results[good] is None